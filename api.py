@@ -0,0 +1,238 @@
+"""预约系统 HTTP 接口（JSON）
+
+与页面（app.py）共用 core.py 中的预约规则和 storage.py 中的存储，可以和 streamlit
+进程同时运行（多进程之间由存储层的文件锁保证一致）：
+
+    uvicorn api:app --port 8000
+
+接口：
+
+    GET    /venues                   场地列表（跳台、时段模板、可预约天数）
+    GET    /availability             可预约日期内各开放时段可预约的跳台
+    POST   /bookings                 预约一个或多个时段（全部成功或全部不预约）
+    DELETE /bookings/{slot_key}      取消预约（管理员）
+    GET    /blocked                  被屏蔽的跳台
+    PUT    /blocked/{classroom}      屏蔽跳台（管理员）
+    DELETE /blocked/{classroom}      启用跳台（管理员）
+    GET    /export                   导出预约记录 CSV / Excel（管理员）
+
+除 /venues 外，所有接口都通过查询参数 venue（场地 id）指定场地，POST /bookings
+也可以在请求体中提供 venue；省略时为第一个场地。
+管理员接口需要在请求头 X-Admin-Password 中提供管理员密码。
+
+本地测试可以在进程内直接调用（需要安装 httpx）：
+
+    from starlette.testclient import TestClient
+    client = TestClient(app)
+    client.get("/availability").json()
+"""
+import datetime
+import hmac
+import tempfile
+from urllib.parse import quote
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from export import EXPORT_FORMATS, xlsx_available, iter_export_rows, iter_csv, write_xlsx, export_file_name
+from core import (
+    ADMIN_PASSWORD, REQUIRED_FIELDS, VENUES, get_venue,
+    get_availability, expand_recurrence, make_slot_key, validate_booking, book_targets,
+)
+
+def error_response(status_code, message, **extra):
+    return JSONResponse({"error": message, **extra}, status_code=status_code)
+
+def is_admin(request):
+    """校验请求头中的管理员密码"""
+    password = request.headers.get("x-admin-password", "")
+    return hmac.compare_digest(password.encode(), ADMIN_PASSWORD.encode())
+
+def request_venue(request, venue_id=None):
+    """请求指定的场地（venue_id 省略时取查询参数 venue），不存在时返回 None"""
+    venue_id = venue_id or request.query_params.get("venue")
+    try:
+        return get_venue(venue_id)
+    except KeyError:
+        return None
+
+def target_to_json(target):
+    date_str, time_slot, classroom = target
+    return {"date": date_str, "time_slot": time_slot, "classroom": classroom}
+
+def require_list(value, item_type):
+    """检查 value 是元素类型为 item_type 的列表，否则抛出 TypeError"""
+    if not isinstance(value, list) or not all(isinstance(item, item_type) and not isinstance(item, bool) for item in value):
+        raise TypeError(f"应为 {item_type.__name__} 列表")
+    return value
+
+def parse_targets(venue, payload):
+    """从请求中取出预约目标：targets 列表，以及可选的按周重复规则 recurrence
+
+    格式不对（如日期不是字符串）时抛出 TypeError。
+    """
+    targets = [(item["date"], item["time_slot"], item["classroom"]) for item in require_list(payload.get("targets", []), dict)]
+    require_list([value for target in targets for value in target], str)
+    recurrence = payload.get("recurrence")
+    if recurrence:
+        targets += expand_recurrence(
+            venue,
+            venue.bookable_dates(),
+            require_list(recurrence.get("weekdays", []), int),
+            require_list(recurrence.get("time_slots", []), str),
+            require_list(recurrence.get("classrooms", []), str),
+        )
+    # 去重并保持顺序
+    return list(dict.fromkeys(targets))
+
+def venue_to_json(venue):
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "classrooms": venue.classrooms,
+        "slot_templates": venue.slot_templates,
+        "weekly_schedule": venue.weekly_schedule,
+        "horizon_days": venue.horizon_days,
+    }
+
+async def list_venues(request):
+    """GET /venues"""
+    return JSONResponse({"venues": [venue_to_json(venue) for venue in VENUES.values()]})
+
+async def availability(request):
+    """GET /availability：各日期各开放时段可预约的跳台"""
+    venue = request_venue(request)
+    if venue is None:
+        return error_response(404, "场地不存在")
+    blocked = await run_in_threadpool(venue.store.load_blocked_classrooms)
+    result = await run_in_threadpool(get_availability, venue, None, blocked)
+    return JSONResponse({
+        "venue": venue.id,
+        "time_slots": venue.time_slots,
+        "classrooms": venue.classrooms,
+        "blocked": blocked,
+        "availability": result,
+    })
+
+async def create_bookings(request):
+    """POST /bookings
+
+    请求体：预约人信息（name、student_id、class、phone、reason），可选的 venue，以及
+    targets: [{"date", "time_slot", "classroom"}] 和/或
+    recurrence: {"weekdays": [0-6], "time_slots": [...], "classrooms": [...]}。
+    """
+    try:
+        payload = await request.json()
+        venue = request_venue(request, payload.get("venue"))
+        if venue is None:
+            return error_response(404, "场地不存在")
+        targets = parse_targets(venue, payload)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return error_response(400, "请求格式错误")
+    info = {field: payload.get(field) for field in REQUIRED_FIELDS}
+    error = await run_in_threadpool(validate_booking, venue, info, targets)
+    if error is not None:
+        return error_response(400, error)
+    taken = await run_in_threadpool(book_targets, venue, info, targets)
+    if taken:
+        return error_response(409, "部分时段已被其他组织预约，本次未预约任何时段", conflicts=[target_to_json(t) for t in taken])
+    return JSONResponse({"venue": venue.id, "booked": [make_slot_key(*target) for target in targets]}, status_code=201)
+
+async def cancel_booking(request):
+    """DELETE /bookings/{slot_key}（管理员）"""
+    if not is_admin(request):
+        return error_response(401, "管理员密码错误")
+    venue = request_venue(request)
+    if venue is None:
+        return error_response(404, "场地不存在")
+    slot_key = request.path_params["slot_key"]
+    bookings = await run_in_threadpool(venue.store.load_bookings)
+    if slot_key not in bookings:
+        return error_response(404, "预约不存在")
+    await run_in_threadpool(venue.store.delete_bookings, [slot_key])
+    return JSONResponse({"cancelled": slot_key})
+
+async def list_blocked(request):
+    """GET /blocked"""
+    venue = request_venue(request)
+    if venue is None:
+        return error_response(404, "场地不存在")
+    return JSONResponse({"blocked": await run_in_threadpool(venue.store.load_blocked_classrooms)})
+
+async def update_blocked(request):
+    """PUT /blocked/{classroom} 屏蔽跳台，DELETE /blocked/{classroom} 启用跳台（管理员）"""
+    if not is_admin(request):
+        return error_response(401, "管理员密码错误")
+    venue = request_venue(request)
+    if venue is None:
+        return error_response(404, "场地不存在")
+    classroom = request.path_params["classroom"]
+    if classroom not in venue.classrooms:
+        return error_response(404, "跳台不存在")
+    blocked = await run_in_threadpool(venue.store.set_classroom_blocked, classroom, request.method == "PUT")
+    return JSONResponse({"blocked": blocked})
+
+def iter_file(file, chunk_size=64 * 1024):
+    """逐块读取文件，读完后关闭"""
+    with file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+async def export_bookings(request):
+    """GET /export（管理员）
+
+    查询参数：start、end（'YYYY-MM-DD'，含两端）、classroom 和 club（可重复）、
+    format（csv 或 xlsx，默认 csv）。包含范围内的历史归档；CSV 边读取边发送。
+    """
+    if not is_admin(request):
+        return error_response(401, "管理员密码错误")
+    venue = request_venue(request)
+    if venue is None:
+        return error_response(404, "场地不存在")
+    params = request.query_params
+    export_format = params.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return error_response(400, "不支持的导出格式")
+    if export_format == "xlsx" and not xlsx_available():
+        return error_response(400, "服务器未安装 openpyxl，无法导出 Excel")
+    # 统一为 'YYYY-MM-DD'：范围按字符串比较 slot_key 中的日期
+    try:
+        start_date, end_date = (
+            datetime.date.fromisoformat(value).isoformat() if value else None
+            for value in (params.get("start"), params.get("end"))
+        )
+    except ValueError:
+        return error_response(400, "日期格式错误，应为 YYYY-MM-DD")
+    rows = iter_export_rows(venue, start_date, end_date, params.getlist("classroom"), params.getlist("club"))
+    
+    if export_format == "csv":
+        body = iter_csv(rows)
+    else:
+        # xlsx 是 zip 格式，需要写完整个文件后才能发送：先写入临时文件（超过 8MB 时落盘）
+        file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        await run_in_threadpool(write_xlsx, rows, file)
+        file.seek(0)
+        body = iter_file(file)
+    file_name = export_file_name(venue.id, start_date, end_date, export_format)
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[export_format][0], headers={
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(file_name)}",
+    })
+
+app = Starlette(routes=[
+    Route("/venues", list_venues, methods=["GET"]),
+    Route("/availability", availability, methods=["GET"]),
+    Route("/bookings", create_bookings, methods=["POST"]),
+    Route("/bookings/{slot_key}", cancel_booking, methods=["DELETE"]),
+    Route("/blocked", list_blocked, methods=["GET"]),
+    Route("/blocked/{classroom}", update_blocked, methods=["PUT", "DELETE"]),
+    Route("/export", export_bookings, methods=["GET"]),
+])
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,9 +1,17 @@
 import streamlit as st
-import pandas as pd
 import datetime
-from datetime import timedelta
-import json
-import os
+import functools
+
+import metrics
+from storage import parse_slot_key
+from export import EXPORT_FORMATS, xlsx_available, iter_export_rows, write_export, export_file_name
+from core import (
+    ADMIN_PASSWORD, WEEKDAY_NAMES, REQUIRED_FIELDS, VENUES, get_venue,
+    get_weekday_name, BookingIndex,
+    get_available_classrooms, is_slot_fully_booked, get_available_classrooms_for_booking,
+    expand_recurrence, find_unavailable_targets, format_target, validate_booking, book_targets,
+    compute_schedule_grid, slot_time_range, find_free_slots,
+)
 
 # 设置页面配置
 st.set_page_config(
@@ -13,204 +21,348 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 数据文件路径
-DATA_FILE = "bookings.json"
-
-# 管理员密码（在实际部署时应该使用环境变量或加密存储）
-ADMIN_PASSWORD = "kgw1998"
-
-# 时段定义
-TIME_SLOTS = {
-    "上午第一节": "08:00-10:00",
-    "上午第二节": "10:00-12:00",
-    "下午第一节": "12:00-14:00",
-    "下午第二节": "14:00-16:00",
-    "下午第三节": "16:00-18:00",
-    "晚上第一节": "18:00-20:00",
-    "晚上第二节": "20:00-22:00",
-}
+# 页面片段：各自独立重新运行，操作后只刷新受影响的部分
+SIDEBAR_FRAGMENT = "booking_sidebar"
+GRID_FRAGMENT = "schedule_grid"
+RECORDS_FRAGMENT = "booking_records"
+ADMIN_FRAGMENT = "admin_panel"
+ALL_FRAGMENTS = [SIDEBAR_FRAGMENT, GRID_FRAGMENT, RECORDS_FRAGMENT, ADMIN_FRAGMENT]
 
-# 跳台配置
-CLASSROOMS = ["6m", "8m","10m","14m"]
-
-# 屏蔽的跳台文件
-BLOCKED_CLASSROOMS_FILE = "blocked_classrooms.json"
-
-def load_bookings():
-    """加载预约数据"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-def save_bookings(bookings):
-    """保存预约数据"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(bookings, f, ensure_ascii=False, indent=2)
-
-def load_blocked_classrooms():
-    """加载被屏蔽的跳台列表"""
-    if os.path.exists(BLOCKED_CLASSROOMS_FILE):
-        try:
-            with open(BLOCKED_CLASSROOMS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
-
-def save_blocked_classrooms(blocked_classrooms):
-    """保存被屏蔽的跳台列表"""
-    with open(BLOCKED_CLASSROOMS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(blocked_classrooms, f, ensure_ascii=False, indent=2)
-
-def get_next_week_dates():
-    """获取从今天开始的7天日期列表"""
-    today = datetime.date.today()
+# 显示屏蔽状态的片段
+BLOCKED_FRAGMENTS = [SIDEBAR_FRAGMENT, GRID_FRAGMENT, ADMIN_FRAGMENT]
+
+# 轮询数据版本的间隔（秒），用于发现其他进程、其他会话的改动
+VERSION_POLL_SECONDS = 5
+
+# 日程表每页显示的天数
+GRID_PAGE_DAYS = 7
+
+# 查找空闲时段最多显示的结果数
+FREE_SEARCH_LIMIT = 5
+
+def current_venue():
+    """本会话选择的场地"""
+    venue_id = st.session_state.get("venue_id")
+    return get_venue(venue_id if venue_id in VENUES else None)
+
+def switch_venue():
+    """切换场地的回调：清空待预约列表和日程表选择（它们属于上一个场地）"""
+    st.session_state.venue_id = st.session_state.venue_selector
+    for key in ("booking_targets", "date_selector", "slot_selector", "grid_week",
+                "recur_slots", "recur_classrooms", "records_classrooms", "records_clubs", "admin_clubs",
+                "free_classrooms", "free_time_range", "free_consecutive", "free_results",
+                "export_classrooms", "export_clubs"):
+        st.session_state.pop(key, None)
+
+def rerun_fragments(*fragment_keys):
+    """只重新运行指定的片段（只能在控件回调中调用）"""
+    store = current_venue().store
+    # 显示某类数据的片段全部重新运行后，本会话就已呈现其最新版本，轮询无需再整页刷新
+    if set(ALL_FRAGMENTS) <= set(fragment_keys):
+        st.session_state.seen_data_version = store.get_data_version()
+    if set(BLOCKED_FRAGMENTS) <= set(fragment_keys):
+        st.session_state.seen_blocked_version = store.get_blocked_version()
+    st.rerun(list(fragment_keys))
+
+@st.fragment(run_every=VERSION_POLL_SECONDS)
+def watch_data_versions():
+    """定时比较当前场地的数据版本（只读取计数器文件和文件戳），有变化时才整页刷新"""
+    store = current_venue().store
+    versions = (store.get_data_version(), store.get_blocked_version())
+    if versions != (st.session_state.get('seen_data_version'), st.session_state.get('seen_blocked_version')):
+        st.session_state.seen_data_version, st.session_state.seen_blocked_version = versions
+        st.rerun()
+
+def set_message(name, level, text):
+    """保存一条提示信息，在对应片段下次运行时显示"""
+    st.session_state[f"msg_{name}"] = (level, text)
+
+def show_message(name):
+    """显示并清除上一次操作留下的提示信息"""
+    message = st.session_state.pop(f"msg_{name}", None)
+    if message is not None:
+        level, text = message
+        getattr(st, level)(text)
+
+def select_grid_slot(date, time_slot):
+    """日程表点击回调：侧边栏跳转到对应的日期和时段"""
+    st.session_state.date_selector = date
+    st.session_state.slot_selector = time_slot
+    rerun_fragments(SIDEBAR_FRAGMENT, GRID_FRAGMENT)
+
+def free_search_criteria(venue):
+    """查找空闲时段的当前条件：场地、可预约范围的起点、数据版本（有人预约或屏蔽后重新查找）和各筛选控件的值"""
+    state = st.session_state
+    time_range = state.get("free_time_range")
+    store = venue.store
+    return (
+        venue.id, venue.bookable_dates()[0], store.get_data_version(), store.get_blocked_version(),
+        tuple(state.get("free_classrooms") or ()), tuple(state.get("free_weekdays") or ()),
+        tuple(time_range) if time_range else None, state.get("free_consecutive", 1),
+    )
+
+def search_free_slots():
+    """按当前条件查找空闲时段，结果连同条件保存在 session_state.free_results"""
+    venue = current_venue()
+    criteria = free_search_criteria(venue)
+    classrooms, weekdays, time_range, consecutive = criteria[4:]
+    dates = venue.bookable_dates()
+    occupancy = venue.read_occupancy(dates[0], len(dates))
+    options = find_free_slots(venue, occupancy, dates, list(classrooms), list(weekdays), time_range, consecutive,
+                              FREE_SEARCH_LIMIT)
+    st.session_state.free_results = (criteria, options)
+
+def select_free_option(option):
+    """查找结果的点击回调：选入预约表单；连续多个时段时同时加入待预约列表"""
+    state = st.session_state
+    date_str, time_slot, classroom = option[0]
+    state.date_selector = datetime.date.fromisoformat(date_str)
+    state.slot_selector = time_slot
+    state.classroom_selector = classroom
+    if len(option) > 1:
+        added = add_booking_targets(option)
+        set_message("targets", "success", f"已加入 {added} 个连续时段")
+    rerun_fragments(SIDEBAR_FRAGMENT, GRID_FRAGMENT)
+
+def add_booking_targets(targets):
+    """将预约目标加入待预约列表（去重），返回新加入的个数"""
+    pending = st.session_state.setdefault("booking_targets", [])
+    added = [target for target in targets if target not in pending]
+    pending.extend(added)
+    return len(added)
+
+def add_selected_target():
+    """将侧边栏当前选中的日期、时段、跳台加入待预约列表"""
+    state = st.session_state
+    classroom = state.get("classroom_selector")
+    if classroom is None:
+        set_message("targets", "error", "该时段暂无可预约跳台，请选择其他时段。")
+    else:
+        target = (state.date_selector.strftime('%Y-%m-%d'), state.slot_selector, classroom)
+        if add_booking_targets([target]) == 0:
+            set_message("targets", "info", "该时段已在待预约列表中")
+    rerun_fragments(SIDEBAR_FRAGMENT)
+
+def add_recurring_targets():
+    """将按周重复规则在当前可预约日期内展开，加入待预约列表（跳过已被预约或屏蔽的时段）"""
+    state = st.session_state
+    venue = current_venue()
+    dates = venue.bookable_dates()
+    targets = expand_recurrence(venue, dates, state.recur_weekdays, state.recur_slots, state.recur_classrooms)
+    if not targets:
+        set_message("targets", "error", "请选择星期、时段和跳台（所选星期需开放所选时段）")
+        rerun_fragments(SIDEBAR_FRAGMENT)
+        return
+    occupancy = venue.read_occupancy(dates[0], len(dates))
+    unavailable = find_unavailable_targets(occupancy, targets)
+    added = add_booking_targets([target for target in targets if target not in unavailable])
+    text = f"已加入 {added} 个时段"
+    if unavailable:
+        text += f"（跳过 {len(unavailable)} 个已被预约或屏蔽的时段）"
+    set_message("targets", "success" if added else "warning", text)
+    rerun_fragments(SIDEBAR_FRAGMENT)
+
+def clear_booking_targets():
+    st.session_state.booking_targets = []
+    rerun_fragments(SIDEBAR_FRAGMENT)
+
+def submit_booking():
+    """预约表单提交回调：预约待预约列表中的全部时段（列表为空时预约当前选中的跳台）"""
+    state = st.session_state
+    venue = current_venue()
+    targets = list(state.get("booking_targets", []))
+    if not targets:
+        selected_classroom = state.get("classroom_selector")
+        if selected_classroom is None or state.get("slot_selector") is None:
+            set_message("booking", "error", "该时段暂无可预约跳台，请选择其他时段。")
+            return
+        targets = [(state.date_selector.strftime('%Y-%m-%d'), state.slot_selector, selected_classroom)]
     
-    # 生成从今天开始的7天FF
-    week_dates = []
-    for i in range(7):
-        week_dates.append(today + timedelta(days=i))
-    
-    return week_dates
-
-def get_weekday_name(date):
-    """获取中文星期名称"""
-    weekdays = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
-    return weekdays[date.weekday()]
-
-def get_available_classrooms(bookings, date_str, time_slot):
-    """获取指定日期时段的可用跳台"""
-    blocked = load_blocked_classrooms()
-    available = []
-    for classroom in CLASSROOMS:
-        if classroom not in blocked:  # 排除被屏蔽的跳台
-            slot_key = f"{date_str}_{time_slot}_{classroom}"
-            if slot_key not in bookings:
-                available.append(classroom)
-    return available
-
-def is_slot_fully_booked(bookings, date_str, time_slot):
-    """检查指定时段是否完全被预约（所有可用跳台都被预约）"""
-    return len(get_available_classrooms(bookings, date_str, time_slot)) == 0
-
-def get_available_classrooms_for_booking():
-    """获取可用于预约的跳台列表（排除被屏蔽的跳台）"""
-    blocked = load_blocked_classrooms()
-    return [classroom for classroom in CLASSROOMS if classroom not in blocked]
+    # 表单控件的 key 为 "booking_" + 预约记录字段名
+    info = {field: state.get(f"booking_{field}") for field in REQUIRED_FIELDS}
+    error = validate_booking(venue, info, targets)
+    if error is not None:
+        set_message("booking", "error", error)
+        return
+    
+    # 全部时段一次写入（存储层保证全部成功或全部不写入，同一跳台只能被预约一次）
+    taken = book_targets(venue, info, targets)
+    if not taken:
+        if len(targets) == 1:
+            set_message("booking", "success", f"✅ 预约成功！跳台{targets[0][2]}")
+        else:
+            set_message("booking", "success", f"✅ 预约成功！共 {len(targets)} 个时段")
+        state.booking_targets = []
+        rerun_fragments(*ALL_FRAGMENTS)
+    elif len(targets) == 1:
+        set_message("booking", "error", "抱歉，该跳台刚刚被其他组织预约了，请选择其他跳台。")
+    else:
+        state.booking_targets = [target for target in targets if target not in taken]
+        set_message(
+            "booking", "error",
+            f"抱歉，以下 {len(taken)} 个时段刚刚被其他组织预约，本次未预约任何时段，已从待预约列表中移除，请确认后重新提交："
+            + "、".join(map(format_target, taken))
+        )
+        rerun_fragments(SIDEBAR_FRAGMENT)
 
-def main():
-    st.title("🎿 JFdryski  尖锋旱雪跳台包场预约系统")
-    st.markdown("暂定一个星期，之后根据需要再进行调整")
+@st.fragment(key=SIDEBAR_FRAGMENT)
+@metrics.timed("sidebar")
+def render_booking_sidebar():
+    """侧边栏 - 预约表单"""
+    st.header("📝 预约信息")
     
-    # 初始化 session state
-    if 'selected_date_index' not in st.session_state:
-        st.session_state.selected_date_index = 0
-    if 'selected_slot_index' not in st.session_state:
-        st.session_state.selected_slot_index = 0
+    venue = current_venue()
+    state = st.session_state
+    dates = venue.bookable_dates()
     
-    # 加载预约数据
-    bookings = load_bookings()
+    # 日期选择 - 使用 session state 控制（跨过零点或切换场地后原选择可能已不在范围内）
+    if state.get("date_selector") not in dates:
+        state.pop("date_selector", None)
+    selected_date = st.selectbox(
+        "选择日期",
+        options=dates,
+        format_func=lambda x: f"{x.strftime('%Y-%m-%d')} ({get_weekday_name(x)})",
+        key="date_selector"
+    )
+    date_str = selected_date.strftime('%Y-%m-%d')
     
-    # 获取下一周日期
-    week_dates = get_next_week_dates()
+    # 只读所选日期的占用位图（含屏蔽列表），不加载预约详情
+    with metrics.phase("occupancy_load"):
+        occupancy = venue.read_occupancy(selected_date)
+    blocked_classrooms = occupancy.blocked
     
-    # 侧边栏 - 预约表单
-    with st.sidebar:
-        st.header("📝 预约信息")
-        
-        # 日期选择 - 使用 session state 控制
-        selected_date = st.selectbox(
-            "选择日期",
-            options=week_dates,
-            index=st.session_state.selected_date_index,
-            format_func=lambda x: f"{x.strftime('%Y-%m-%d')} ({get_weekday_name(x)})",
-            key="date_selector"
-        )
-        
-        # 时段选择 - 使用 session state 控制
-        slot_options = list(TIME_SLOTS.keys())
-        selected_slot = st.selectbox(
-            "选择时段",
-            options=slot_options,
-            index=st.session_state.selected_slot_index,
-            format_func=lambda x: f"{x} ({TIME_SLOTS[x]})",
-            key="slot_selector"
-        )
-        
-        # 检查该时段是否已被预约
-        date_str = selected_date.strftime('%Y-%m-%d')
-        available_classrooms = get_available_classrooms(bookings, date_str, selected_slot)
-        is_fully_booked = is_slot_fully_booked(bookings, date_str, selected_slot)
-        
-        # 检查是否有跳台被屏蔽
-        available_for_booking = get_available_classrooms_for_booking()
-        
-        if len(available_for_booking) == 0:
-            st.error("❌ 暂无可用跳台")
-        elif is_fully_booked:
-            st.error(f"❌ 该时段所有跳台已被预约")
-            # 显示已预约的跳台信息
-            for classroom in available_for_booking:
-                slot_key = f"{date_str}_{selected_slot}_{classroom}"
-                if slot_key in bookings:
-                    booking_info = bookings[slot_key]
-                    st.info(f"跳台{classroom}：{booking_info['name']} ({booking_info.get('student_id', '未知')})")
-        else:
-            st.success(f"✅ 该时段有 {len(available_classrooms)} 个跳台可预约")
+    # 时段选择 - 只列出当天开放的时段
+    slot_options = venue.time_slots_for(selected_date)
+    if state.get("slot_selector") not in slot_options:
+        state.pop("slot_selector", None)
+    selected_slot = st.selectbox(
+        "选择时段",
+        options=slot_options,
+        format_func=lambda x: f"{x} ({venue.time_slots[x]})",
+        key="slot_selector"
+    )
+    
+    # 检查该时段是否已被预约
+    if selected_slot is None:
+        available_classrooms = []
+        is_fully_booked = False
+    else:
+        available_classrooms = get_available_classrooms(venue, occupancy, date_str, selected_slot)
+        is_fully_booked = is_slot_fully_booked(venue, occupancy, date_str, selected_slot)
+    
+    # 检查是否有跳台被屏蔽
+    available_for_booking = get_available_classrooms_for_booking(venue, blocked_classrooms)
+    
+    if selected_slot is None:
+        st.info("该日期不开放")
+    elif len(available_for_booking) == 0:
+        st.error("❌ 暂无可用跳台")
+    elif is_fully_booked:
+        st.error(f"❌ 该时段所有跳台已被预约")
+        # 显示已预约的跳台信息（只有这时才加载当天的预约详情）
+        with metrics.phase("data_load"):
+            index = BookingIndex(venue.store.load_bookings(date_str, date_str))
+        for classroom in available_for_booking:
+            booking_info = index.get(date_str, selected_slot, classroom)
+            if booking_info is not None:
+                st.info(f"跳台{classroom}：{booking_info['name']} ({booking_info.get('student_id', '未知')})")
+    else:
+        st.success(f"✅ 该时段有 {len(available_classrooms)} 个跳台可预约")
+    
+    # 跳台选择（点击查找结果后选中的跳台可能刚刚被预约）
+    if state.get("classroom_selector") not in available_classrooms:
+        state.pop("classroom_selector", None)
+    st.selectbox(
+        "选择跳台",
+        options=available_classrooms,
+        format_func=lambda x: f"跳台 {x}",
+        key="classroom_selector"
+    )
+    
+    # 多时段预约：逐个加入或按周重复批量加入，提交时一次写入
+    st.button("➕ 加入待预约列表", on_click=add_selected_target, disabled=not available_classrooms, key="add_target")
+    with st.expander("🔁 按周重复预约"):
+        st.multiselect("星期", options=list(range(7)), format_func=WEEKDAY_NAMES.__getitem__, key="recur_weekdays")
+        st.multiselect("时段", options=list(venue.time_slots), format_func=lambda x: f"{x} ({venue.time_slots[x]})", key="recur_slots")
+        st.multiselect("跳台", options=available_for_booking, format_func=lambda x: f"跳台 {x}", key="recur_classrooms")
+        st.button("加入待预约列表", on_click=add_recurring_targets, key="add_recurring")
+    with st.expander("🔎 查找空闲时段"):
+        render_free_slot_search(venue)
+    show_message("targets")
+    
+    targets = st.session_state.get("booking_targets", [])
+    if targets:
+        import pandas as pd
+        st.markdown(f"**待预约列表（{len(targets)} 个时段）**")
+        st.dataframe(pd.DataFrame(targets, columns=["日期", "时段", "跳台"]), hide_index=True)
+        st.button("清空待预约列表", on_click=clear_booking_targets, key="clear_targets")
+    
+    # 预约表单
+    with st.form("booking_form"):
+        st.subheader("填写预约信息")
         
-        # 跳台选择
-        selected_classroom = st.selectbox(
-            "选择跳台",
-            options=available_classrooms,
-            format_func=lambda x: f"跳台 {x}"
-        )
+        st.text_input("姓名 *", placeholder="请输入您的姓名", key="booking_name")
+        st.text_input("身份证后四位号 *", placeholder="身份证后四位号", key="booking_student_id")
+        st.text_input("单位/俱乐部 *", placeholder="单位/俱乐部名称", key="booking_class")
+        st.text_input("电话 *", placeholder="请输入您的联系电话", key="booking_phone")
+        st.text_area("包场人数 *", placeholder="1-20人", key="booking_reason")
         
-        # 预约表单
-        with st.form("booking_form"):
-            st.subheader("填写预约信息")
-            
-            name = st.text_input("姓名 *", placeholder="请输入您的姓名")
-            student_id = st.text_input("身份证后四位号 *", placeholder="身份证后四位号")
-            class_name = st.text_input("单位/俱乐部 *", placeholder="单位/俱乐部名称")
-            phone = st.text_input("电话 *", placeholder="请输入您的联系电话")
-            reason = st.text_area("包场人数 *", placeholder="1-20人")
-            
-            submitted = st.form_submit_button("确认预约", type="primary")
-            
-            if submitted:
-                # 验证表单
-                if not all([name, student_id, class_name, phone, reason]):
-                    st.error("请填写所有必填项！")
-                else:
-                    # 再次检查跳台是否可用（防止并发预约）
-                    slot_key = f"{date_str}_{selected_slot}_{selected_classroom}"
-                    if slot_key in bookings:
-                        st.error("抱歉，该跳台刚刚被其他组织预约了，请选择其他跳台。")
-                    else:
-                        # 保存预约
-                        booking_data = {
-                            "name": name,
-                            "student_id": student_id,
-                            "class": class_name,
-                            "phone": phone,
-                            "reason": reason,
-                            "classroom": selected_classroom,
-                            "booking_time": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        }
-                        bookings[slot_key] = booking_data
-                        save_bookings(bookings)
-                        st.success(f"✅ 预约成功！跳台{selected_classroom}")
-                        st.rerun()
-    
-    # 主内容区域 - 日程表
-    st.header("📅 未来7天跳台日程表")
-    st.info(f"当前时间：{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | 预约范围：{week_dates[0].strftime('%Y-%m-%d')} 至 {week_dates[-1].strftime('%Y-%m-%d')}")
-    st.markdown("💡 **提示：点击日程表中的时段可快速跳转到预约**")
+        submit_label = f"确认预约（{len(targets)} 个时段）" if targets else "确认预约"
+        st.form_submit_button(submit_label, type="primary", on_click=submit_booking)
+        show_message("booking")
     
+    # 按电话查询自己今天及以后的预约（电话索引按数据版本缓存，查询只是一次字典查找）
+    with st.expander("🔍 查询我的预约"):
+        phone = st.text_input("预约时填写的电话", key="my_phone").strip()
+        if phone:
+            my_bookings = venue.store.find_bookings_by_phone(phone)
+            if my_bookings:
+                import pandas as pd
+                rows = []
+                for slot_key, booking in sorted(my_bookings.items()):
+                    date_str, time_slot, classroom = parse_slot_key(slot_key, booking)
+                    rows.append((date_str, time_slot, classroom, booking.get('reason', '')))
+                st.dataframe(pd.DataFrame(rows, columns=["日期", "时段", "跳台", "包场人数"]), hide_index=True)
+            else:
+                st.info("没有找到该电话今天及以后的预约")
+
+def render_free_slot_search(venue):
+    """按条件查找可预约范围内最早的空闲时段，点击结果即选入预约表单
+
+    只在点击"查找"时，或查找之后条件、预约数据有变化时才重新查找；侧边栏的其他重新运行
+    （如点击日程表）直接显示上次的结果，不读取整个可预约范围的占用位图。
+    """
+    st.multiselect("跳台（按偏好顺序，不选为全部）", options=venue.classrooms,
+                   format_func=lambda x: f"跳台 {x}", key="free_classrooms")
+    st.multiselect("星期（不选为全部）", options=list(range(7)), format_func=WEEKDAY_NAMES.__getitem__,
+                   key="free_weekdays")
+    # 时间范围的可选值为各时段的起止时间
+    times = sorted({time for time_range in venue.time_slots.values() for time in (slot_time_range(time_range) or ())})
+    if len(times) > 1:
+        st.select_slider("时间范围", options=times, value=(times[0], times[-1]), key="free_time_range")
+    max_slots = max(venue.slots_per_weekday())
+    st.number_input("连续时段数", min_value=1, max_value=max(max_slots, 1), value=1, step=1, key="free_consecutive")
+    st.button("查找", key="free_search", on_click=search_free_slots)
+    
+    results = st.session_state.get("free_results")
+    if results is None:
+        return
+    if results[0] != free_search_criteria(venue):
+        search_free_slots()
+        results = st.session_state.free_results
+    options = results[1]
+    if not options:
+        st.info("可预约范围内没有符合条件的空闲时段")
+    for i, option in enumerate(options):
+        date_str, first_slot, classroom = option[0]
+        slots = first_slot if len(option) == 1 else f"{first_slot} 至 {option[-1][1]}"
+        weekday = get_weekday_name(datetime.date.fromisoformat(date_str))
+        st.button(f"{date_str} ({weekday}) {slots} 跳台{classroom}", key=f"free_option_{i}",
+                  on_click=select_free_option, args=(option,))
+
+@metrics.timed("grid_render")
+def render_grid_buttons(venue, grid, week_dates):
+    """按钮视图：每个时段一个按钮"""
     # 自定义CSS样式
     st.markdown("""
     <style>
@@ -233,7 +385,6 @@ def main():
     </style>
     """, unsafe_allow_html=True)
     
-    # 创建可点击的日程表
     # 显示表头
     cols = st.columns([1.5] + [1] * len(week_dates))
     cols[0].markdown("**时段**")
@@ -241,7 +392,7 @@ def main():
         cols[i + 1].markdown(f"**{date.strftime('%m-%d')}<br>{get_weekday_name(date)}**", unsafe_allow_html=True)
     
     # 显示每个时段
-    for slot_idx, (time_slot, time_range) in enumerate(TIME_SLOTS.items()):
+    for slot_idx, (time_slot, time_range) in enumerate(venue.time_slots.items()):
         cols = st.columns([1.5] + [1] * len(week_dates))
         
         # 时段名称列
@@ -249,368 +400,687 @@ def main():
         
         # 每天的时段按钮
         for date_idx, date in enumerate(week_dates):
-            date_str = date.strftime('%Y-%m-%d')
+            state = grid["states"][date_idx, slot_idx]
+            free_count = int(grid["free_counts"][date_idx, slot_idx])
+            booked_info = grid["booked_labels"].get((date_idx, slot_idx), [])
             
             with cols[date_idx + 1]:
-                # 检查该时段的跳台预约情况
-                available_classrooms = get_available_classrooms(bookings, date_str, time_slot)
-                is_fully_booked = is_slot_fully_booked(bookings, date_str, time_slot)
-                available_for_booking = get_available_classrooms_for_booking()
-                
-                if len(available_for_booking) == 0:
+                if state == "不开放":
+                    st.button(
+                        "— 不开放",
+                        key=f"btn_{date_idx}_{slot_idx}",
+                        help="该时段当天不开放",
+                        width="stretch",
+                        disabled=True
+                    )
+                elif state == "暂无可用":
                     # 所有跳台都被屏蔽
-                    if st.button(
+                    st.button(
                         "🚫 暂无可用", 
                         key=f"btn_{date_idx}_{slot_idx}",
                         help="暂无可用跳台",
-                        use_container_width=True,
+                        width="stretch",
                         disabled=True
-                    ):
-                        pass
-                elif is_fully_booked:
+                    )
+                elif state == "已满":
                     # 所有可用跳台都被预约
-                    booked_info = []
-                    for classroom in available_for_booking:
-                        slot_key = f"{date_str}_{time_slot}_{classroom}"
-                        if slot_key in bookings:
-                            booking = bookings[slot_key]
-                            info = f"{classroom}: {booking['name']}"
-                            if 'student_id' in booking:
-                                info += f"({booking['student_id']})"
-                            booked_info.append(info)
-                    
-                    display_text = "❌ 已满\n" + "\n".join(booked_info)
-                    
-                    if st.button(
-                        display_text, 
+                    st.button(
+                        "❌ 已满\n" + "\n".join(booked_info), 
                         key=f"btn_{date_idx}_{slot_idx}",
                         help="点击查看预约详情",
-                        use_container_width=True
-                    ):
-                        st.session_state.selected_date_index = date_idx
-                        st.session_state.selected_slot_index = slot_idx
-                        st.rerun()
-                        
-                elif len(available_classrooms) == len(available_for_booking):
+                        width="stretch",
+                        on_click=select_grid_slot,
+                        args=(date, time_slot)
+                    )
+                elif state == "可预约":
                     # 所有可用跳台都可预约
-                    display_text = f"✅ 可预约\n({len(available_for_booking)}个跳台)"
-                        
-                    if st.button(
-                        display_text, 
+                    st.button(
+                        f"✅ 可预约\n({grid['open_count']}个跳台)", 
                         key=f"btn_{date_idx}_{slot_idx}",
                         help="点击快速预约",
-                        use_container_width=True,
-                        type="secondary"
-                    ):
-                        st.session_state.selected_date_index = date_idx
-                        st.session_state.selected_slot_index = slot_idx
-                        st.rerun()
-                        
+                        width="stretch",
+                        type="secondary",
+                        on_click=select_grid_slot,
+                        args=(date, time_slot)
+                    )
                 else:
                     # 部分跳台被预约
-                    booked_info = []
-                    for classroom in available_for_booking:
-                        slot_key = f"{date_str}_{time_slot}_{classroom}"
-                        if slot_key in bookings:
-                            booking = bookings[slot_key]
-                            info = f"{classroom}: {booking['name']}"
-                            if 'student_id' in booking:
-                                info += f"({booking['student_id']})"
-                            booked_info.append(info)
-                    
-                    display_text = f"⚠️ 部分可约\n剩余{len(available_classrooms)}个\n" + "\n".join(booked_info)
-                    
-                    if st.button(
-                        display_text, 
+                    st.button(
+                        f"⚠️ 部分可约\n剩余{free_count}个\n" + "\n".join(booked_info), 
                         key=f"btn_{date_idx}_{slot_idx}",
                         help="点击预约剩余跳台",
-                        use_container_width=True,
-                        type="secondary"
-                    ):
-                        st.session_state.selected_date_index = date_idx
-                        st.session_state.selected_slot_index = slot_idx
-                        st.rerun()
-    
-    # 统计信息
+                        width="stretch",
+                        type="secondary",
+                        on_click=select_grid_slot,
+                        args=(date, time_slot)
+                    )
+
+# 表格视图中各状态单元格的样式
+GRID_CELL_STYLES = {
+    "不开放": "background-color: #f5f5f5; color: #bbbbbb",
+    "暂无可用": "background-color: #eeeeee; color: #888888",
+    "已满": "background-color: #f8d7da; color: #721c24",
+    "可预约": "background-color: #e8f5e8; color: #155724",
+    "部分可约": "background-color: #fff3cd; color: #856404",
+}
+
+def format_grid_cell(grid, date_idx, slot_idx):
+    """表格视图中单元格的文字"""
+    state = grid["states"][date_idx, slot_idx]
+    booked_info = "，".join(grid["booked_labels"].get((date_idx, slot_idx), []))
+    if state == "不开放":
+        return "— 不开放"
+    if state == "暂无可用":
+        return "🚫 暂无可用"
+    if state == "已满":
+        return f"❌ 已满：{booked_info}"
+    if state == "可预约":
+        return f"✅ 可预约 ({grid['open_count']}个跳台)"
+    return f"⚠️ 剩余{int(grid['free_counts'][date_idx, slot_idx])}个：{booked_info}"
+
+def select_table_cell(venue, grid, week_dates, columns):
+    """表格视图点击回调：侧边栏跳转到选中单元格对应的日期和时段"""
+    cells = st.session_state.schedule_table.selection.cells
+    if not cells or cells[0][1] not in columns:
+        return
+    slot_idx, column = cells[0]
+    date_idx = columns.index(column)
+    if grid["states"][date_idx, slot_idx] == "不开放":
+        return
+    select_grid_slot(week_dates[date_idx], list(venue.time_slots)[slot_idx])
+
+@metrics.timed("grid_render")
+def render_grid_table(venue, grid, week_dates):
+    """表格视图：整个日程表是一个 st.dataframe，点击单元格即可选择日期和时段"""
+    import pandas as pd
+    columns = [f"{date.strftime('%m-%d')} {get_weekday_name(date)}" for date in week_dates]
+    rows = [f"{time_slot} ({time_range})" for time_slot, time_range in venue.time_slots.items()]
+    table = pd.DataFrame(
+        [[format_grid_cell(grid, date_idx, slot_idx) for date_idx in range(len(week_dates))]
+         for slot_idx in range(len(venue.time_slots))],
+        index=rows,
+        columns=columns
+    )
+    states = pd.DataFrame(grid["states"].T, index=rows, columns=columns)
+    styles = states.apply(lambda column: column.map(GRID_CELL_STYLES))
+    
+    st.dataframe(
+        table.style.apply(lambda _: styles, axis=None),
+        width="stretch",
+        key="schedule_table",
+        on_select=functools.partial(select_table_cell, venue, grid, week_dates, columns),
+        selection_mode="single-cell"
+    )
+
+@st.fragment(key=GRID_FRAGMENT)
+@metrics.timed("grid")
+def render_schedule_grid():
+    """主内容区域 - 日程表和统计指标（按周分页，每次只加载和渲染一周）"""
+    venue = current_venue()
+    dates = venue.bookable_dates()
+    
+    st.header(f"📅 未来{venue.horizon_days}天跳台日程表")
+    st.info(f"当前时间：{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | 预约范围：{dates[0].strftime('%Y-%m-%d')} 至 {dates[-1].strftime('%Y-%m-%d')}")
+    st.markdown("💡 **提示：点击日程表中的时段可快速跳转到预约**")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        # 日程表视图：表格视图只有一个组件，按钮视图每个时段一个按钮
+        view = st.radio("日程表视图", ["表格", "按钮"], horizontal=True, key="grid_view")
+    with col2:
+        pages = [dates[start:start + GRID_PAGE_DAYS] for start in range(0, len(dates), GRID_PAGE_DAYS)]
+        page = 0
+        if len(pages) > 1:
+            page = st.selectbox(
+                "显示日期",
+                options=range(len(pages)),
+                format_func=lambda i: f"{pages[i][0].strftime('%m-%d')} 至 {pages[i][-1].strftime('%m-%d')}",
+                key="grid_week"
+            )
+    week_dates = pages[page]
+    
+    # 状态和统计指标只读当前页的占用位图；预约人标签来自本页的预约详情（有进程内缓存）
+    with metrics.phase("occupancy_load"):
+        occupancy = venue.read_occupancy(week_dates[0], len(week_dates))
+    with metrics.phase("data_load"):
+        week_bookings = venue.store.load_bookings(week_dates[0].strftime('%Y-%m-%d'), week_dates[-1].strftime('%Y-%m-%d'))
+    
+    # 创建可点击的日程表（状态和统计指标一次性计算）
+    with metrics.phase("grid_compute"):
+        grid = compute_schedule_grid(venue, occupancy, week_dates, index=BookingIndex(week_bookings))
+    if view == "表格":
+        render_grid_table(venue, grid, week_dates)
+    else:
+        render_grid_buttons(venue, grid, week_dates)
+    render_grid_metrics(grid)
+
+@metrics.timed("metrics")
+def render_grid_metrics(grid):
+    """日程表下方的统计指标"""
     st.markdown("---")
     col1, col2, col3, col4 = st.columns(4)
     
-    blocked_classrooms = load_blocked_classrooms()
-    available_classroom_count = len(CLASSROOMS) - len(blocked_classrooms)
-    total_slots = len(week_dates) * len(TIME_SLOTS) * available_classroom_count
-    booked_slots = len([k for k in bookings.keys() if k.split('_')[-1] not in blocked_classrooms])
-    available_slots = total_slots - booked_slots
+    with col1:
+        st.metric("总跳台时段数", grid["total_slots"], help=f"基于{grid['open_count']}个可用跳台")
+    
+    with col2:
+        st.metric("已预约", grid["booked_slots"])
+    
+    with col3:
+        st.metric("剩余可预约", grid["available_slots"])
+        
+    with col4:
+        st.metric("完全空闲时段", grid["fully_available_slots"])
+
+# 预约记录表的列和每页条数选项
+RECORD_COLUMNS = ["日期", "时段", "跳台", "姓名", "身份证后4位号", "俱乐部", "电话", "包场人数", "预约时间"]
+RECORDS_PAGE_SIZES = [20, 50, 100]
+
+# 管理员预约列表最多显示的条数
+ADMIN_TABLE_LIMIT = 500
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def build_records_frame(venue_id, data_version, include_archive=False):
+    """构建一个场地预约记录的 DataFrame（include_archive=True 时包含历史归档）
+
+    按场地和数据版本缓存并在所有会话之间共享（不做拷贝），调用方只能读取、筛选，不能原地修改。
+    """
+    import pandas as pd
+    bookings = get_venue(venue_id).store.load_bookings(include_archive=include_archive)
+    index = BookingIndex(bookings)
+    
+    records = []
+    for slot_key, date_str, time_slot, classroom in index.entries:
+        booking = bookings[slot_key]
+        records.append((
+            date_str,
+            time_slot,
+            classroom,
+            booking['name'],
+            booking.get('student_id', '未填写'),
+            booking['class'],
+            booking['phone'],
+            booking['reason'],
+            booking['booking_time'],
+        ))
+    # 以 slot_key 为索引，管理员操作可直接按键定位预约
+    return pd.DataFrame(records, columns=RECORD_COLUMNS, index=pd.Index([entry[0] for entry in index.entries], name="slot_key"))
+
+def filter_records(records_df, date_range, classrooms, clubs, query=""):
+    """按日期范围、跳台、俱乐部和关键字（姓名/电话/俱乐部）筛选预约记录"""
+    import pandas as pd
+    mask = pd.Series(True, index=records_df.index)
+    if query:
+        mask &= (
+            records_df["姓名"].str.contains(query, regex=False)
+            | records_df["电话"].str.contains(query, regex=False)
+            | records_df["俱乐部"].str.contains(query, regex=False)
+        )
+    if len(date_range) > 0:
+        mask &= records_df["日期"] >= date_range[0].strftime('%Y-%m-%d')
+    if len(date_range) > 1:
+        mask &= records_df["日期"] <= date_range[1].strftime('%Y-%m-%d')
+    if classrooms:
+        mask &= records_df["跳台"].isin(classrooms)
+    if clubs:
+        mask &= records_df["俱乐部"].isin(clubs)
+    return records_df[mask]
+
+@st.fragment(key=RECORDS_FRAGMENT)
+@metrics.timed("records")
+def render_booking_records():
+    """预约记录查看：在服务端筛选、分页，只把当前页发送到浏览器"""
+    venue = current_venue()
+    store = venue.store
+    has_archive = bool(store.list_archive_months())
+    if not has_archive and build_records_frame(venue.id, store.get_data_version()).empty:
+        return
     
-    # 计算完全可预约的时段数
-    fully_available_slots = 0
-    for date in week_dates:
-        for time_slot in TIME_SLOTS.keys():
-            date_str = date.strftime('%Y-%m-%d')
-            if len(get_available_classrooms(bookings, date_str, time_slot)) == available_classroom_count:
-                fully_available_slots += 1
+    st.markdown("---")
+    st.header("📋 所有预约记录")
     
+    # 筛选条件，默认只看预约范围内的记录
+    dates = venue.bookable_dates()
+    col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("总跳台本周时段数", total_slots, help=f"基于{available_classroom_count}个可用跳台")
+        date_range = st.date_input("日期范围", value=(dates[0], dates[-1]), key="records_date_range")
+    
+    # 只有查询今天之前的记录时才读取历史归档
+    include_archive = has_archive and (len(date_range) == 0 or date_range[0] < dates[0])
+    if include_archive:
+        records_df = build_records_frame(venue.id, (store.get_data_version(), store.get_archive_version()), include_archive=True)
+    else:
+        records_df = build_records_frame(venue.id, store.get_data_version())
     
     with col2:
-        st.metric("已预约", booked_slots)
+        classrooms = st.multiselect("跳台", options=venue.classrooms, format_func=lambda x: f"跳台 {x}", key="records_classrooms")
+    with col3:
+        clubs = st.multiselect("俱乐部", options=sorted(records_df["俱乐部"].unique()), key="records_clubs")
+    
+    filtered_df = filter_records(records_df, date_range, classrooms, clubs)
+    if filtered_df.empty:
+        st.info("没有符合条件的预约记录")
+        return
+    
+    # 分页
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox("每页条数", options=RECORDS_PAGE_SIZES, key="records_page_size")
+    page_count = (len(filtered_df) - 1) // page_size + 1
+    with col2:
+        page = st.number_input("页码", min_value=1, max_value=page_count, value=1, step=1, key="records_page")
+    page = min(page, page_count)
     
+    start = (page - 1) * page_size
+    st.dataframe(filtered_df.iloc[start:start + page_size], width="stretch", hide_index=True)
+    st.caption(f"共 {len(filtered_df)} 条记录，第 {page}/{page_count} 页")
+
+def build_export(venue_id, start_date, end_date, classrooms, clubs, export_format):
+    """生成导出文件的内容（点击下载按钮时才在后台线程中运行）
+
+    预约逐条读取、逐行写入，不构建 DataFrame；包含范围内的历史归档。
+    """
+    import io
+    rows = iter_export_rows(get_venue(venue_id), start_date, end_date, classrooms, clubs)
+    file = io.BytesIO()
+    write_export(rows, export_format, file)
+    return file.getvalue()
+
+def render_export_section(venue, club_options):
+    """导出预约记录（CSV / Excel），默认导出本月"""
+    st.subheader("📥 导出预约记录")
+    today = datetime.date.today()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        date_range = st.date_input("日期范围", value=(today.replace(day=1), today), key="export_date_range")
+    with col2:
+        classrooms = st.multiselect("跳台", options=venue.classrooms, format_func=lambda x: f"跳台 {x}", key="export_classrooms")
     with col3:
-        st.metric("剩余可预约", available_slots)
-        
+        # 历史归档中的俱乐部不一定在当前预约里，允许直接输入
+        clubs = st.multiselect("俱乐部", options=club_options, accept_new_options=True, key="export_clubs")
     with col4:
-        st.metric("完全空闲时段", fully_available_slots)
+        formats = ["csv", "xlsx"] if xlsx_available() else ["csv"]
+        export_format = st.radio("格式", options=formats, format_func=lambda x: "Excel" if x == "xlsx" else "CSV",
+                                 horizontal=True, key="export_format")
+    if not xlsx_available():
+        st.caption("安装 openpyxl 后可导出 Excel 格式")
     
-    # 预约记录查看
-    if bookings:
-        st.markdown("---")
-        st.header("📋 所有预约记录")
-        
-        records = []
-        for slot_key, booking in bookings.items():
-            # 解析slot_key，支持新旧格式
-            parts = slot_key.split('_')
-            if len(parts) >= 3:  # 新格式：date_slot_classroom
-                date_str = parts[0]
-                time_slot = '_'.join(parts[1:-1])
-                classroom = parts[-1]
-            else:  # 旧格式：date_slot（兼容性）
-                date_str = parts[0]
-                time_slot = '_'.join(parts[1:])
-                classroom = booking.get('classroom', '未知')
-                
-            record = {
-                "日期": date_str,
-                "时段": time_slot,
-                "跳台": classroom,
-                "姓名": booking['name'],
-                "身份证后4位号": booking.get('student_id', '未填写'),
-                "俱乐部": booking['class'],
-                "电话": booking['phone'],
-                "包场人数": booking['reason'],
-                "预约时间": booking['booking_time']
-            }
-            records.append(record)
-        
-        records_df = pd.DataFrame(records)
-        st.dataframe(records_df, use_container_width=True, hide_index=True)
-        
-        # 管理员功能 - 删除预约
-        st.markdown("---")
-        st.header("🔧 管理员功能")
+    start_date = date_range[0].strftime('%Y-%m-%d') if len(date_range) > 0 else None
+    end_date = date_range[1].strftime('%Y-%m-%d') if len(date_range) > 1 else start_date
+    st.download_button(
+        "📥 下载",
+        data=functools.partial(build_export, venue.id, start_date, end_date, classrooms, clubs, export_format),
+        file_name=export_file_name(venue.id, start_date, end_date, export_format),
+        mime=EXPORT_FORMATS[export_format][0],
+        on_click="ignore",
+        key="export_download",
+    )
+
+def cancel_bookings(slot_keys):
+    """批量取消预约的回调：一次写入"""
+    current_venue().store.delete_bookings(slot_keys)
+    st.session_state.pop('confirm_cancel_filtered', None)
+    set_message("cancel", "success", f"✅ 已取消 {len(slot_keys)} 条预约")
+    rerun_fragments(*ALL_FRAGMENTS)
+
+def confirm_cancel_filtered(slot_keys):
+    """取消全部筛选结果的回调（需要对同一批预约二次确认）"""
+    if st.session_state.get('confirm_cancel_filtered') == slot_keys:
+        cancel_bookings(slot_keys)
+    else:
+        st.session_state.confirm_cancel_filtered = slot_keys
+        set_message("cancel", "warning", f"⚠️ 请再次点击确认取消这 {len(slot_keys)} 条预约")
+
+def confirm_clear_all():
+    """清空所有预约的回调（需要二次确认）"""
+    if st.session_state.get('confirm_delete_all', False):
+        current_venue().store.clear_bookings()
+        set_message("clear_all", "success", "✅ 所有预约已清空！")
+        st.session_state.confirm_delete_all = False
+        rerun_fragments(*ALL_FRAGMENTS)
+    else:
+        st.session_state.confirm_delete_all = True
+        set_message("clear_all", "warning", "⚠️ 请再次点击确认清空所有预约")
+
+def block_selected_classroom():
+    """屏蔽跳台的回调"""
+    classroom = st.session_state.block_select
+    current_venue().store.set_classroom_blocked(classroom, True)
+    set_message("block", "success", f"✅ 跳台 {classroom} 已被屏蔽")
+    rerun_fragments(SIDEBAR_FRAGMENT, GRID_FRAGMENT, ADMIN_FRAGMENT)
+
+def unblock_selected_classroom():
+    """启用跳台的回调"""
+    classroom = st.session_state.unblock_select
+    current_venue().store.set_classroom_blocked(classroom, False)
+    set_message("unblock", "success", f"✅ 跳台 {classroom} 已恢复可用")
+    rerun_fragments(SIDEBAR_FRAGMENT, GRID_FRAGMENT, ADMIN_FRAGMENT)
+
+def confirm_block_all():
+    """屏蔽所有跳台的回调（需要二次确认）"""
+    if st.session_state.get('confirm_block_all', False):
+        venue = current_venue()
+        venue.store.save_blocked_classrooms(list(venue.classrooms))
+        set_message("block_all", "success", "✅ 所有跳台已被屏蔽")
+        st.session_state.confirm_block_all = False
+        rerun_fragments(SIDEBAR_FRAGMENT, GRID_FRAGMENT, ADMIN_FRAGMENT)
+    else:
+        st.session_state.confirm_block_all = True
+        set_message("block_all", "warning", "⚠️ 请再次点击确认屏蔽所有跳台")
+
+def unblock_all_classrooms():
+    """启用所有跳台的回调"""
+    current_venue().store.save_blocked_classrooms([])
+    set_message("unblock_all", "success", "✅ 所有跳台已恢复可用")
+    rerun_fragments(SIDEBAR_FRAGMENT, GRID_FRAGMENT, ADMIN_FRAGMENT)
+
+@st.fragment(key=ADMIN_FRAGMENT)
+@metrics.timed("admin")
+def render_admin_panel():
+    """管理员功能（管理当前场地）"""
+    venue = current_venue()
+    store = venue.store
+    with metrics.phase("blocked_load"):
+        blocked_classrooms = store.load_blocked_classrooms()
+    
+    st.markdown("---")
+    st.header("🔧 管理员功能")
+    
+    # 密码验证
+    admin_password = st.text_input("管理员密码", type="password", key="admin_pwd")
+    
+    if admin_password == ADMIN_PASSWORD:
+        st.success("✅ 密码验证成功")
         
-        # 密码验证
-        admin_password = st.text_input("管理员密码", type="password", key="admin_pwd")
+        # 创建管理选项卡
+        tab1, tab2, tab3, tab4 = st.tabs(["📋 预约管理", "🏫 跳台管理", "📊 统计信息", "⏱️ 性能"])
         
-        if admin_password == ADMIN_PASSWORD:
-            st.success("✅ 密码验证成功")
+        with tab1:
+            # 查找并取消预约（历史预约已归档，只能取消今天及以后的预约）
+            st.subheader("🗑️ 查找并取消预约")
+            show_message("cancel")
+            records_df = build_records_frame(venue.id, store.get_data_version())
             
-            # 创建管理选项卡
-            tab1, tab2, tab3 = st.tabs(["📋 预约管理", "🏫 跳台管理", "📊 统计信息"])
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                query = st.text_input("搜索姓名/电话/俱乐部", key="admin_query")
+            with col2:
+                date_range = st.date_input("日期范围", value=(), key="admin_date_range")
+            with col3:
+                clubs = st.multiselect("俱乐部", options=sorted(records_df["俱乐部"].unique()), key="admin_clubs")
             
-            with tab1:
-                # 删除指定预约
-                st.subheader("🗑️ 删除指定预约")
-                if bookings:
-                    # 创建预约选项列表
-                    booking_options = []
-                    for slot_key, booking in bookings.items():
-                        # 解析slot_key，支持新旧格式
-                        parts = slot_key.split('_')
-                        if len(parts) >= 3:  # 新格式：date_slot_classroom
-                            date_str = parts[0]
-                            time_slot = '_'.join(parts[1:-1])
-                            classroom = parts[-1]
-                        else:  # 旧格式：date_slot（兼容性）
-                            date_str = parts[0]
-                            time_slot = '_'.join(parts[1:])
-                            classroom = booking.get('classroom', '未知')
-                            
-                        option_text = f"{date_str} {time_slot} 跳台{classroom} - {booking['name']}"
-                        if 'student_id' in booking:
-                            option_text += f" ({booking['student_id']})"
-                        option_text += f" - {booking['class']}"
-                        booking_options.append((option_text, slot_key))
-                    
-                    if booking_options:
-                        selected_booking = st.selectbox(
-                            "选择要删除的预约",
-                            options=[option[0] for option in booking_options],
-                            key="delete_select"
-                        )
-                        
-                        if st.button("🗑️ 删除选中预约", type="secondary", key="delete_single"):
-                            # 找到对应的slot_key
-                            slot_key_to_delete = None
-                            for option_text, slot_key in booking_options:
-                                if option_text == selected_booking:
-                                    slot_key_to_delete = slot_key
-                                    break
-                            
-                            if slot_key_to_delete and slot_key_to_delete in bookings:
-                                deleted_booking = bookings.pop(slot_key_to_delete)
-                                save_bookings(bookings)
-                                st.success(f"✅ 已删除预约：{deleted_booking['name']} 的 {selected_booking}")
-                                st.rerun()
-                    else:
-                        st.info("暂无预约记录可删除")
-                else:
-                    st.info("暂无预约记录")
-                
-                # 清空所有预约
-                st.subheader("🗑️ 清空所有预约")
-                if bookings:
-                    if st.button("🗑️ 清空所有预约", type="secondary", key="clear_all"):
-                        if st.session_state.get('confirm_delete_all', False):
-                            bookings.clear()
-                            save_bookings(bookings)
-                            st.success("✅ 所有预约已清空！")
-                            st.session_state.confirm_delete_all = False
-                            st.rerun()
-                        else:
-                            st.session_state.confirm_delete_all = True
-                            st.warning("⚠️ 请再次点击确认清空所有预约")
-                    
-                    # 取消确认
-                    if st.session_state.get('confirm_delete_all', False):
-                        if st.button("❌ 取消", key="cancel_delete_all"):
-                            st.session_state.confirm_delete_all = False
-                            st.info("已取消操作")
-                else:
-                    st.info("暂无预约记录可清空")
+            filtered_df = filter_records(records_df, date_range, [], clubs, query.strip())
+            shown_df = filtered_df.iloc[:ADMIN_TABLE_LIMIT]
+            if len(filtered_df) > ADMIN_TABLE_LIMIT:
+                st.caption(f"共 {len(filtered_df)} 条匹配，仅显示前 {ADMIN_TABLE_LIMIT} 条，可缩小筛选范围")
+            else:
+                st.caption(f"共 {len(filtered_df)} 条匹配")
             
-            with tab2:
-                st.subheader("🏫 跳台管理")
-                
-                blocked_classrooms = load_blocked_classrooms()
-                
-                # 显示当前状态
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write("**可用跳台：**")
-                    available_classrooms = [c for c in CLASSROOMS if c not in blocked_classrooms]
-                    if available_classrooms:
-                        for classroom in available_classrooms:
-                            st.success(f"✅ 跳台 {classroom}")
-                    else:
-                        st.error("❌ 没有可用跳台")
-                
-                with col2:
-                    st.write("**已屏蔽跳台：**")
-                    if blocked_classrooms:
-                        for classroom in blocked_classrooms:
-                            st.error(f"🚫 跳台 {classroom}")
-                    else:
-                        st.info("没有屏蔽的跳台")
-                
-                st.markdown("---")
-                
-                # 屏蔽跳台
-                st.subheader("🚫 屏蔽跳台")
-                available_to_block = [c for c in CLASSROOMS if c not in blocked_classrooms]
-                if available_to_block:
-                    classroom_to_block = st.selectbox(
-                        "选择要屏蔽的跳台",
-                        options=available_to_block,
-                        format_func=lambda x: f"跳台 {x}",
-                        key="block_select"
-                    )
-                    
-                    if st.button(f"🚫 屏蔽跳台 {classroom_to_block}", type="secondary", key="block_classroom"):
-                        blocked_classrooms.append(classroom_to_block)
-                        save_blocked_classrooms(blocked_classrooms)
-                        st.success(f"✅ 跳台 {classroom_to_block} 已被屏蔽")
-                        st.rerun()
+            # 勾选行得到的是 slot_key，无需再做字符串匹配
+            event = st.dataframe(
+                shown_df,
+                width="stretch",
+                hide_index=True,
+                key="admin_bookings_table",
+                on_select="rerun",
+                selection_mode="multi-row"
+            )
+            selected_keys = [shown_df.index[i] for i in event.selection.rows if i < len(shown_df)]
+            filtered_keys = list(filtered_df.index)
+            # 没有任何筛选条件时"全部筛选结果"就是全部预约，不提供批量取消（清空请使用下方的清空功能）
+            has_filter = bool(query.strip() or date_range or clubs)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button(
+                    f"🗑️ 取消选中的 {len(selected_keys)} 条预约",
+                    type="secondary",
+                    key="cancel_selected",
+                    disabled=not selected_keys,
+                    on_click=cancel_bookings,
+                    args=(selected_keys,)
+                )
+            with col2:
+                st.button(
+                    f"🗑️ 取消全部 {len(filtered_keys)} 条筛选结果",
+                    type="secondary",
+                    key="cancel_filtered",
+                    disabled=not (filtered_keys and has_filter),
+                    help=None if has_filter else "请先设置搜索、日期或俱乐部筛选条件",
+                    on_click=confirm_cancel_filtered,
+                    args=(filtered_keys,)
+                )
+            
+            render_export_section(venue, sorted(records_df["俱乐部"].unique()))
+            
+            # 清空所有预约
+            st.subheader("🗑️ 清空所有预约")
+            st.button("🗑️ 清空所有预约", type="secondary", key="clear_all", on_click=confirm_clear_all)
+            show_message("clear_all")
+            
+            # 取消确认
+            if st.session_state.get('confirm_delete_all', False):
+                if st.button("❌ 取消", key="cancel_delete_all"):
+                    st.session_state.confirm_delete_all = False
+                    st.info("已取消操作")
+        
+        with tab2:
+            st.subheader("🏫 跳台管理")
+            
+            # 显示当前状态
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write("**可用跳台：**")
+                available_classrooms = [c for c in venue.classrooms if c not in blocked_classrooms]
+                if available_classrooms:
+                    for classroom in available_classrooms:
+                        st.success(f"✅ 跳台 {classroom}")
                 else:
-                    st.info("所有跳台都已被屏蔽")
-                
-                # 启用跳台
-                st.subheader("✅ 启用跳台")
+                    st.error("❌ 没有可用跳台")
+            
+            with col2:
+                st.write("**已屏蔽跳台：**")
                 if blocked_classrooms:
-                    classroom_to_unblock = st.selectbox(
-                        "选择要启用的跳台",
-                        options=blocked_classrooms,
-                        format_func=lambda x: f"跳台 {x}",
-                        key="unblock_select"
-                    )
-                    
-                    if st.button(f"✅ 启用跳台 {classroom_to_unblock}", type="primary", key="unblock_classroom"):
-                        blocked_classrooms.remove(classroom_to_unblock)
-                        save_blocked_classrooms(blocked_classrooms)
-                        st.success(f"✅ 跳台 {classroom_to_unblock} 已恢复可用")
-                        st.rerun()
+                    for classroom in blocked_classrooms:
+                        st.error(f"🚫 跳台 {classroom}")
                 else:
-                    st.info("没有被屏蔽的跳台")
-                
-                # 批量操作
-                st.markdown("---")
-                st.subheader("🔄 批量操作")
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("🚫 屏蔽所有跳台", type="secondary", key="block_all"):
-                        if st.session_state.get('confirm_block_all', False):
-                            save_blocked_classrooms(CLASSROOMS.copy())
-                            st.success("✅ 所有跳台已被屏蔽")
-                            st.session_state.confirm_block_all = False
-                            st.rerun()
-                        else:
-                            st.session_state.confirm_block_all = True
-                            st.warning("⚠️ 请再次点击确认屏蔽所有跳台")
-                    
-                    if st.session_state.get('confirm_block_all', False):
-                        if st.button("❌ 取消", key="cancel_block_all"):
-                            st.session_state.confirm_block_all = False
-                            st.info("已取消操作")
-                
-                with col2:
-                    if st.button("✅ 启用所有跳台", type="primary", key="unblock_all"):
-                        save_blocked_classrooms([])
-                        st.success("✅ 所有跳台已恢复可用")
-                        st.rerun()
+                    st.info("没有屏蔽的跳台")
             
-            with tab3:
-                st.subheader("📊 详细统计信息")
-                
-                # 按跳台统计
-                st.write("**各跳台预约情况：**")
-                classroom_stats = {}
-                for classroom in CLASSROOMS:
-                    classroom_bookings = [k for k in bookings.keys() if k.endswith(f"_{classroom}")]
-                    classroom_stats[classroom] = len(classroom_bookings)
-                
-                for classroom, count in classroom_stats.items():
-                    status = "🚫 已屏蔽" if classroom in blocked_classrooms else "✅ 可用"
-                    st.write(f"跳台 {classroom}: {count} 个预约 ({status})")
+            st.markdown("---")
+            
+            # 屏蔽跳台
+            st.subheader("🚫 屏蔽跳台")
+            show_message("block")
+            available_to_block = [c for c in venue.classrooms if c not in blocked_classrooms]
+            if available_to_block:
+                classroom_to_block = st.selectbox(
+                    "选择要屏蔽的跳台",
+                    options=available_to_block,
+                    format_func=lambda x: f"跳台 {x}",
+                    key="block_select"
+                )
                 
-                # 按日期统计
-                st.write("**各日期预约情况：**")
-                date_stats = {}
-                for slot_key in bookings.keys():
-                    date_str = slot_key.split('_')[0]
-                    date_stats[date_str] = date_stats.get(date_str, 0) + 1
+                st.button(
+                    f"🚫 屏蔽跳台 {classroom_to_block}",
+                    type="secondary",
+                    key="block_classroom",
+                    on_click=block_selected_classroom
+                )
+            else:
+                st.info("所有跳台都已被屏蔽")
+            
+            # 启用跳台
+            st.subheader("✅ 启用跳台")
+            show_message("unblock")
+            if blocked_classrooms:
+                classroom_to_unblock = st.selectbox(
+                    "选择要启用的跳台",
+                    options=blocked_classrooms,
+                    format_func=lambda x: f"跳台 {x}",
+                    key="unblock_select"
+                )
                 
-                for date_str, count in sorted(date_stats.items()):
-                    st.write(f"{date_str}: {count} 个预约")
+                st.button(
+                    f"✅ 启用跳台 {classroom_to_unblock}",
+                    type="primary",
+                    key="unblock_classroom",
+                    on_click=unblock_selected_classroom
+                )
+            else:
+                st.info("没有被屏蔽的跳台")
+            
+            # 批量操作
+            st.markdown("---")
+            st.subheader("🔄 批量操作")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("🚫 屏蔽所有跳台", type="secondary", key="block_all", on_click=confirm_block_all)
+                show_message("block_all")
                 
-                # 按时段统计
-                st.write("**各时段预约情况：**")
-                slot_stats = {}
-                for slot_key in bookings.keys():
-                    parts = slot_key.split('_')
-                    if len(parts) >= 3:
-                        time_slot = '_'.join(parts[1:-1])
-                    else:
-                        time_slot = '_'.join(parts[1:])
-                    slot_stats[time_slot] = slot_stats.get(time_slot, 0) + 1
+                if st.session_state.get('confirm_block_all', False):
+                    if st.button("❌ 取消", key="cancel_block_all"):
+                        st.session_state.confirm_block_all = False
+                        st.info("已取消操作")
+            
+            with col2:
+                st.button("✅ 启用所有跳台", type="primary", key="unblock_all", on_click=unblock_all_classrooms)
+                show_message("unblock_all")
+        
+        with tab3:
+            st.subheader("📊 详细统计信息")
+            
+            include_archive = st.checkbox("包含历史归档", key="stats_include_archive")
+            stats = store.get_booking_stats(include_archive=include_archive)
+            
+            col1, col2, col3 = st.columns(3)
+            col1.metric("预约总数", stats.total)
+            col2.metric("包场总人数", stats.headcount)
+            col3.metric("俱乐部数", len(stats.club_counts))
+            
+            # 按跳台统计
+            st.write("**各跳台预约情况：**")
+            for classroom in venue.classrooms:
+                count = stats.classroom_counts.get(classroom, 0)
+                status = "🚫 已屏蔽" if classroom in blocked_classrooms else "✅ 可用"
+                st.write(f"跳台 {classroom}: {count} 个预约 ({status})")
+            
+            # 按星期统计各跳台利用率
+            st.write("**各跳台按星期利用率：**")
+            import pandas as pd
+            utilization = stats.weekday_utilization(venue.slots_per_weekday())
+            st.dataframe(
+                pd.DataFrame(
+                    [[f"{utilization.get((weekday, classroom), 0):.0%}" for weekday in range(7)] for classroom in venue.classrooms],
+                    index=[f"跳台 {classroom}" for classroom in venue.classrooms],
+                    columns=WEEKDAY_NAMES
+                ),
+                width="stretch"
+            )
+            
+            # 按日期统计
+            st.write("**各日期预约情况：**")
+            for date_str, count in sorted(stats.date_counts.items()):
+                st.write(f"{date_str}: {count} 个预约")
+            
+            # 按时段统计
+            st.write("**各时段预约情况：**")
+            for time_slot, count in stats.slot_counts.items():
+                st.write(f"{time_slot}: {count} 个预约")
+            
+            # 按俱乐部统计
+            st.write("**各俱乐部预约情况：**")
+            for club, count in sorted(stats.club_counts.items(), key=lambda item: -item[1]):
+                st.write(f"{club}: {count} 个预约，共 {stats.club_headcounts.get(club, 0)} 人")
+        
+        with tab4:
+            render_performance_tab()
                 
-                for time_slot, count in slot_stats.items():
-                    st.write(f"{time_slot}: {count} 个预约")
-                    
-        elif admin_password:
-            st.error("❌ 密码错误，请输入正确的管理员密码")
-        else:
-            st.info("请输入管理员密码以访问管理功能")
+    elif admin_password:
+        st.error("❌ 密码错误，请输入正确的管理员密码")
+    else:
+        st.info("请输入管理员密码以访问管理功能")
+
+def reset_metrics():
+    """清空性能统计的回调"""
+    metrics.reset()
+    rerun_fragments(ADMIN_FRAGMENT)
+
+def render_performance_tab():
+    """管理员"性能"标签页：各阶段耗时分位数和每次运行的数据文件读写次数"""
+    st.subheader("⏱️ 页面性能")
+    if not metrics.ENABLED:
+        st.info("性能统计未启用。设置环境变量 BOOKING_METRICS=1 后重启应用即可启用（未启用时没有额外开销）。")
+        return
+    
+    import pandas as pd
+    summary = metrics.summary()
+    st.caption(f"耗时为本进程最近 {metrics.WINDOW} 次的分位数，包含内层阶段（如整页运行包含所有片段）")
+    phases = summary["phases"]
+    st.dataframe(
+        pd.DataFrame(
+            [
+                [metrics.PHASE_NAMES.get(name, name), values["count"]]
+                + [f"{values[key] * 1000:.1f}" for key in ("p50", "p90", "p99", "max")]
+                for name, values in phases.items()
+            ],
+            columns=["阶段", "次数", "p50 (ms)", "p90 (ms)", "p99 (ms)", "最大 (ms)"],
+        ),
+        hide_index=True,
+    )
+    
+    st.write("**每次运行的数据文件读写：**")
+    st.dataframe(
+        pd.DataFrame(
+            [
+                [metrics.PHASE_NAMES.get(name, name), values["count"], f"{values['reads']:.1f}", f"{values['writes']:.1f}"]
+                for name, values in summary["runs"].items()
+            ],
+            columns=["运行", "次数", "平均读取", "平均写入"],
+        ),
+        hide_index=True,
+    )
+    st.write(f"启动以来共读取数据文件 {summary['io']['read']} 次，写入 {summary['io']['write']} 次")
+    
+    if metrics.METRICS_FILE:
+        st.caption(f"统计每 {metrics.METRICS_FILE_INTERVAL} 秒写入 {metrics.METRICS_FILE}（Prometheus 文本格式）")
+    with st.expander("Prometheus 文本格式"):
+        st.code(metrics.prometheus_text(), language="text")
+    st.button("清空统计", on_click=reset_metrics, key="reset_metrics")
+
+@metrics.timed("page")
+def main():
+    st.title("🎿 JFdryski  尖锋旱雪跳台包场预约系统")
+    st.markdown("暂定一个星期，之后根据需要再进行调整")
+    
+    # 场地选择（只配置了一个场地时不显示）；切换场地时整页重新运行
+    venue = current_venue()
+    if len(VENUES) > 1:
+        with st.sidebar:
+            st.selectbox(
+                "场地",
+                options=list(VENUES),
+                index=list(VENUES).index(venue.id),
+                format_func=lambda venue_id: VENUES[venue_id].name,
+                key="venue_selector",
+                on_change=switch_venue
+            )
+    store = venue.store
+    
+    # 每天第一次运行时将今天之前的预约移入历史归档
+    store.archive_past_bookings()
+    
+    # 整页运行时所有片段都读取最新数据
+    st.session_state.seen_data_version = store.get_data_version()
+    st.session_state.seen_blocked_version = store.get_blocked_version()
+    
+    with st.sidebar:
+        render_booking_sidebar()
+    
+    render_schedule_grid()
+    render_booking_records()
+    render_admin_panel()
+    watch_data_versions()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -0,0 +1 @@
+"""性能基准测试与模拟数据生成（python -m bench.run）"""
@@ -0,0 +1,117 @@
+"""生成模拟的预约历史数据
+
+按真实数据的特点生成：俱乐部（少数几家占大多数预约）由同一位联系人在一分钟内
+连续预约同一天的多个时段、多个跳台；周末和晚上更满；booking_time 早于预约日期几天。
+每天最多 len(TIME_SLOTS) × len(CLASSROOMS) 条预约，数据量大时日期会向前延伸很多年。
+
+    python -m bench.generate 100000 --out /tmp/booking-data
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+
+from core import TIME_SLOTS, CLASSROOMS
+
+# 模拟的俱乐部名称（靠前的俱乐部预约更多）
+CLUBS = ["丹翔", "飞雪", "尖锋", "雪豹", "凌云", "极光", "雪狐", "腾跃", "北极星", "白桦", "松风", "山鹰"]
+
+SURNAMES = "张王李赵刘陈杨黄周吴徐孙马朱胡郭何林罗高"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚"
+
+def make_contacts(rng):
+    """每个俱乐部一到三位联系人"""
+    contacts = {}
+    for club in CLUBS:
+        contacts[club] = [
+            {
+                "name": rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES) + rng.choice(["", rng.choice(GIVEN_NAMES)]),
+                "student_id": f"{rng.randrange(10000):04d}",
+                "class": club,
+                "phone": f"1{rng.choice('3578')}{rng.randrange(10 ** 9):09d}",
+            }
+            for _ in range(rng.randint(1, 3))
+        ]
+    return contacts
+
+def generate_day(rng, date, contacts, club_weights):
+    """生成一天的预约 [(booking_time, slot_key, booking)]"""
+    slot_names = list(TIME_SLOTS)
+    weekend = date.weekday() >= 5
+    occupancy = 0.8 if weekend else 0.45
+    cells = []
+    for slot_idx, time_slot in enumerate(slot_names):
+        # 晚上的时段更满
+        slot_occupancy = min(1.0, occupancy * (1.3 if slot_idx >= len(slot_names) - 2 else 1.0))
+        for classroom in CLASSROOMS:
+            if rng.random() < slot_occupancy:
+                cells.append((time_slot, classroom))
+
+    entries = []
+    date_str = date.strftime('%Y-%m-%d')
+    # 按俱乐部分组：每个俱乐部一次连续预约 1-6 个格子
+    rng.shuffle(cells)
+    pos = 0
+    while pos < len(cells):
+        session = cells[pos:pos + rng.randint(1, 6)]
+        pos += len(session)
+        club = rng.choices(CLUBS, weights=club_weights)[0]
+        contact = rng.choice(contacts[club])
+        reason = str(rng.randint(2, 20))
+        booking_time = datetime.datetime.combine(date, datetime.time(rng.randint(7, 23), rng.randrange(60), rng.randrange(60)))
+        booking_time -= datetime.timedelta(days=rng.randint(0, 6))
+        for time_slot, classroom in session:
+            booking_time += datetime.timedelta(seconds=rng.randint(3, 15))
+            booking = dict(contact, reason=reason, classroom=classroom,
+                           booking_time=booking_time.strftime('%Y-%m-%d %H:%M:%S'))
+            entries.append((booking["booking_time"], f"{date_str}_{time_slot}_{classroom}", booking))
+    return entries
+
+def generate_bookings(count, end_date=None, seed=0):
+    """生成 count 条预约 {slot_key: 预约信息}，按 booking_time 排序（与真实文件的写入顺序一致）
+
+    日期从 end_date（默认为今天起第7天，即覆盖当前可预约的一周）向前延伸。
+    """
+    rng = random.Random(seed)
+    end_date = end_date or datetime.date.today() + datetime.timedelta(days=6)
+    contacts = make_contacts(rng)
+    club_weights = [1 / (rank + 1) for rank in range(len(CLUBS))]
+
+    entries = []
+    date = end_date
+    while len(entries) < count:
+        entries.extend(generate_day(rng, date, contacts, club_weights))
+        date -= datetime.timedelta(days=1)
+    # 最早的一天可能超出，只保留最近的 count 条（按日期）
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    entries = entries[:count]
+    entries.sort(key=lambda entry: entry[0])
+    return {slot_key: booking for _, slot_key, booking in entries}
+
+def write_dataset(directory, count, blocked=("14m",), seed=0, end_date=None):
+    """在 directory 下写入 bookings.json 和 blocked_classrooms.json，返回生成的预约数据
+
+    end_date 为最后一天（默认同 generate_bookings）。
+    """
+    bookings = generate_bookings(count, end_date=end_date, seed=seed)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "bookings.json"), 'w', encoding='utf-8') as f:
+        json.dump(bookings, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(directory, "blocked_classrooms.json"), 'w', encoding='utf-8') as f:
+        json.dump(list(blocked), f, ensure_ascii=False, indent=2)
+    return bookings
+
+def main():
+    parser = argparse.ArgumentParser(description="生成模拟的预约历史数据")
+    parser.add_argument("count", type=int, help="预约条数，如 1000、1000000")
+    parser.add_argument("--out", default=".", help="输出目录（默认当前目录）")
+    parser.add_argument("--blocked", nargs="*", default=["14m"], help="屏蔽的跳台")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    bookings = write_dataset(args.out, args.count, args.blocked, args.seed)
+    dates = sorted(slot_key[:10] for slot_key in bookings)
+    print(f"已生成 {len(bookings)} 条预约（{dates[0]} 至 {dates[-1]}）→ {os.path.abspath(args.out)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+"""并发负载测试
+
+模拟多个用户同时使用页面：每个用户会话打开页面、点击日程表中的时段、选择跳台并
+提交预约表单；管理员会话登录后按电话查找并取消用户的预约。所有会话同时开始，
+结束后报告各步骤耗时的分位数和吞吐量，并检查最终数据：
+
+- 丢失：用户被告知预约成功、也没有被管理员取消，但数据中没有这条预约；
+- 重复：同一时段同一跳台有两个会话都被告知预约成功（且都没有被取消）；
+- 未告知的写入：数据中有用户未被告知成功的预约；
+- 取消未生效：管理员被告知已取消，但预约仍在；
+- 占用位图与预约数据不一致，以及数据文件损坏（JSON 无法解析、日志有残缺的行、
+  SQLite integrity_check 不通过）。
+
+每个高峰季前运行一次，发现任何问题时以状态 1 退出：
+
+    python -m bench.load                                      # 20 个用户、1 个管理员，AppTest，JSON 后端
+    python -m bench.load --sessions 40 --backend sqlite
+    python -m bench.load --driver storage --sessions 200 --processes 4
+
+两种驱动方式：
+
+- apptest：每个会话在单独的进程中通过 Streamlit AppTest 运行完整的页面代码
+  （AppTest 不能在同一进程的多个线程中同时运行）。AppTest 的每次操作都是整页
+  运行，期间其他会话写入了数据时，页面的版本轮询会立即再整页刷新一次，提交结果
+  的提示随之消失（浏览器中提交表单只重新运行侧边栏片段，不受影响）：这类提交
+  记为"无提示"，按最终数据判断是否预约成功；
+- storage：直接调用页面使用的 core.py 函数，每个进程中多个线程，与 streamlit
+  在一个进程内服务多个会话的方式相同，可以模拟更多的会话。
+
+数据在临时目录中：先生成 --size 条截至昨天的历史预约，可预约范围内为空；用户
+集中预约最近 --hot-days 天，制造同一时段的争抢。
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench.run import REPO_ROOT, pad, format_seconds
+
+APP_FILE = os.path.join(REPO_ROOT, "app.py")
+
+APPTEST_TIMEOUT = 600
+
+# 压测会话使用的电话前缀（生成的历史数据中不会出现），据此识别压测写入的预约
+LOAD_PHONE_PREFIX = "199"
+
+# 与页面日程表每页的天数相同
+GRID_DAYS = 7
+
+# 管理员找不到可取消的预约时，等待后换一个用户重试的间隔（秒）和每次取消最多的尝试次数
+ADMIN_RETRY_SECONDS = 0.2
+ADMIN_RETRIES = 25
+
+# 每个工作进程最多保留的错误信息条数
+MAX_ERRORS = 20
+
+# 报告中步骤的顺序
+STEP_NAMES = ["打开页面", "切换视图", "点击日程表", "选择跳台", "提交预约", "刷新日程表",
+              "管理员登录", "管理员查询", "管理员取消"]
+
+OUTCOME_NAMES = ["成功", "冲突", "无空闲", "无提示", "错误"]
+
+# 侧边栏中所选时段的状态提示（不是提交结果）
+SIDEBAR_STATUS_TEXTS = ("该时段有", "该时段所有跳台已被预约", "暂无可用跳台")
+
+READY_LINE = "ready"
+
+def session_phone(n):
+    return f"{LOAD_PHONE_PREFIX}{n:08d}"
+
+def booking_info(n, attempt, rng):
+    """第 n 个会话第 attempt 次预约填写的信息（姓名唯一标识这一次预约）"""
+    return {
+        "name": f"压测{n}-{attempt}",
+        "student_id": f"{n % 10000:04d}",
+        "class": f"压测俱乐部{n % 5}",
+        "phone": session_phone(n),
+        "reason": str(rng.randint(1, 20)),
+    }
+
+def percentile(sorted_values, fraction):
+    """最近秩法分位数"""
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+class Recorder:
+    """一个工作进程内的测量结果（各会话线程共用）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}                             # {步骤: [耗时]}
+        self.outcomes = dict.fromkeys(OUTCOME_NAMES, 0)
+        self.booked = []                                # [(slot_key, 姓名)] 被告知预约成功
+        self.unconfirmed = []                           # [(slot_key, 姓名)] 提交后没有看到结果
+        self.cancelled = []                             # [(slot_key, 姓名)] 被告知已取消
+        self.errors = []
+
+    @contextlib.contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+
+    def outcome(self, kind, slot_key=None, name=None, message=None):
+        with self.lock:
+            self.outcomes[kind] += 1
+            if kind == "成功":
+                self.booked.append((slot_key, name))
+            elif kind == "无提示":
+                self.unconfirmed.append((slot_key, name))
+        if message is not None:
+            self.error(message)
+
+    def error(self, message):
+        with self.lock:
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append(message)
+
+    def to_json(self, elapsed):
+        return {
+            "latencies": self.latencies,
+            "outcomes": self.outcomes,
+            "booked": self.booked,
+            "unconfirmed": self.unconfirmed,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+            "elapsed": elapsed,
+        }
+
+def think(rng, config):
+    if config["think"]:
+        time.sleep(rng.uniform(0, config["think"]))
+
+# ---------- AppTest 驱动 ----------
+
+def check_page(at):
+    if at.exception:
+        raise RuntimeError(f"页面运行出错：{at.exception[0].message}")
+
+def free_grid_buttons(at, hot_days):
+    """日程表按钮视图中前 hot_days 天还有空闲跳台的时段按钮"""
+    buttons = []
+    for button in at.button:
+        if not (button.key or "").startswith("btn_") or button.disabled:
+            continue
+        date_idx = int(button.key.split("_")[1])
+        if date_idx < hot_days and button.label.startswith(("✅", "⚠️")):
+            buttons.append(button)
+    return buttons
+
+def apptest_user(recorder, config, n):
+    from streamlit.testing.v1 import AppTest
+    from core import get_venue, make_slot_key
+    rng = random.Random(f"{config['seed']}-{n}")
+    venue = get_venue()
+    with recorder.step("打开页面"):
+        at = AppTest.from_file(APP_FILE, default_timeout=APPTEST_TIMEOUT).run()
+    check_page(at)
+    with recorder.step("切换视图"):
+        at.radio(key="grid_view").set_value("按钮").run()
+    check_page(at)
+    for attempt in range(config["bookings"]):
+        think(rng, config)
+        buttons = free_grid_buttons(at, config["hot_days"])
+        if not buttons:
+            recorder.outcome("无空闲")
+            continue
+        with recorder.step("点击日程表"):
+            rng.choice(buttons).click().run()
+        check_page(at)
+        # 刚点击的时段可能已经被其他会话约满
+        classroom = at.selectbox(key="classroom_selector")
+        if not classroom.options:
+            recorder.outcome("无空闲")
+            continue
+        # options 是显示文本；AppTest 的 select_index 会再套一次 format_func，按跳台取值选择
+        choices = [value for value in venue.classrooms if f"跳台 {value}" in classroom.options]
+        with recorder.step("选择跳台"):
+            classroom.set_value(rng.choice(choices)).run()
+        check_page(at)
+        if at.selectbox(key="classroom_selector").value is None:
+            recorder.outcome("无空闲")
+            continue
+
+        target = (at.selectbox(key="date_selector").value.strftime('%Y-%m-%d'),
+                  at.selectbox(key="slot_selector").value, at.selectbox(key="classroom_selector").value)
+        info = booking_info(n, attempt, rng)
+        for field, value in info.items():
+            widget = at.text_area if field == "reason" else at.text_input
+            widget(key=f"booking_{field}").input(value)
+        submit = next(button for button in at.sidebar.button if button.label.startswith("确认预约"))
+        with recorder.step("提交预约"):
+            submit.click().run()
+        check_page(at)
+        messages = [element.value for element in list(at.sidebar.success) + list(at.sidebar.error)
+                    if not any(text in element.value for text in SIDEBAR_STATUS_TEXTS)]
+        if any("预约成功" in message for message in messages):
+            recorder.outcome("成功", make_slot_key(*target), info["name"])
+        elif any("刚刚被其他组织预约" in message for message in messages):
+            recorder.outcome("冲突")
+        elif not messages:
+            recorder.outcome("无提示", make_slot_key(*target), info["name"])
+        else:
+            recorder.outcome("错误", message=f"会话 {n} 预约 {target} 后的提示：{messages}")
+
+def apptest_admin(recorder, config, n):
+    from streamlit.testing.v1 import AppTest
+    from core import ADMIN_PASSWORD
+    rng = random.Random(f"{config['seed']}-{n}")
+    with recorder.step("打开页面"):
+        at = AppTest.from_file(APP_FILE, default_timeout=APPTEST_TIMEOUT).run()
+    check_page(at)
+    with recorder.step("管理员登录"):
+        at.text_input(key="admin_pwd").input(ADMIN_PASSWORD).run()
+    check_page(at)
+    for _ in range(config["admin_deletes"]):
+        for _ in range(ADMIN_RETRIES):
+            time.sleep(ADMIN_RETRY_SECONDS)
+            phone = session_phone(rng.choice(config["user_sessions"]))
+            with recorder.step("管理员查询"):
+                at.text_input(key="admin_query").input(phone).run()
+            check_page(at)
+            if at.button(key="cancel_filtered").disabled:
+                continue
+            # 第一次点击要求确认；确认时取消的是此时表格中的预约（索引为 slot_key）
+            at.button(key="cancel_filtered").click().run()
+            check_page(at)
+            table = next(element for element in at.dataframe if element.key == "admin_bookings_table").value
+            with recorder.step("管理员取消"):
+                at.button(key="cancel_filtered").click().run()
+            check_page(at)
+            # 取消后确认状态被清除；表格在两次点击之间变化时需要再次确认，这次不算
+            # （不看提示：与用户提交一样，提示可能被版本轮询的整页刷新清除）
+            if "confirm_cancel_filtered" not in at.session_state:
+                with recorder.lock:
+                    recorder.cancelled += [(slot_key, name) for slot_key, name in zip(table.index, table["姓名"])]
+                break
+
+# ---------- storage 驱动 ----------
+
+def load_grid(venue):
+    """与页面相同：读取本周的占用位图和预约，计算日程表"""
+    import core
+    week = venue.bookable_dates()[:GRID_DAYS]
+    occupancy = venue.read_occupancy(week[0], len(week))
+    index = core.BookingIndex(venue.store.load_bookings(week[0].strftime('%Y-%m-%d'), week[-1].strftime('%Y-%m-%d')))
+    return week, core.compute_schedule_grid(venue, occupancy, week, index=index)
+
+def storage_user(recorder, config, n):
+    import core
+    rng = random.Random(f"{config['seed']}-{n}")
+    venue = core.get_venue()
+    with recorder.step("打开页面"):
+        week, grid = load_grid(venue)
+    for attempt in range(config["bookings"]):
+        think(rng, config)
+        cells = [
+            (date, time_slot)
+            for date_idx, date in enumerate(week[:config["hot_days"]])
+            for slot_idx, time_slot in enumerate(venue.time_slots)
+            if grid["states"][date_idx, slot_idx] in ("可预约", "部分可约")
+        ]
+        if not cells:
+            recorder.outcome("无空闲")
+            continue
+        date, time_slot = rng.choice(cells)
+        date_str = date.strftime('%Y-%m-%d')
+        with recorder.step("点击日程表"):
+            available = core.get_available_classrooms(venue, venue.read_occupancy(date), date_str, time_slot)
+        if not available:
+            recorder.outcome("无空闲")
+            continue
+
+        target = (date_str, time_slot, rng.choice(available))
+        info = booking_info(n, attempt, rng)
+        with recorder.step("提交预约"):
+            error = core.validate_booking(venue, info, [target])
+            taken = core.book_targets(venue, info, [target]) if error is None else None
+        if error is not None:
+            recorder.outcome("错误", message=f"会话 {n} 预约 {core.format_target(target)}：{error}")
+        elif taken:
+            recorder.outcome("冲突")
+        else:
+            recorder.outcome("成功", core.make_slot_key(*target), info["name"])
+        with recorder.step("刷新日程表"):
+            week, grid = load_grid(venue)
+
+def storage_admin(recorder, config, n):
+    import core
+    rng = random.Random(f"{config['seed']}-{n}")
+    store = core.get_venue().store
+    for _ in range(config["admin_deletes"]):
+        for _ in range(ADMIN_RETRIES):
+            time.sleep(ADMIN_RETRY_SECONDS)
+            phone = session_phone(rng.choice(config["user_sessions"]))
+            with recorder.step("管理员查询"):
+                found = store.find_bookings_by_phone(phone)
+            if not found:
+                continue
+            with recorder.step("管理员取消"):
+                store.delete_bookings(list(found))
+            with recorder.lock:
+                recorder.cancelled += [(slot_key, booking.get('name')) for slot_key, booking in found.items()]
+            break
+
+SESSION_FUNCTIONS = {
+    ("apptest", "user"): apptest_user,
+    ("apptest", "admin"): apptest_admin,
+    ("storage", "user"): storage_user,
+    ("storage", "admin"): storage_admin,
+}
+
+def run_session(recorder, config, kind, n):
+    try:
+        SESSION_FUNCTIONS[config["driver"], kind](recorder, config, n)
+    except Exception as exc:
+        recorder.error(f"{'管理员' if kind == 'admin' else ''}会话 {n} 出错：{exc!r}")
+
+# ---------- 工作进程 ----------
+
+def worker_setup(config):
+    """生成截至昨天的历史预约（可预约范围内为空）"""
+    from bench.generate import write_dataset
+    write_dataset(".", config["size"], seed=config["seed"], end_date=datetime.date.today() - datetime.timedelta(days=1))
+    return {}
+
+def worker_sessions(config):
+    """运行分配给本进程的会话：准备好后输出 READY_LINE，等标准输入的一行后同时开始"""
+    import core  # 导入和读取场地配置不计入测量
+    if config["driver"] == "apptest":
+        from streamlit.testing.v1 import AppTest
+    recorder = Recorder()
+    threads = [threading.Thread(target=run_session, args=(recorder, config, kind, n))
+               for kind, n in config["assigned"]]
+    print(READY_LINE, flush=True)
+    sys.stdin.readline()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.to_json(time.perf_counter() - start)
+
+def check_files(venue):
+    """检查数据文件能否完整解析，返回问题列表"""
+    import sqlite3
+    import storage
+    problems = []
+    def path(name):
+        return os.path.join(venue.data_dir, name)
+    json_files = [path(storage.BLOCKED_CLASSROOMS_FILE)]
+    if storage.STORAGE_BACKEND == "sqlite":
+        with contextlib.closing(sqlite3.connect(path(storage.SQLITE_FILE))) as connection:
+            result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            problems.append(f"{storage.SQLITE_FILE}：{result}")
+    else:
+        json_files.append(path(storage.DATA_FILE))
+        journal_file = path(storage.JOURNAL_FILE)
+        if os.path.exists(journal_file):
+            with open(journal_file, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            # 最后一个换行之后应当没有内容，否则是写了一半的行
+            bad_lines = sum(1 for line in lines[:-1] if not _parses(line)) + bool(lines[-1])
+            if bad_lines:
+                problems.append(f"{storage.JOURNAL_FILE}：{bad_lines} 行无法解析")
+    for file in json_files:
+        if os.path.exists(file):
+            with open(file, 'r', encoding='utf-8') as f:
+                if not _parses(f.read()):
+                    problems.append(f"{os.path.basename(file)}：无法解析")
+    return problems
+
+def _parses(text):
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+def worker_check(config):
+    """读取最终数据：压测写入的预约、占用位图与预约数据的差异、文件损坏"""
+    import core
+    from storage import parse_slot_key
+    venue = core.get_venue()
+    bookings = venue.store.load_bookings()
+    stored = {slot_key: booking.get('name') for slot_key, booking in bookings.items()
+              if str(booking.get('phone', '')).startswith(LOAD_PHONE_PREFIX)}
+
+    # 可预约范围内每个开放时段：占用位图中的已预约跳台应与预约数据一致
+    dates = venue.bookable_dates()
+    expected = {}
+    for slot_key, booking in bookings.items():
+        date_str, time_slot, classroom = parse_slot_key(slot_key, booking)
+        expected.setdefault((date_str, time_slot), set()).add(classroom)
+    occupancy = venue.read_occupancy(dates[0], len(dates))
+    mismatches = 0
+    for date in dates:
+        for time_slot in venue.time_slots_for(date):
+            booked = expected.get((date.strftime('%Y-%m-%d'), time_slot), set())
+            if set(occupancy.booked(date, time_slot)) != booked:
+                mismatches += 1
+    return {"stored": stored, "occupancy_mismatches": mismatches, "corrupt": check_files(venue)}
+
+WORKERS = {"setup": worker_setup, "sessions": worker_sessions, "check": worker_check}
+
+# ---------- 主进程 ----------
+
+def worker_command(mode, config):
+    return [sys.executable, "-m", "bench.load", "--worker", mode, "--config", json.dumps(config, ensure_ascii=False)]
+
+def run_worker(mode, config, workdir, env):
+    """运行一个不需要同步开始的工作进程，返回其结果"""
+    completed = subprocess.run(worker_command(mode, config), cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{mode} 运行失败：\n{completed.stderr}")
+    # 结果在标准输出的最后一行（Streamlit 可能在前面输出日志）
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def assign_sessions(args):
+    """把会话分配到工作进程：[[(类型, 会话编号)]]（管理员的编号排在用户之后）"""
+    sessions = [("user", n) for n in range(args.sessions)] + [("admin", args.sessions + n) for n in range(args.admins)]
+    if args.driver == "apptest":
+        return [[session] for session in sessions]
+    processes = max(1, min(args.processes, len(sessions)))
+    return [sessions[i::processes] for i in range(processes)]
+
+def run_sessions(args, workdir, env):
+    """启动全部工作进程，都准备好后同时开始，返回 (各进程的结果, 总耗时)"""
+    base = {
+        "driver": args.driver,
+        "bookings": args.bookings,
+        "hot_days": args.hot_days,
+        "think": args.think,
+        "admin_deletes": args.admin_deletes,
+        "seed": args.seed,
+        "user_sessions": list(range(args.sessions)),
+    }
+    processes = []
+    try:
+        for i, assigned in enumerate(assign_sessions(args)):
+            log = open(os.path.join(workdir, f"worker-{i}.log"), 'w+', encoding='utf-8')
+            process = subprocess.Popen(worker_command("sessions", dict(base, assigned=assigned)), cwd=os.path.join(workdir, "data"),
+                                       env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=log, text=True)
+            processes.append((process, log))
+        for process, log in processes:
+            for line in process.stdout:
+                if line.strip() == READY_LINE:
+                    break
+        start = time.perf_counter()
+        for process, _ in processes:
+            process.stdin.write("go\n")
+            process.stdin.close()
+        outputs = [process.stdout.read() for process, _ in processes]
+        for process, _ in processes:
+            process.wait()
+        elapsed = time.perf_counter() - start
+        results = []
+        for (process, log), output in zip(processes, outputs):
+            if process.returncode != 0 or not output.strip():
+                log.seek(0)
+                raise RuntimeError(f"工作进程运行失败：\n{log.read()}")
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        return results, elapsed
+    finally:
+        for process, log in processes:
+            if process.poll() is None:
+                process.kill()
+            log.close()
+
+def merge_results(results):
+    merged = {"latencies": {}, "outcomes": dict.fromkeys(OUTCOME_NAMES, 0),
+              "booked": [], "unconfirmed": [], "cancelled": [], "errors": []}
+    for result in results:
+        for name, values in result["latencies"].items():
+            merged["latencies"].setdefault(name, []).extend(values)
+        for kind, count in result["outcomes"].items():
+            merged["outcomes"][kind] += count
+        for key in ("booked", "unconfirmed", "cancelled", "errors"):
+            merged[key] += result[key]
+    return merged
+
+def verify_bookings(booked, unconfirmed, cancelled, stored):
+    """对照各会话被告知的结果和最终数据，返回 {问题: 条数}
+
+    没有看到结果的提交（unconfirmed）在最终数据中存在时按预约成功计算。
+    """
+    booked = [tuple(item) for item in booked]
+    booked += [tuple(item) for item in unconfirmed if stored.get(item[0]) == item[1]]
+    cancelled = {tuple(item) for item in cancelled}
+    owners = {}
+    for slot_key, name in booked:
+        owners.setdefault(slot_key, []).append(name)
+    double = lost = 0
+    for slot_key, names in owners.items():
+        live = [name for name in names if (slot_key, name) not in cancelled]
+        double += max(len(live) - 1, 0)
+        if live and stored.get(slot_key) not in live:
+            lost += 1
+    booked = set(booked)
+    return {
+        "丢失": lost,
+        "重复": double,
+        "未告知的写入": sum(1 for item in stored.items() if item not in booked),
+        "取消未生效": sum(1 for slot_key, name in cancelled if stored.get(slot_key) == name),
+    }
+
+def report(args, merged, elapsed, check):
+    """打印结果，返回是否发现问题"""
+    driver = "AppTest" if args.driver == "apptest" else "直接调用"
+    print(f"\n== {args.sessions} 个用户、{args.admins} 个管理员同时操作（{driver}，{args.backend} 后端）==")
+    print(pad("步骤", 14, left=True) + "".join(pad(title, 12) for title in ["次数", "p50", "p90", "p99", "最大"]))
+    latencies = merged["latencies"]
+    operations = 0
+    for name in STEP_NAMES + sorted(set(latencies) - set(STEP_NAMES)):
+        values = sorted(latencies.get(name, []))
+        if not values:
+            continue
+        operations += len(values)
+        columns = [str(len(values))] + [format_seconds(percentile(values, fraction)) for fraction in (0.5, 0.9, 0.99)]
+        print(pad(name, 14, left=True) + "".join(pad(column, 12) for column in columns + [format_seconds(values[-1])]))
+
+    outcomes = merged["outcomes"]
+    print(f"\n预约：尝试 {sum(outcomes.values())} 次，" + "，".join(f"{kind} {outcomes[kind]}" for kind in OUTCOME_NAMES)
+          + f"；管理员取消 {len(merged['cancelled'])} 条")
+    print(f"吞吐：{operations / elapsed:.1f} 次操作/秒，{outcomes['成功'] / elapsed:.1f} 条预约/秒（总耗时 {format_seconds(elapsed)}）")
+
+    problems = verify_bookings(merged["booked"], merged["unconfirmed"], merged["cancelled"], check["stored"])
+    problems["占用位图不一致"] = check["occupancy_mismatches"]
+    print("数据检查：" + "，".join(f"{name} {count}" for name, count in problems.items())
+          + "，文件损坏 " + ("；".join(check["corrupt"]) or "无"))
+    for message in merged["errors"]:
+        print(f"  错误：{message}")
+    return bool(any(problems.values()) or check["corrupt"] or merged["errors"] or outcomes["错误"])
+
+def main():
+    parser = argparse.ArgumentParser(description="预约系统并发负载测试")
+    parser.add_argument("--sessions", type=int, default=20, help="同时预约的用户会话数")
+    parser.add_argument("--admins", type=int, default=1, help="同时取消预约的管理员会话数")
+    parser.add_argument("--driver", choices=["apptest", "storage"], default="apptest", help="会话的驱动方式")
+    parser.add_argument("--processes", type=int, default=4, help="storage 驱动的工作进程数（apptest 每个会话一个进程）")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json", help="存储后端")
+    parser.add_argument("--size", type=int, default=1000, help="预先生成的历史预约条数")
+    parser.add_argument("--bookings", type=int, default=3, help="每个用户预约的次数")
+    parser.add_argument("--hot-days", type=int, default=2, help="用户集中预约的最近天数")
+    parser.add_argument("--admin-deletes", type=int, default=3, help="每个管理员取消的次数")
+    parser.add_argument("--think", type=float, default=0.0, help="用户两次预约之间随机等待的最长秒数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="保留临时数据目录")
+    parser.add_argument("--worker", choices=list(WORKERS), help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(WORKERS[args.worker](json.loads(args.config)), ensure_ascii=False))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="booking-load-")
+    try:
+        data_dir = os.path.join(workdir, "data")
+        os.makedirs(data_dir)
+        env = dict(os.environ, BOOKING_STORAGE=args.backend, PYTHONPATH=REPO_ROOT)
+        run_worker("setup", {"size": args.size, "seed": args.seed}, data_dir, env)
+        results, elapsed = run_sessions(args, workdir, env)
+        check = run_worker("check", {}, data_dir, env)
+        failed = report(args, merge_results(results), elapsed, check)
+    finally:
+        if args.keep:
+            print(f"\n数据保留在 {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
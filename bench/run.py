@@ -0,0 +1,231 @@
+"""性能基准测试
+
+对每个数据规模，在临时目录中生成模拟历史数据（见 bench/generate.py），然后测量：
+整体保存与加载、本周数据读取、日程表计算、按占用位图查询可用跳台、统计、单条预约写入、
+多个会话同时预约、历史归档，
+以及通过 Streamlit AppTest 运行整个页面。每项报告最快耗时和峰值内存
+（tracemalloc 统计的 Python 内存分配），并与 bench/baseline.json 中保存的基线比较。
+
+    python -m bench.run                          # 默认规模 1k、10k、100k
+    python -m bench.run --sizes 1000 1000000
+    python -m bench.run --backend sqlite
+    python -m bench.run --save-baseline          # 用本次结果更新基线
+    python -m bench.run --backend json sqlite --save-baseline   # 同一次运行中记录两种后端的基线
+
+每个规模在单独的子进程中运行，互不影响缓存和内存统计。基线与机器有关，
+更换机器后应先在变更前运行一次 --save-baseline。
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unicodedata
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE_FILE = os.path.join(REPO_ROOT, "bench", "baseline.json")
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# 并发预约基准：同时提交的会话数和每个会话的预约次数
+BURST_SESSIONS = 20
+BURST_REQUESTS = 5
+
+# 比基线慢超过该比例（且绝对差值超过 MIN_REGRESSION_SECONDS）时视为性能退化
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.002
+
+def measure(func, setup=None, repeat=3):
+    """预热一次后运行 repeat 次取最快耗时，再在 tracemalloc 下运行一次取峰值内存（MB）
+
+    预热的一次不计时：首次调用要付出延迟导入（numpy 等）和建立占用位图等一次性开销，
+    repeat 较小时会被误报为退化。
+    """
+    if setup is not None:
+        setup()
+    func()
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(timings), "median": statistics.median(timings), "peak_mb": peak / 1024 / 1024}
+
+def run_benchmarks(size, repeat, apptest):
+    """在当前目录中生成数据并运行全部基准，返回 {名称: 结果}"""
+    from bench.generate import write_dataset
+    import storage
+    import core
+
+    bookings = write_dataset(".", size)
+    today = datetime.date.today()
+    venue = core.get_venue()
+    store = venue.store
+    week_dates = venue.bookable_dates()[:7]
+    week_start, week_end = week_dates[0].strftime('%Y-%m-%d'), week_dates[-1].strftime('%Y-%m-%d')
+    results = {}
+
+    def restore():
+        # 恢复到生成的完整历史（所有预约都是热数据）
+        store.save_bookings(bookings)
+
+    results["save_bookings"] = measure(lambda: store.save_bookings(bookings), repeat=repeat)
+    # 冷加载：新建分区，没有进程内缓存
+    results["load_bookings 冷加载"] = measure(lambda: storage.Partition(venue.data_dir).load_bookings(), repeat=repeat)
+    store.load_bookings()
+    results["load_bookings 缓存"] = measure(store.load_bookings, repeat=repeat)
+    store.load_bookings(week_start, week_end)
+    results["load_bookings 本周"] = measure(lambda: store.load_bookings(week_start, week_end), repeat=repeat)
+
+    def grid():
+        occupancy = venue.read_occupancy(week_dates[0], len(week_dates))
+        index = core.BookingIndex(store.load_bookings(week_start, week_end))
+        core.compute_schedule_grid(venue, occupancy, week_dates, index=index)
+    results["日程表计算"] = measure(grid, repeat=repeat)
+    results["可用跳台 位图"] = measure(
+        lambda: core.get_available_classrooms(venue, venue.read_occupancy(week_dates[0]), week_start, next(iter(venue.time_slots))),
+        repeat=repeat)
+
+    results["统计 重建"] = measure(lambda: storage.BookingStats(store.load_bookings()), repeat=repeat)
+    store.get_booking_stats()
+    results["统计 增量"] = measure(store.get_booking_stats, repeat=repeat)
+
+    counter = iter(range(10 ** 9))
+    def reserve():
+        n = next(counter)
+        slot_key = f"2999-{n // 28 % 12 + 1:02d}-{n // 336 % 28 + 1:02d}_{list(core.TIME_SLOTS)[n % 7]}_{core.CLASSROOMS[n // 7 % 4]}"
+        store.reserve_booking(slot_key, dict(next(iter(bookings.values())), classroom=slot_key.rsplit('_', 1)[1]))
+    results["reserve_booking"] = measure(reserve, repeat=max(repeat, 20))
+
+    def reserve_burst():
+        # 开放新一天时多个会话同时提交：各线程的请求由写入线程合并写入
+        threads = [threading.Thread(target=lambda: [reserve() for _ in range(BURST_REQUESTS)]) for _ in range(BURST_SESSIONS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    results[f"并发预约 {BURST_SESSIONS}×{BURST_REQUESTS}"] = measure(reserve_burst, repeat=repeat)
+
+    def restore_for_archive():
+        restore()
+        shutil.rmtree(store.archive_dir, ignore_errors=True)
+    results["归档"] = measure(lambda: store.archive_bookings_before(today.strftime('%Y-%m-%d')),
+                            setup=restore_for_archive, repeat=repeat)
+
+    if apptest:
+        from streamlit.testing.v1 import AppTest
+        app_file = os.path.join(REPO_ROOT, "app.py")
+        # 归档已完成：页面只读取今天及以后的热数据，历史在归档中
+        results["页面 新会话"] = measure(lambda: AppTest.from_file(app_file, default_timeout=600).run(), repeat=repeat)
+        session = AppTest.from_file(app_file, default_timeout=600).run()
+        results["页面 重新运行"] = measure(session.run, repeat=repeat)
+        if session.exception:
+            raise RuntimeError(f"页面运行出错：{session.exception[0].message}")
+    return results
+
+def run_size(size, backend, repeat, apptest):
+    """在子进程和临时目录中运行一个规模的基准"""
+    with tempfile.TemporaryDirectory(prefix="booking-bench-") as workdir:
+        env = dict(os.environ, BOOKING_STORAGE=backend, PYTHONPATH=REPO_ROOT)
+        command = [sys.executable, "-m", "bench.run", "--worker", str(size), "--repeat", str(repeat)]
+        if not apptest:
+            command.append("--no-apptest")
+        completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"规模 {size} 运行失败：\n{completed.stderr}")
+        # 结果在标准输出的最后一行（Streamlit 可能在前面输出日志）
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def pad(text, width, left=False):
+    """按显示宽度补空格（中文占两列）"""
+    display_width = sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
+    padding = " " * max(width - display_width, 0)
+    return text + padding if left else padding + text
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return f"{seconds * 1000:.2f} ms"
+    return f"{seconds:.2f} s"
+
+def report(size, results, baseline, tolerance, backend=None):
+    """打印一个规模的结果，返回退化的项目列表（同时运行多个后端时标出后端）"""
+    label = f"{backend} {size}" if backend else str(size)
+    print(f"\n== {label} 条预约 ==")
+    print(pad("项目", 22, left=True) + "".join(pad(title, 12) for title in ["最快", "中位数", "峰值内存", "基线", "变化"]))
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = ""
+        base_text = "-"
+        if base is not None:
+            base_text = format_seconds(base["seconds"])
+            ratio = result["seconds"] / base["seconds"] if base["seconds"] else 1.0
+            change = f"{ratio - 1:+.0%}"
+            if ratio > 1 + tolerance and result["seconds"] - base["seconds"] > MIN_REGRESSION_SECONDS:
+                change += " ⚠"
+                regressions.append(f"{label} {name}")
+        columns = [format_seconds(result["seconds"]), format_seconds(result["median"]),
+                   f"{result['peak_mb']:.1f} MB", base_text, change]
+        print(pad(name, 22, left=True) + "".join(pad(column, 12) for column in columns))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="预约系统性能基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="预约条数")
+    parser.add_argument("--backend", choices=["json", "sqlite"], nargs="+", default=["json"], help="存储后端（可多个）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最快）")
+    parser.add_argument("--no-apptest", dest="apptest", action="store_false", help="跳过页面运行基准")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="判定退化的变慢比例")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_benchmarks(args.worker, args.repeat, args.apptest), ensure_ascii=False))
+        return
+
+    baseline = load_baseline()
+    regressions = []
+    for backend in args.backend:
+        backend_baseline = baseline.setdefault(backend, {})
+        for size in args.sizes:
+            results = run_size(size, backend, args.repeat, args.apptest)
+            regressions += report(size, results, backend_baseline.get(str(size), {}), args.tolerance,
+                                  backend if len(args.backend) > 1 else None)
+            if args.save_baseline:
+                backend_baseline[str(size)] = results
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {os.path.relpath(BASELINE_FILE)}")
+    elif regressions:
+        print("\n比基线明显变慢：" + "、".join(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
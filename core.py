@@ -0,0 +1,410 @@
+"""预约业务逻辑：场地配置、可用性查询、日程表计算和预约校验
+
+不依赖 Streamlit 和 pandas（numpy 只在计算日程表时导入），页面（app.py）、
+HTTP 接口（api.py）和脚本都可以直接导入本模块，启动时不加载界面相关的依赖。
+
+场地（Venue）由 VENUES_FILE 配置：每个场地有自己的跳台、按星期排列的时段模板、
+可预约天数和数据目录（各场地的预约数据分开存放，见 storage.Partition）。
+没有配置文件时只有一个默认场地，使用下面的 TIME_SLOTS、CLASSROOMS 和当前目录
+中原有的数据文件。配置文件示例：
+
+    {"venues": [
+        {"id": "jf", "name": "尖锋", "classrooms": ["6m", "8m", "10m", "14m"],
+         "slot_templates": {"平日": {"晚上第一节": "18:00-20:00"},
+                            "周末": {"上午第一节": "08:00-10:00", "晚上第一节": "18:00-20:00"}},
+         "weekly_schedule": ["平日", "平日", "平日", "平日", "平日", "周末", "周末"],
+         "horizon_days": 30, "data_dir": ""}
+    ]}
+
+weekly_schedule 中为 null 的日期不开放；data_dir 默认为 venues/<id>。
+"""
+import datetime
+import json
+import os
+from datetime import timedelta
+
+from storage import parse_slot_key, get_partition
+
+# 管理员密码（在实际部署时应该使用环境变量或加密存储）
+ADMIN_PASSWORD = "kgw1998"
+
+# 默认场地的时段定义
+TIME_SLOTS = {
+    "上午第一节": "08:00-10:00",
+    "上午第二节": "10:00-12:00",
+    "下午第一节": "12:00-14:00",
+    "下午第二节": "14:00-16:00",
+    "下午第三节": "16:00-18:00",
+    "晚上第一节": "18:00-20:00",
+    "晚上第二节": "20:00-22:00",
+}
+
+# 默认场地的跳台配置
+CLASSROOMS = ["6m", "8m","10m","14m"]
+
+# 中文星期名称（按 date.weekday() 排列）
+WEEKDAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+# 场地配置文件（不存在时只有默认场地）
+VENUES_FILE = os.environ.get("BOOKING_VENUES_FILE", "venues.json")
+
+# 可预约天数（从今天开始）的默认值和允许范围
+DEFAULT_HORIZON_DAYS = 7
+MIN_HORIZON_DAYS = 7
+MAX_HORIZON_DAYS = 90
+
+class Venue:
+    """一个场地：跳台、时段模板和可预约天数
+
+    slot_templates 为 {模板名: {时段: 时间范围}}，weekly_schedule 为周一到周日
+    各天使用的模板名（None 表示当天不开放）。time_slots 为所有模板时段的并集
+    （按首次出现的顺序），是日程表的行。
+    """
+
+    def __init__(self, venue_id, name, classrooms, slot_templates, weekly_schedule=None,
+                 horizon_days=DEFAULT_HORIZON_DAYS, data_dir=None):
+        if weekly_schedule is None:
+            weekly_schedule = [next(iter(slot_templates))] * 7
+        if len(weekly_schedule) != 7:
+            raise ValueError(f"场地 {venue_id} 的 weekly_schedule 必须有 7 项（周一到周日）")
+        unknown = [template for template in weekly_schedule if template is not None and template not in slot_templates]
+        if unknown:
+            raise ValueError(f"场地 {venue_id} 的时段模板不存在：{'、'.join(unknown)}")
+        if not MIN_HORIZON_DAYS <= horizon_days <= MAX_HORIZON_DAYS:
+            raise ValueError(f"场地 {venue_id} 的可预约天数必须在 {MIN_HORIZON_DAYS}-{MAX_HORIZON_DAYS} 之间")
+        
+        self.id = venue_id
+        self.name = name
+        self.classrooms = list(classrooms)
+        self.slot_templates = slot_templates
+        self.weekly_schedule = list(weekly_schedule)
+        self.horizon_days = horizon_days
+        self.data_dir = os.path.join("venues", venue_id) if data_dir is None else data_dir
+        
+        self.time_slots = {}
+        for template in slot_templates.values():
+            for time_slot, time_range in template.items():
+                self.time_slots.setdefault(time_slot, time_range)
+        self._weekday_slots = [
+            list(slot_templates[template]) if template is not None else []
+            for template in self.weekly_schedule
+        ]
+
+    @property
+    def store(self):
+        """该场地的数据分区"""
+        return get_partition(self.data_dir)
+
+    def read_occupancy(self, start_date, days=1):
+        """从 start_date 起 days 天的占用位图快照（storage.OccupancySnapshot，含屏蔽列表）"""
+        return self.store.occupancy(self.time_slots, self.classrooms).read(start_date, days)
+
+    def time_slots_for(self, date):
+        """指定日期开放的时段列表"""
+        return self._weekday_slots[date.weekday()]
+
+    def slots_per_weekday(self):
+        """周一到周日每天开放的时段数"""
+        return [len(slots) for slots in self._weekday_slots]
+
+    def bookable_dates(self, today=None):
+        """从今天开始的可预约日期列表（horizon_days 天）"""
+        today = today or datetime.date.today()
+        return [today + timedelta(days=i) for i in range(self.horizon_days)]
+
+def load_venues(path=VENUES_FILE):
+    """读取场地配置，返回 {场地 id: Venue}（按配置顺序）；没有配置文件时只有默认场地"""
+    if not os.path.exists(path):
+        default = Venue("default", "尖锋旱雪", CLASSROOMS, {"全天": TIME_SLOTS}, data_dir="")
+        return {default.id: default}
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    venues = {}
+    for item in config["venues"]:
+        venue = Venue(
+            item["id"],
+            item.get("name", item["id"]),
+            item["classrooms"],
+            item["slot_templates"],
+            item.get("weekly_schedule"),
+            item.get("horizon_days", DEFAULT_HORIZON_DAYS),
+            item.get("data_dir"),
+        )
+        venues[venue.id] = venue
+    return venues
+
+VENUES = load_venues()
+
+def get_venue(venue_id=None):
+    """按 id 获取场地，省略时为第一个场地；不存在时抛出 KeyError"""
+    if venue_id is None:
+        return next(iter(VENUES.values()))
+    return VENUES[venue_id]
+
+def get_weekday_name(date):
+    """获取中文星期名称"""
+    return WEEKDAY_NAMES[date.weekday()]
+
+class BookingIndex:
+    """预约索引：日期 → 时段 → 跳台
+
+    每次加载数据只遍历一遍预约记录，之后所有可用性查询都直接查字典，
+    不再拼接或拆分 slot_key。
+    """
+
+    def __init__(self, bookings):
+        self.bookings = bookings
+        self.slots = {}             # {日期: {时段: {跳台: slot_key}}}
+        self.entries = []           # [(slot_key, 日期, 时段, 跳台)]，保持原有顺序
+        for slot_key, booking in bookings.items():
+            date_str, time_slot, classroom = parse_slot_key(slot_key, booking)
+            self.slots.setdefault(date_str, {}).setdefault(time_slot, {})[classroom] = slot_key
+            self.entries.append((slot_key, date_str, time_slot, classroom))
+
+    def booked_classrooms(self, date_str, time_slot):
+        """返回指定日期时段已被预约的 {跳台: slot_key}"""
+        return self.slots.get(date_str, {}).get(time_slot, {})
+
+    def get(self, date_str, time_slot, classroom):
+        """返回指定跳台的预约信息，未预约时返回 None"""
+        slot_key = self.booked_classrooms(date_str, time_slot).get(classroom)
+        return self.bookings[slot_key] if slot_key is not None else None
+
+def get_available_classrooms(venue, occupancy, date_str, time_slot, blocked=None):
+    """获取指定日期时段的可用跳台
+
+    occupancy 为包含该日期的占用位图快照（Venue.read_occupancy），blocked 省略时
+    使用快照中的屏蔽列表。
+    """
+    if blocked is None:
+        blocked = occupancy.blocked
+    booked = occupancy.booked(datetime.date.fromisoformat(date_str), time_slot)
+    # 排除被屏蔽和已被预约的跳台
+    return [c for c in venue.classrooms if c not in blocked and c not in booked]
+
+def is_slot_fully_booked(venue, occupancy, date_str, time_slot, blocked=None):
+    """检查指定时段是否完全被预约（所有可用跳台都被预约）"""
+    return len(get_available_classrooms(venue, occupancy, date_str, time_slot, blocked)) == 0
+
+def get_available_classrooms_for_booking(venue, blocked=None):
+    """获取可用于预约的跳台列表（排除被屏蔽的跳台）"""
+    if blocked is None:
+        blocked = venue.store.load_blocked_classrooms()
+    return [classroom for classroom in venue.classrooms if classroom not in blocked]
+
+def expand_recurrence(venue, dates, weekdays, time_slots, classrooms):
+    """将按周重复规则（如"每周六上午两节 10m"）展开为 dates 范围内的预约目标 [(日期, 时段, 跳台)]
+
+    当天不开放的时段自动跳过。
+    """
+    return [
+        (date.strftime('%Y-%m-%d'), time_slot, classroom)
+        for date in dates if date.weekday() in weekdays
+        for time_slot in time_slots if time_slot in venue.time_slots_for(date)
+        for classroom in classrooms
+    ]
+
+def find_unavailable_targets(occupancy, targets, blocked=None):
+    """返回预约目标中不可预约的部分（跳台被屏蔽或已被预约；occupancy 需覆盖所有目标日期）"""
+    if blocked is None:
+        blocked = occupancy.blocked
+    return [
+        (date_str, time_slot, classroom) for date_str, time_slot, classroom in targets
+        if classroom in blocked or classroom in occupancy.booked(datetime.date.fromisoformat(date_str), time_slot)
+    ]
+
+def slot_time_range(time_range):
+    """时段时间范围的 (开始, 结束)，如 "8:00-10:00" → ("08:00", "10:00")；无法识别时返回 None"""
+    bounds = []
+    for part in str(time_range).split('-'):
+        hour, sep, minute = part.strip().partition(':')
+        if not (sep and hour.isdigit() and minute.isdigit()):
+            return None
+        bounds.append(f"{int(hour):02d}:{int(minute):02d}")
+    return tuple(bounds) if len(bounds) == 2 else None
+
+def find_free_slots(venue, occupancy, dates, classrooms=None, weekdays=None, time_range=None, consecutive=1, limit=5):
+    """查找最早的 limit 个空闲选项（直接对占用位图快照做位运算，不加载预约数据）
+
+    每个选项是同一天、同一跳台上连续 consecutive 个开放时段的预约目标 [(日期, 时段, 跳台)]，
+    按日期、开始时段、跳台（classrooms 的顺序，省略时为场地的跳台顺序）排列。
+    weekdays 为星期（0-6）列表，time_range 为 (最早开始, 最晚结束)（"HH:MM"），省略时不限；
+    无法识别时间的时段不受 time_range 限制。被屏蔽的跳台不会出现在结果中。
+    """
+    preferred = [c for c in (classrooms or venue.classrooms) if c in venue.classrooms and c not in occupancy.blocked]
+    bits = [(classroom, 1 << venue.classrooms.index(classroom)) for classroom in preferred]
+    wanted = sum(bit for _, bit in bits)
+    options = []
+    if not wanted:
+        return options
+    for date in dates:
+        if weekdays and date.weekday() not in weekdays:
+            continue
+        slots = []
+        for time_slot in venue.time_slots_for(date):
+            bounds = slot_time_range(venue.time_slots[time_slot])
+            if time_range is None or bounds is None or (time_range[0] <= bounds[0] and bounds[1] <= time_range[1]):
+                slots.append(time_slot)
+        # 每个时段空闲的目标跳台（位掩码）
+        free = [wanted & ~occupancy.booked_mask(date, time_slot) for time_slot in slots]
+        date_str = date.strftime('%Y-%m-%d')
+        for start in range(len(slots) - consecutive + 1):
+            mask = wanted
+            for slot_free in free[start:start + consecutive]:
+                mask &= slot_free
+            if not mask:
+                continue
+            for classroom, bit in bits:
+                if mask & bit:
+                    options.append([(date_str, time_slot, classroom) for time_slot in slots[start:start + consecutive]])
+                    if len(options) >= limit:
+                        return options
+    return options
+
+def format_target(target):
+    date_str, time_slot, classroom = target
+    return f"{date_str} {time_slot} 跳台{classroom}"
+
+def compute_schedule_grid(venue, occupancy, dates, blocked=None, index=None):
+    """一次性计算日程表
+
+    由占用位图快照得到 日期 × 时段 × 跳台 的占用数组并应用屏蔽掩码，批量得出每格状态
+    （"不开放"、"暂无可用"、"已满"、"可预约"、"部分可约"）、剩余跳台数、已预约信息
+    和四个统计指标。时段为场地所有模板时段的并集，当天不开放的格子不计入统计。
+    已预约信息只有提供预约索引 index 时才包含预约人，否则只列出跳台。
+    """
+    import numpy as np  # 只有渲染日程表时才需要 numpy，导入本模块时不加载
+    
+    slot_names = list(venue.time_slots)
+    slot_pos = {time_slot: i for i, time_slot in enumerate(slot_names)}
+    
+    # 开放掩码：日期 × 时段
+    scheduled = np.zeros((len(dates), len(slot_names)), dtype=bool)
+    for date_idx, date in enumerate(dates):
+        for time_slot in venue.time_slots_for(date):
+            scheduled[date_idx, slot_pos[time_slot]] = True
+    
+    if blocked is None:
+        blocked = occupancy.blocked
+    
+    # 占用数组：位图的每格按位展开为跳台（位图的时段、跳台顺序与场地一致）
+    cells = np.frombuffer(occupancy.cells, dtype=np.uint8).reshape(occupancy.days, len(slot_names), occupancy.width)
+    day_offsets = [(date - occupancy.start_date).days for date in dates]
+    occupied = np.unpackbits(cells[day_offsets], axis=2, bitorder='little')[:, :, :len(venue.classrooms)].astype(bool)
+    
+    # 屏蔽掩码
+    open_mask = np.array([classroom not in blocked for classroom in venue.classrooms], dtype=bool)
+    open_count = int(open_mask.sum())
+    booked_mask = occupied & open_mask & scheduled[:, :, None]
+    booked_counts = booked_mask.sum(axis=2)
+    free_counts = np.where(scheduled, open_count - booked_counts, 0)
+    
+    states = np.select(
+        [~scheduled, np.full(free_counts.shape, open_count == 0), free_counts == 0, free_counts == open_count],
+        ["不开放", "暂无可用", "已满", "可预约"],
+        default="部分可约"
+    )
+    
+    # 已预约信息只需处理有预约的格子
+    booked_labels = {}
+    for date_idx, slot_idx in zip(*np.nonzero(booked_counts)):
+        date_str = dates[date_idx].strftime('%Y-%m-%d')
+        time_slot = slot_names[slot_idx]
+        labels = []
+        for classroom_idx in np.flatnonzero(booked_mask[date_idx, slot_idx]):
+            classroom = venue.classrooms[classroom_idx]
+            booking = index.get(date_str, time_slot, classroom) if index is not None else None
+            if booking is None:
+                labels.append(classroom)
+                continue
+            info = f"{classroom}: {booking['name']}"
+            if 'student_id' in booking:
+                info += f"({booking['student_id']})"
+            labels.append(info)
+        booked_labels[(int(date_idx), int(slot_idx))] = labels
+    
+    total_slots = int(scheduled.sum()) * open_count
+    booked_slots = int(booked_counts.sum())
+    return {
+        "states": states,
+        "free_counts": free_counts,
+        "booked_labels": booked_labels,
+        "open_count": open_count,
+        "total_slots": total_slots,
+        "booked_slots": booked_slots,
+        "available_slots": total_slots - booked_slots,
+        "fully_available_slots": int(((booked_counts == 0) & scheduled).sum()),
+    }
+
+def make_slot_key(date_str, time_slot, classroom):
+    """预约目标对应的 slot_key"""
+    return f"{date_str}_{time_slot}_{classroom}"
+
+def get_availability(venue, dates=None, blocked=None):
+    """各日期开放时段的可预约跳台 {日期: {时段: [跳台]}}，dates 默认为场地的全部可预约日期"""
+    if dates is None:
+        dates = venue.bookable_dates()
+    # 只读占用位图，不加载预约详情
+    occupancy = venue.read_occupancy(dates[0], (dates[-1] - dates[0]).days + 1)
+    return {
+        date.strftime('%Y-%m-%d'): {
+            time_slot: get_available_classrooms(venue, occupancy, date.strftime('%Y-%m-%d'), time_slot, blocked)
+            for time_slot in venue.time_slots_for(date)
+        }
+        for date in dates
+    }
+
+# 预约人必填信息 {预约记录字段: 显示名称}
+REQUIRED_FIELDS = {
+    "name": "姓名",
+    "student_id": "身份证后四位号",
+    "class": "单位/俱乐部",
+    "phone": "电话",
+    "reason": "包场人数",
+}
+
+def validate_booking(venue, info, targets, blocked=None, dates=None):
+    """校验预约请求，通过时返回 None，否则返回错误提示
+
+    info 为预约人信息（REQUIRED_FIELDS 中的字段，必须是字符串），targets 为 [(日期, 时段, 跳台)]。
+    是否已被他人预约不在这里判断，由存储层在写入时原子地检查。
+    """
+    not_text = [name for field, name in REQUIRED_FIELDS.items()
+                if info.get(field) is not None and not isinstance(info.get(field), str)]
+    if not_text:
+        return "以下信息格式错误（应为文本）：" + "、".join(not_text)
+    if not all((info.get(field) or '').strip() for field in REQUIRED_FIELDS):
+        return "请填写所有必填项！"
+    if not targets:
+        return "请选择要预约的时段"
+    if dates is None:
+        dates = venue.bookable_dates()
+    # {日期: 当天开放的时段}
+    open_slots = {date.strftime('%Y-%m-%d'): venue.time_slots_for(date) for date in dates}
+    invalid = [
+        target for target in targets
+        if target[1] not in open_slots.get(target[0], ()) or target[2] not in venue.classrooms
+    ]
+    if invalid:
+        return "以下时段不在可预约范围内：" + "、".join(map(format_target, invalid))
+    if blocked is None:
+        blocked = venue.store.load_blocked_classrooms()
+    blocked_targets = [target for target in targets if target[2] in blocked]
+    if blocked_targets:
+        return "以下跳台已被屏蔽，本次未预约任何时段：" + "、".join(map(format_target, blocked_targets))
+    return None
+
+def book_targets(venue, info, targets):
+    """一次预约多个目标（调用前先用 validate_booking 校验），全部成功或全部不写入
+
+    返回已被他人预约的目标列表，为空表示全部预约成功。
+    """
+    booking_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    bookings = {}
+    for date_str, time_slot, classroom in targets:
+        booking = {field: info[field] for field in REQUIRED_FIELDS}
+        booking["classroom"] = classroom
+        booking["booking_time"] = booking_time
+        bookings[make_slot_key(date_str, time_slot, classroom)] = booking
+    conflicts = set(venue.store.reserve_bookings(bookings))
+    return [target for target in targets if make_slot_key(*target) in conflicts]
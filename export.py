@@ -0,0 +1,120 @@
+"""预约记录导出（CSV / Excel）
+
+按日期范围、跳台、俱乐部筛选，通过场地分区的 Partition.iter_bookings 逐条读取预约（可包含
+历史归档），逐行生成导出内容，不构建完整的 DataFrame：内存占用只与一个月的
+归档、一天的记录和每块的行数有关，与导出的总条数无关。页面的管理员功能和 HTTP 接口
+（GET /export）共用这里的函数。
+
+Excel 格式需要安装 openpyxl（可选依赖，未安装时只能导出 CSV）：
+
+    pip install openpyxl
+"""
+import csv
+import importlib.util
+import io
+
+from storage import parse_slot_key
+
+# 导出文件的列（与页面的预约记录表一致）
+EXPORT_COLUMNS = ["日期", "时段", "跳台", "姓名", "身份证后4位号", "俱乐部", "电话", "包场人数", "预约时间"]
+
+# CSV 每块的行数
+CSV_CHUNK_ROWS = 1000
+
+# 导出格式 → (MIME 类型, 文件扩展名)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+
+def xlsx_available():
+    """是否安装了 openpyxl（导出 Excel 需要）"""
+    return importlib.util.find_spec("openpyxl") is not None
+
+def _row_order(venue):
+    """同一天内记录的排序键：按场地配置的时段、跳台顺序（配置中已没有的排在最后）"""
+    slots = {time_slot: index for index, time_slot in enumerate(venue.time_slots)}
+    classrooms = {classroom: index for index, classroom in enumerate(venue.classrooms)}
+    def key(row):
+        return (slots.get(row[1], len(slots)), row[1], classrooms.get(row[2], len(classrooms)), row[2])
+    return key
+
+def iter_export_rows(venue, start_date=None, end_date=None, classrooms=None, clubs=None, include_archive=True):
+    """逐行生成场地中符合条件的预约记录（EXPORT_COLUMNS 顺序的元组），按日期、时段、跳台排序
+
+    日期为 '%Y-%m-%d'（含两端，None 表示不限），classrooms、clubs 为空表示不限。
+    iter_bookings 按 slot_key 的字符串顺序生成，同一天内时段、跳台的顺序与场地配置
+    不同：每次缓存一天的记录，按场地的时段、跳台顺序排序后再生成。
+    """
+    classrooms = set(classrooms or ())
+    clubs = set(clubs or ())
+    order = _row_order(venue)
+    day = []
+    for slot_key, booking in venue.store.iter_bookings(start_date, end_date, include_archive=include_archive):
+        date_str, time_slot, classroom = parse_slot_key(slot_key, booking)
+        if classrooms and classroom not in classrooms:
+            continue
+        if clubs and booking.get('class') not in clubs:
+            continue
+        if day and day[0][0] != date_str:
+            day.sort(key=order)
+            yield from day
+            day = []
+        day.append((
+            date_str,
+            time_slot,
+            classroom,
+            booking.get('name', ''),
+            booking.get('student_id', '未填写'),
+            booking.get('class', ''),
+            booking.get('phone', ''),
+            booking.get('reason', ''),
+            booking.get('booking_time', ''),
+        ))
+    day.sort(key=order)
+    yield from day
+
+def iter_csv(rows, chunk_rows=CSV_CHUNK_ROWS):
+    """将记录逐块编码为 CSV（UTF-8 带 BOM，Excel 可直接打开中文），每块 chunk_rows 行"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 1
+    first = True
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode('utf-8-sig' if first else 'utf-8')
+            first = False
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending or first:
+        yield buffer.getvalue().encode('utf-8-sig' if first else 'utf-8')
+
+def write_xlsx(rows, file):
+    """将记录写入 Excel 文件（file 为文件名或二进制文件对象）
+
+    使用 openpyxl 的只写模式，行在写入时即落盘到临时文件，不在内存中保留整张表。
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("预约记录")
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
+
+def write_export(rows, export_format, file):
+    """按格式（EXPORT_FORMATS 的键）将记录写入二进制文件对象"""
+    if export_format == "xlsx":
+        write_xlsx(rows, file)
+    else:
+        for chunk in iter_csv(rows):
+            file.write(chunk)
+
+def export_file_name(venue_id, start_date, end_date, export_format):
+    """导出文件名，如 预约记录_default_2025-01-01_2025-03-31.csv"""
+    period = f"{start_date or '最早'}_{end_date or '最新'}"
+    return f"预约记录_{venue_id}_{period}{EXPORT_FORMATS[export_format][1]}"
@@ -0,0 +1,228 @@
+"""页面性能统计
+
+设置环境变量 BOOKING_METRICS=1 后启用：记录页面每次运行中各阶段的耗时和数据文件
+读写次数，在进程内保留最近 WINDOW 次的数据用于计算分位数，并显示在管理员的
+"性能"标签页中。另外设置 BOOKING_METRICS_FILE 时，会定期把统计写入该文件
+（Prometheus 文本格式），可由 node_exporter 的 textfile 收集器采集。
+
+未启用时 phase() 返回一个共享的空上下文，timed() 原样返回被装饰的函数，
+读写计数直接返回，几乎没有开销。
+
+阶段可以嵌套（耗时包含内层阶段）；一个线程上最外层的阶段即为一次运行：
+整页运行时是 main() 中的 "page"，只重新运行某个片段时是该片段自身的阶段。
+"""
+import contextlib
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+
+ENABLED = os.environ.get("BOOKING_METRICS", "") not in ("", "0")
+
+# Prometheus 文本格式的输出文件（为空时不写文件）
+METRICS_FILE = os.environ.get("BOOKING_METRICS_FILE", "")
+
+# 写文件的最短间隔（秒）
+METRICS_FILE_INTERVAL = 10
+
+# 每个阶段保留最近多少次耗时用于计算分位数
+WINDOW = 500
+
+# 阶段名称 → 显示名称
+PHASE_NAMES = {
+    "page": "整页运行",
+    "sidebar": "侧边栏",
+    "grid": "日程表",
+    "occupancy_load": "读取占用位图",
+    "data_load": "加载预约数据",
+    "blocked_load": "加载屏蔽状态",
+    "grid_compute": "日程表计算",
+    "grid_render": "日程表渲染",
+    "metrics": "统计指标",
+    "records": "预约记录表",
+    "admin": "管理员功能",
+}
+
+_NULL_CONTEXT = contextlib.nullcontext()
+_lock = threading.Lock()
+_local = threading.local()
+_phase_durations = {}   # {阶段: deque(耗时)}
+_phase_totals = {}      # {阶段: [次数, 总耗时]}
+_run_io = {}            # {运行类型: deque((读次数, 写次数))}
+_io_totals = {"read": 0, "write": 0}
+_last_file_write = 0.0
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        depth = getattr(_local, "depth", 0)
+        if depth == 0:
+            _local.io = {"read": 0, "write": 0}
+        _local.depth = depth + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        _local.depth -= 1
+        run_io = _local.io if _local.depth == 0 else None
+        with _lock:
+            _phase_durations.setdefault(self.name, deque(maxlen=WINDOW)).append(elapsed)
+            totals = _phase_totals.setdefault(self.name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+            if run_io is not None:
+                _run_io.setdefault(self.name, deque(maxlen=WINDOW)).append((run_io["read"], run_io["write"]))
+        if run_io is not None and METRICS_FILE:
+            _maybe_write_file()
+
+def phase(name):
+    """统计一个阶段的耗时：with metrics.phase("grid_compute"): ..."""
+    if not ENABLED:
+        return _NULL_CONTEXT
+    return _Phase(name)
+
+def timed(name):
+    """函数装饰器形式的 phase()；未启用时原样返回函数"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count_io(kind):
+    """记录一次数据文件读（"read"）或写（"write"）"""
+    if not ENABLED:
+        return
+    with _lock:
+        _io_totals[kind] += 1
+    io = getattr(_local, "io", None)
+    if io is not None and getattr(_local, "depth", 0) > 0:
+        io[kind] += 1
+
+class _IoCollector:
+    __slots__ = ("counts", "saved")
+
+    def __enter__(self):
+        self.saved = (getattr(_local, "io", None), getattr(_local, "depth", 0))
+        self.counts = {"read": 0, "write": 0}
+        _local.io = self.counts
+        _local.depth = self.saved[1] + 1
+        return self.counts
+
+    def __exit__(self, *exc_info):
+        _local.io, _local.depth = self.saved
+
+def collect_io():
+    """单独统计 with 块内当前线程的读写次数：with metrics.collect_io() as counts: ...
+
+    计入总数，但不计入当前线程所在的运行；用于写入线程代其他会话读写时，把次数
+    交给提交请求的线程（见 add_run_io）。未启用时 counts 为 None。
+    """
+    if not ENABLED:
+        return _NULL_CONTEXT
+    return _IoCollector()
+
+def add_run_io(counts):
+    """把其他线程代为进行的读写次数计入当前线程的运行（不重复计入总数）"""
+    if not ENABLED or not counts:
+        return
+    io = getattr(_local, "io", None)
+    if io is not None and getattr(_local, "depth", 0) > 0:
+        io["read"] += counts["read"]
+        io["write"] += counts["write"]
+
+def _percentile(sorted_values, fraction):
+    """最近秩法分位数"""
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+def summary():
+    """当前统计的副本
+
+    返回 {"phases": {阶段: {count, total, p50, p90, p99, max}},
+          "runs": {运行类型: {count, reads, writes}}（最近 WINDOW 次的平均读写次数）,
+          "io": {"read", "write"}}
+    """
+    with _lock:
+        durations = {name: sorted(values) for name, values in _phase_durations.items()}
+        totals = {name: tuple(values) for name, values in _phase_totals.items()}
+        runs = {name: list(values) for name, values in _run_io.items()}
+        io = dict(_io_totals)
+    phases = {}
+    for name, values in durations.items():
+        phases[name] = {
+            "count": totals[name][0],
+            "total": totals[name][1],
+            "p50": _percentile(values, 0.5),
+            "p90": _percentile(values, 0.9),
+            "p99": _percentile(values, 0.99),
+            "max": values[-1],
+        }
+    run_stats = {
+        name: {
+            "count": len(values),
+            "reads": sum(reads for reads, _ in values) / len(values),
+            "writes": sum(writes for _, writes in values) / len(values),
+        }
+        for name, values in runs.items() if values
+    }
+    return {"phases": phases, "runs": run_stats, "io": io}
+
+def reset():
+    """清空统计"""
+    with _lock:
+        _phase_durations.clear()
+        _phase_totals.clear()
+        _run_io.clear()
+        _io_totals.update(read=0, write=0)
+
+def prometheus_text():
+    """Prometheus 文本格式的统计"""
+    stats = summary()
+    lines = [
+        "# HELP booking_phase_seconds Duration of page phases (quantiles over the last runs).",
+        "# TYPE booking_phase_seconds summary",
+    ]
+    for name, values in sorted(stats["phases"].items()):
+        for quantile, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99")):
+            lines.append(f'booking_phase_seconds{{phase="{name}",quantile="{quantile}"}} {values[key]:.6f}')
+        lines.append(f'booking_phase_seconds_sum{{phase="{name}"}} {values["total"]:.6f}')
+        lines.append(f'booking_phase_seconds_count{{phase="{name}"}} {values["count"]}')
+    lines += [
+        "# HELP booking_run_file_ops Average data file operations per run.",
+        "# TYPE booking_run_file_ops gauge",
+    ]
+    for name, values in sorted(stats["runs"].items()):
+        lines.append(f'booking_run_file_ops{{run="{name}",op="read"}} {values["reads"]:.2f}')
+        lines.append(f'booking_run_file_ops{{run="{name}",op="write"}} {values["writes"]:.2f}')
+    lines += [
+        "# HELP booking_file_ops_total Data file operations since start.",
+        "# TYPE booking_file_ops_total counter",
+        f'booking_file_ops_total{{op="read"}} {stats["io"]["read"]}',
+        f'booking_file_ops_total{{op="write"}} {stats["io"]["write"]}',
+    ]
+    return "\n".join(lines) + "\n"
+
+def _maybe_write_file():
+    """距上次写入超过 METRICS_FILE_INTERVAL 秒时写入统计文件（先写临时文件再替换）"""
+    global _last_file_write
+    now = time.monotonic()
+    with _lock:
+        if now - _last_file_write < METRICS_FILE_INTERVAL:
+            return
+        _last_file_write = now
+    tmp_file = METRICS_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_file, METRICS_FILE)
@@ -0,0 +1,30 @@
+"""将预约数据文件转换为紧凑格式（客户表 + 整数编码的预约记录，见 storage.DATA_FORMAT）
+
+    python migrate.py                # 所有场地的数据目录（见 core.VENUES）
+    python migrate.py venues/north   # 指定数据目录
+
+旧格式在读取时就会自动转换、下次写入时保存为新格式；本脚本立即重写 JSON 快照
+（合并日志）和所有历史归档，可在应用运行时执行，重复执行结果不变。
+"""
+import sys
+
+from storage import get_partition, STORAGE_BACKEND
+
+def main():
+    if len(sys.argv) > 1:
+        directories = sys.argv[1:]
+    else:
+        from core import VENUES
+        directories = [venue.data_dir for venue in VENUES.values()]
+    
+    for directory in directories:
+        partition = get_partition(directory)
+        sizes = partition.migrate()
+        print(f"数据目录 {directory or '.'}：")
+        if STORAGE_BACKEND != "json":
+            print(f"  {STORAGE_BACKEND} 后端的预约数据无需迁移，只转换历史归档")
+        for path, (before, after) in sizes.items():
+            print(f"  {path}: {before / 1024:.0f} KB → {after / 1024:.0f} KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1706 @@
+"""预约数据存储
+
+通过 STORAGE_BACKEND（环境变量 BOOKING_STORAGE）选择存储后端：
+
+- "json"：快照文件 + 追加写日志。每次预约、删除只向日志追加一行 JSON，
+  加载时在快照之上按顺序重放日志；日志超过 JOURNAL_COMPACT_BYTES 后在
+  后台线程中合并进快照并清空日志。
+- "sqlite"：SQLite（WAL 模式）。预约是一条受唯一约束保护的 INSERT，
+  多个会话同时预约同一跳台时只有一个能成功；按日期范围读取走索引。
+
+两种后端都只保存今天及以后的"热"数据：更早的预约每天自动移入 ARCHIVE_DIR
+下按月分区的 gzip 归档文件，只有查询历史记录时才读取归档。
+
+本模块只被导入一次，加载结果在进程内所有会话之间共享。可以同时运行多个
+进程（例如多个 streamlit 实例）共用同一份数据：
+
+- 所有写入都在锁文件（数据文件名 + ".lock"）上的排他锁内进行，预约的
+  "检查是否已被预约 + 写入"在进程之间也是原子的；
+- 每次写入都会递增共享的修改计数器（数据文件名 + ".version"）。各进程的
+  缓存以计数器和数据文件的 mtime/大小/inode 校验，只有数据真的被改动时
+  才重新加载；页面也通过轮询版本号发现其他进程的改动。
+
+数据按场地分区（Partition）：每个分区是一个目录，其中的预约数据、屏蔽列表、
+归档、锁文件和计数器都与其他分区互不相关。get_partition("") 为当前目录，
+即单场地部署原有的数据文件。
+"""
+import datetime
+import gzip
+import json
+import mmap
+import operator
+import os
+import queue
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import Future
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 数据文件路径
+DATA_FILE = "bookings.json"
+
+# 追加写日志文件路径
+JOURNAL_FILE = "bookings.journal"
+
+# 日志达到该大小后触发后台合并
+JOURNAL_COMPACT_BYTES = 256 * 1024
+
+# SQLite 数据库文件路径
+SQLITE_FILE = "bookings.db"
+
+# 存储后端："json" 或 "sqlite"
+STORAGE_BACKEND = os.environ.get("BOOKING_STORAGE", "json")
+
+# 屏蔽的跳台文件
+BLOCKED_CLASSROOMS_FILE = "blocked_classrooms.json"
+
+# 历史预约归档目录（每月一个 bookings-YYYY-MM.json.gz）
+ARCHIVE_DIR = "archive"
+
+class DataFileError(Exception):
+    """数据文件存在但无法读取或解析
+
+    不当作空数据处理：否则之后的合并或保存会用不完整的数据覆盖原文件。
+    修复或移走该文件后即可恢复。
+    """
+
+def _file_stamp(path):
+    """文件的 (mtime, 大小, inode)，用于判断缓存是否仍然有效；文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class _FileLock:
+    """跨进程的排他锁（可重入）
+
+    进程内用线程锁互斥，进程之间用锁文件上的 flock（Windows 上为 msvcrt.locking）。
+    持锁进程退出时系统自动释放锁，不会留下需要手动清理的锁。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._owner = None
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = open(self.path, 'a+b')
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._file.seek(0)
+                    while True:
+                        try:
+                            # LK_LOCK 重试约 10 秒后仍拿不到锁会抛出 OSError，继续等待
+                            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+            self._owner = threading.get_ident()
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            self._owner = None
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def held_by_current_thread(self):
+        """当前线程是否持有此锁"""
+        return self._owner == threading.get_ident()
+
+class _ChangeCounter:
+    """进程之间共享的修改计数器
+
+    文件中只有一个定宽的十进制整数：写入方在持有写锁时原地改写（不截断文件），
+    读取方不需要加锁，读一个很小的文件即可判断数据是否被改动过。
+    """
+
+    WIDTH = 20
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return int(f.read(self.WIDTH) or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self):
+        """计数器加一（调用方需持有对应的写锁）"""
+        value = self.read() + 1
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            os.write(fd, str(value).zfill(self.WIDTH).encode('ascii'))
+        finally:
+            os.close(fd)
+        return value
+
+def parse_slot_key(slot_key, booking):
+    """解析slot_key，支持新旧格式，返回 (日期, 时段, 跳台)"""
+    parts = slot_key.split('_')
+    if len(parts) >= 3:  # 新格式：date_slot_classroom
+        return parts[0], '_'.join(parts[1:-1]), parts[-1]
+    # 旧格式：date_slot（兼容性）
+    return parts[0], '_'.join(parts[1:]), booking.get('classroom', '未知')
+
+def _in_range(slot_key, start_date, end_date):
+    """判断slot_key的日期是否在 [start_date, end_date] 内"""
+    date_str = slot_key.split('_', 1)[0]
+    return (start_date is None or date_str >= start_date) and (end_date is None or date_str <= end_date)
+
+# 数据文件格式版本：客户表 + 整数编码的预约记录（没有 format 字段的是旧格式 {slot_key: 预约信息}）
+DATA_FORMAT = 2
+
+class Customer:
+    """客户（预约人）：同一客户表中相同的预约人信息只有一个对象"""
+    __slots__ = ("name", "student_id", "club", "phone")
+
+    def __init__(self, name, student_id, club, phone):
+        self.name = name
+        self.student_id = student_id
+        self.club = club
+        self.phone = phone
+
+    def key(self):
+        return (self.name, self.student_id, self.club, self.phone)
+
+# 预约信息字段 → 从 BookingRecord 取值的方法
+_RECORD_FIELDS = {
+    "name": operator.attrgetter("customer.name"),
+    "student_id": operator.attrgetter("customer.student_id"),
+    "class": operator.attrgetter("customer.club"),
+    "phone": operator.attrgetter("customer.phone"),
+    "reason": operator.attrgetter("reason"),
+    "classroom": operator.attrgetter("classroom"),
+    "booking_time": operator.attrgetter("booking_time"),
+}
+
+class BookingRecord(Mapping):
+    """一条预约的紧凑表示：预约人信息引用共享的 Customer，其余字段存于 __slots__
+
+    作为只读字典使用（booking['name']、booking.get('student_id')、dict(booking)）；
+    值为 None 的字段与字典中没有该键相同。extra 保存旧数据中的其他字段。
+    """
+    __slots__ = ("customer", "classroom", "reason", "booking_time", "extra")
+
+    def __init__(self, customer, classroom, reason, booking_time, extra=None):
+        self.customer = customer
+        self.classroom = classroom
+        self.reason = reason
+        self.booking_time = booking_time
+        self.extra = extra
+
+    def __getitem__(self, field):
+        getter = _RECORD_FIELDS.get(field)
+        if getter is None:
+            if self.extra is None:
+                raise KeyError(field)
+            return self.extra[field]
+        value = getter(self)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __iter__(self):
+        for field, getter in _RECORD_FIELDS.items():
+            if getter(self) is not None:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"BookingRecord({dict(self)!r})"
+
+class CustomerTable:
+    """客户表：把预约信息转换为 BookingRecord，重复的预约人信息归并为同一个 Customer"""
+
+    def __init__(self):
+        self._customers = {}    # {(姓名, 身份证后四位, 单位/俱乐部, 电话): Customer}
+
+    def customer(self, name, student_id, club, phone):
+        key = (name, student_id, club, phone)
+        customer = self._customers.get(key)
+        if customer is None:
+            customer = self._customers.setdefault(key, Customer(*key))
+        return customer
+
+    def record(self, booking):
+        """将预约信息（字典或 BookingRecord）转换为 BookingRecord"""
+        if isinstance(booking, BookingRecord):
+            return booking
+        extra = {field: value for field, value in booking.items() if field not in _RECORD_FIELDS} or None
+        customer = self.customer(booking.get('name'), booking.get('student_id'), booking.get('class'), booking.get('phone'))
+        classroom = booking.get('classroom')
+        return BookingRecord(
+            customer, sys.intern(classroom) if isinstance(classroom, str) else classroom,
+            booking.get('reason'), booking.get('booking_time'), extra
+        )
+
+def encode_bookings(bookings):
+    """将预约数据 {slot_key: 预约信息} 编码为 DATA_FORMAT 格式，保持原有顺序
+
+    {"format": 2,
+     "customers": [[姓名, 身份证后四位, 单位/俱乐部, 电话], ...],
+     "dates": [日期, ...], "slots": [时段, ...], "classrooms": [跳台, ...],
+     "bookings": [[日期编号, 时段编号, 跳台编号, 客户编号, 包场人数, 预约时间(, 其他字段)], ...]}
+
+    slot_key 不是"日期_时段_跳台"形式的旧数据，日期编号处直接保存 slot_key，时段编号为 null。
+    """
+    tables = {"customers": {}, "dates": {}, "slots": {}, "classrooms": {}}
+    
+    def code(table, value):
+        ids = tables[table]
+        if value not in ids:
+            ids[value] = len(ids)
+        return ids[value]
+    
+    rows = []
+    for slot_key, booking in bookings.items():
+        if isinstance(booking, BookingRecord):
+            customer_key = booking.customer.key()
+            extra = booking.extra
+        else:
+            customer_key = tuple(booking.get(field) for field in ("name", "student_id", "class", "phone"))
+            extra = {field: value for field, value in booking.items() if field not in _RECORD_FIELDS} or None
+        classroom = booking.get('classroom')
+        date_str, time_slot, key_classroom = parse_slot_key(slot_key, booking)
+        if f"{date_str}_{time_slot}_{key_classroom}" == slot_key and key_classroom == classroom:
+            row = [code("dates", date_str), code("slots", time_slot)]
+        else:
+            row = [slot_key, None]
+        row += [
+            None if classroom is None else code("classrooms", classroom),
+            code("customers", customer_key),
+            booking.get('reason'),
+            booking.get('booking_time'),
+        ]
+        if extra:
+            row.append(extra)
+        rows.append(row)
+    
+    result = {"format": DATA_FORMAT}
+    for table, ids in tables.items():
+        result[table] = [list(value) if table == "customers" else value for value in ids]
+    result["bookings"] = rows
+    return result
+
+def decode_bookings(data, customers):
+    """将数据文件内容解码为 {slot_key: BookingRecord}，customers 为使用的 CustomerTable
+
+    兼容旧格式 {slot_key: 预约信息}（读取时即转换，下次写入时保存为新格式）。
+    """
+    if data.get("format") != DATA_FORMAT:
+        return {slot_key: customers.record(booking) for slot_key, booking in data.items()}
+    people = [customers.customer(*row) for row in data["customers"]]
+    dates, slots = data["dates"], data["slots"]
+    classrooms = [sys.intern(classroom) for classroom in data["classrooms"]]
+    bookings = {}
+    for row in data["bookings"]:
+        date_code, slot_code, classroom_code, customer_code, reason, booking_time = row[:6]
+        classroom = None if classroom_code is None else classrooms[classroom_code]
+        if slot_code is None:
+            slot_key = date_code
+        else:
+            slot_key = f"{dates[date_code]}_{slots[slot_code]}_{classroom}"
+        bookings[slot_key] = BookingRecord(
+            people[customer_code], classroom, reason, booking_time, row[6] if len(row) > 6 else None
+        )
+    return bookings
+
+def _apply_entry(bookings, entry, record):
+    """将一条写入记录（日志格式）应用到预约数据上，record 将预约信息转换为 BookingRecord（重复应用结果不变）"""
+    op = entry.get('op')
+    if op == 'create':
+        bookings[entry['key']] = record(entry['booking'])
+    elif op == 'create_many':
+        for slot_key, booking in entry['bookings'].items():
+            bookings[slot_key] = record(booking)
+    elif op == 'delete':
+        bookings.pop(entry['key'], None)
+    elif op == 'delete_many':
+        for slot_key in entry['keys']:
+            bookings.pop(slot_key, None)
+    elif op == 'clear':
+        bookings.clear()
+
+def _record_entries(entries, record):
+    """将写入记录中的预约信息转换为 BookingRecord（在写入磁盘之前调用，格式错误时在这里抛出异常）"""
+    converted = []
+    for entry in entries:
+        if entry.get('op') == 'create':
+            entry = dict(entry, booking=record(entry['booking']))
+        elif entry.get('op') == 'create_many':
+            entry = dict(entry, bookings={slot_key: record(booking) for slot_key, booking in entry['bookings'].items()})
+        converted.append(entry)
+    return converted
+
+class _StampedCache:
+    """按文件戳校验的加载结果缓存，按键（如日期范围）分别保存；调用方不得修改取出的结果"""
+
+    def __init__(self):
+        self.stamp = None
+        self.ranges = {}
+
+    def get(self, stamp, key):
+        if stamp is None or stamp != self.stamp:
+            return None
+        return self.ranges.get(key)
+
+    def put(self, stamp, key, result):
+        if stamp != self.stamp:
+            self.stamp = stamp
+            self.ranges = {}
+        self.ranges[key] = result
+
+    def invalidate(self):
+        self.stamp = None
+        self.ranges = {}
+
+class JsonStorage:
+    """快照文件 + 追加写日志"""
+
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        self._lock = _FileLock(data_file + '.lock')
+        self._cache_lock = threading.Lock()
+        self._counter = _ChangeCounter(data_file + '.version')
+        self._compaction_thread = None
+        self._cache = _StampedCache()
+        self._customers = CustomerTable()
+
+    def _stamp(self):
+        return (self._counter.read(), _file_stamp(self.data_file), _file_stamp(self.journal_file))
+
+    def locked(self):
+        """跨进程写锁，持有期间其他进程无法写入"""
+        return self._lock
+
+    def version(self):
+        """数据版本：数据有变化时一定不同
+
+        只取共享的修改计数器：合并日志只是改写文件、不改变数据，版本不变，
+        统计、占用位图和各会话的版本轮询都不必因此重建或重新运行。
+        """
+        return (self._counter.read(),)
+
+    def change_count(self):
+        """共享修改计数器的当前值（每次写入加一）"""
+        return self._counter.read()
+
+    def _read_snapshot(self):
+        """读取快照文件（新旧格式都转换为 {slot_key: BookingRecord}）"""
+        if os.path.exists(self.data_file):
+            metrics.count_io("read")
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as error:
+                raise DataFileError(f"无法读取预约数据文件 {self.data_file}：{error}") from error
+            return decode_bookings(data, self._customers)
+        return {}
+
+    def _apply(self, bookings, entry):
+        """将一条日志记录应用到预约数据上（重复应用结果不变）"""
+        _apply_entry(bookings, entry, self._customers.record)
+
+    def _replay_journal(self, bookings):
+        """在快照之上重放日志"""
+        if not os.path.exists(self.journal_file):
+            return
+        metrics.count_io("read")
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 崩溃时只写了一半的行，直接跳过
+                    continue
+                self._apply(bookings, entry)
+
+    def load(self, start_date=None, end_date=None):
+        """加载预约数据（快照 + 日志），可按日期范围过滤"""
+        stamp = self._stamp()
+        with self._cache_lock:
+            cached = self._cache.get(stamp, (start_date, end_date))
+        if cached is not None:
+            # 返回浅拷贝，调用方修改字典不会影响缓存
+            return dict(cached)
+        # 缓存失效时在写锁内读取，避免读到另一个进程合并到一半的快照和日志
+        with self._lock:
+            stamp = self._stamp()
+            with self._cache_lock:
+                bookings = self._cache.get(stamp, (None, None))
+            if bookings is None:
+                bookings = self._read_snapshot()
+                self._replay_journal(bookings)
+                with self._cache_lock:
+                    self._cache.put(stamp, (None, None), bookings)
+        if start_date is None and end_date is None:
+            return dict(bookings)
+        result = {k: v for k, v in bookings.items() if _in_range(k, start_date, end_date)}
+        with self._cache_lock:
+            self._cache.put(stamp, (start_date, end_date), result)
+        return dict(result)
+
+    def _invalidate(self):
+        """本进程写入后递增共享计数器并丢弃缓存（调用方需持有写锁）"""
+        metrics.count_io("write")
+        self._counter.bump()
+        with self._cache_lock:
+            self._cache.invalidate()
+
+    def _write_snapshot(self, bookings):
+        """整体写入快照（DATA_FORMAT 格式）并清空日志（调用方需持有写锁）"""
+        tmp_file = self.data_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(encode_bookings(bookings), f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
+        # 快照落盘后再清空日志；两步之间崩溃时日志会被重放一次，结果不变
+        open(self.journal_file, 'w').close()
+
+    def save(self, bookings):
+        """整体写入快照（DATA_FORMAT 格式）并清空日志"""
+        with self._lock:
+            self._write_snapshot(bookings)
+            self._invalidate()
+
+    def compact(self):
+        """将日志合并进快照
+
+        数据不变，不递增修改计数器（数据版本不变）；本进程的缓存直接换到新文件上，
+        其他进程发现文件被替换后重新读取一次。
+        """
+        with self._lock:
+            bookings = self.load()
+            metrics.count_io("write")
+            self._write_snapshot(bookings)
+            with self._cache_lock:
+                self._cache.invalidate()
+                self._cache.put(self._stamp(), (None, None), bookings)
+
+    def _start_compaction(self):
+        """在后台线程中合并日志（已有合并在进行时跳过）"""
+        with self._lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self.compact, name="journal-compaction", daemon=True)
+            self._compaction_thread.start()
+
+    def _append(self, *entries):
+        """向日志追加记录（一次写入、一次 fsync），必要时触发合并"""
+        entries = _record_entries(entries, self._customers.record)
+        data = ''.join(json.dumps(entry, ensure_ascii=False, default=dict) + '\n' for entry in entries).encode('utf-8')
+        with self._lock:
+            with open(self.journal_file, 'ab+') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    # 上一次写入被中断时补一个换行，避免与半行记录粘在一起
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        data = b'\n' + data
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            self._invalidate()
+        if size >= JOURNAL_COMPACT_BYTES:
+            self._start_compaction()
+
+    def records(self, bookings):
+        """将 {slot_key: 预约信息} 转换为 BookingRecord（写入前调用：格式错误的预约在这里出错，不会写入磁盘）"""
+        return {slot_key: self._customers.record(booking) for slot_key, booking in bookings.items()}
+
+    def existing(self, slot_keys):
+        """slot_keys 中已有预约的集合"""
+        bookings = self.load()
+        return {slot_key for slot_key in slot_keys if slot_key in bookings}
+
+    def commit(self, entries):
+        """一次写入一批日志记录（调用方需持有写锁，并已按到达顺序检查过冲突）
+
+        写入前缓存有效时，在缓存的副本上应用这批记录作为新的缓存，下一次读取
+        不必重新解析快照和日志。
+        """
+        stamp = self._stamp()
+        with self._cache_lock:
+            cached = self._cache.get(stamp, (None, None))
+            bookings = dict(cached) if cached is not None else None
+        self._append(*entries)
+        if bookings is not None:
+            for entry in entries:
+                self._apply(bookings, entry)
+            with self._cache_lock:
+                self._cache.put(self._stamp(), (None, None), bookings)
+
+    def reserve(self, slot_key, booking):
+        """预约跳台，已被预约时返回 False（检查与写入在跨进程写锁内完成）"""
+        with self._lock:
+            if slot_key in self.load():
+                return False
+            self._append({'op': 'create', 'key': slot_key, 'booking': booking})
+        return True
+
+    def reserve_many(self, bookings):
+        """一次预约多个跳台（一条日志记录，全部成功或全部不写入），返回已被预约的 slot_key 列表"""
+        with self._lock:
+            existing = self.load()
+            conflicts = [slot_key for slot_key in bookings if slot_key in existing]
+            if not conflicts:
+                self._append({'op': 'create_many', 'bookings': bookings})
+        return conflicts
+
+    def delete(self, slot_key):
+        """删除一条预约"""
+        self._append({'op': 'delete', 'key': slot_key})
+
+    def delete_many(self, slot_keys):
+        """批量删除预约（一条日志记录，整体生效）"""
+        self._append({'op': 'delete_many', 'keys': list(slot_keys)})
+
+    def clear(self):
+        """清空所有预约"""
+        self._append({'op': 'clear'})
+
+class SqliteStorage:
+    """SQLite（WAL 模式）存储，每个线程使用独立连接"""
+
+    def __init__(self, db_file=SQLITE_FILE, import_from=None):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = _FileLock(db_file + '.lock')
+        self._counter = _ChangeCounter(db_file + '.version')
+        self._cache = _StampedCache()
+        self._customers = CustomerTable()
+        # 在写锁内创建：多个进程同时首次启动时只有一个导入数据，其他进程等待导入完成
+        with self._write_lock:
+            is_new = not os.path.exists(db_file)
+            conn = self._connect()
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS bookings (
+                        slot_key TEXT PRIMARY KEY,
+                        date TEXT NOT NULL,
+                        time_slot TEXT NOT NULL,
+                        classroom TEXT NOT NULL,
+                        data TEXT NOT NULL,
+                        UNIQUE (date, time_slot, classroom)
+                    )
+                """)
+            if is_new:
+                # 首次创建数据库时导入已有的 JSON 数据（import_from 为同一分区的 JsonStorage）
+                self.save((import_from or JsonStorage()).load())
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _stamp(self):
+        # 提交先写入 -wal 文件，检查点时再写回主库，两者任一变化都说明数据可能已变
+        return (self._counter.read(), _file_stamp(self.db_file), _file_stamp(self.db_file + '-wal'))
+
+    def locked(self):
+        """跨进程写锁（SQLite 自身保证单条写入的原子性，此锁用于串行化多步操作和计数器）"""
+        return self._write_lock
+
+    def version(self):
+        """数据版本：数据有变化时一定不同"""
+        return self._stamp()
+
+    def change_count(self):
+        """共享修改计数器的当前值（每次写入加一）"""
+        return self._counter.read()
+
+    @staticmethod
+    def _row(slot_key, booking):
+        date_str, time_slot, classroom = parse_slot_key(slot_key, booking)
+        return (slot_key, date_str, time_slot, classroom, json.dumps(booking, ensure_ascii=False, default=dict))
+
+    def load(self, start_date=None, end_date=None):
+        """加载预约数据，可按日期范围过滤（走 date 索引）"""
+        with self._lock:
+            stamp = self._stamp()
+            cached = self._cache.get(stamp, (start_date, end_date))
+        if cached is not None:
+            return dict(cached)
+        query = "SELECT slot_key, data FROM bookings"
+        conditions, params = [], []
+        if start_date is not None:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY rowid"
+        metrics.count_io("read")
+        rows = self._connect().execute(query, params)
+        record = self._customers.record
+        result = {slot_key: record(json.loads(data)) for slot_key, data in rows}
+        with self._lock:
+            self._cache.put(stamp, (start_date, end_date), result)
+        return dict(result)
+
+    def _invalidate(self):
+        """本进程写入后递增共享计数器并丢弃缓存（调用方需持有写锁）"""
+        metrics.count_io("write")
+        self._counter.bump()
+        with self._lock:
+            self._cache.invalidate()
+
+    def save(self, bookings):
+        """用给定数据整体替换数据库内容"""
+        bookings = self.records(bookings)
+        conn = self._connect()
+        with self._write_lock:
+            with conn:
+                conn.execute("DELETE FROM bookings")
+                conn.executemany(
+                    "INSERT INTO bookings (slot_key, date, time_slot, classroom, data) VALUES (?, ?, ?, ?, ?)",
+                    [self._row(k, v) for k, v in bookings.items()]
+                )
+            self._invalidate()
+
+    def reserve(self, slot_key, booking):
+        """预约跳台，已被预约时返回 False（由唯一约束保证原子性）"""
+        booking = self._customers.record(booking)
+        conn = self._connect()
+        with self._write_lock:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO bookings (slot_key, date, time_slot, classroom, data) VALUES (?, ?, ?, ?, ?)",
+                    self._row(slot_key, booking)
+                )
+            if cursor.rowcount == 1:
+                self._invalidate()
+        return cursor.rowcount == 1
+
+    def reserve_many(self, bookings):
+        """一次预约多个跳台（一个事务，全部成功或全部回滚），返回已被预约的 slot_key 列表"""
+        conn = self._connect()
+        rows = [self._row(k, v) for k, v in self.records(bookings).items()]
+        with self._write_lock:
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO bookings (slot_key, date, time_slot, classroom, data) VALUES (?, ?, ?, ?, ?)",
+                        rows
+                    )
+            except sqlite3.IntegrityError:
+                taken = set()
+                for slot_key, date_str, time_slot, classroom, _ in rows:
+                    found = conn.execute(
+                        "SELECT 1 FROM bookings WHERE slot_key = ? OR (date = ? AND time_slot = ? AND classroom = ?)",
+                        (slot_key, date_str, time_slot, classroom)
+                    ).fetchone()
+                    if found:
+                        taken.add(slot_key)
+                return [slot_key for slot_key in bookings if slot_key in taken]
+            self._invalidate()
+        return []
+
+    def records(self, bookings):
+        """将 {slot_key: 预约信息} 转换为 BookingRecord（写入前调用：格式错误的预约在这里出错，不会写入磁盘）"""
+        return {slot_key: self._customers.record(booking) for slot_key, booking in bookings.items()}
+
+    def existing(self, slot_keys):
+        """slot_keys 中已有预约的集合（按主键查询，不加载全部数据）"""
+        slot_keys = list(slot_keys)
+        conn = self._connect()
+        found = set()
+        # 每次查询的参数个数不超过 SQLite 的默认上限
+        for start in range(0, len(slot_keys), 500):
+            chunk = slot_keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT slot_key FROM bookings WHERE slot_key IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            found.update(slot_key for slot_key, in rows)
+        return found
+
+    def commit(self, entries):
+        """一个事务写入一批记录（与 JsonStorage 的日志记录格式相同；调用方需持有写锁）
+
+        违反唯一约束时整体回滚并抛出 sqlite3.IntegrityError。写入前缓存有效时同样
+        在其副本上应用这批记录作为新的缓存。
+        """
+        entries = _record_entries(entries, self._customers.record)
+        with self._lock:
+            cached = self._cache.get(self._stamp(), (None, None))
+            bookings = dict(cached) if cached is not None else None
+        conn = self._connect()
+        with conn:
+            for entry in entries:
+                op = entry['op']
+                if op == 'create_many':
+                    conn.executemany(
+                        "INSERT INTO bookings (slot_key, date, time_slot, classroom, data) VALUES (?, ?, ?, ?, ?)",
+                        [self._row(k, v) for k, v in entry['bookings'].items()]
+                    )
+                elif op == 'delete_many':
+                    conn.executemany("DELETE FROM bookings WHERE slot_key = ?", [(k,) for k in entry['keys']])
+                elif op == 'clear':
+                    conn.execute("DELETE FROM bookings")
+        self._invalidate()
+        if bookings is not None:
+            for entry in entries:
+                _apply_entry(bookings, entry, self._customers.record)
+            with self._lock:
+                self._cache.put(self._stamp(), (None, None), bookings)
+
+    def delete(self, slot_key):
+        """删除一条预约"""
+        conn = self._connect()
+        with self._write_lock:
+            with conn:
+                conn.execute("DELETE FROM bookings WHERE slot_key = ?", (slot_key,))
+            self._invalidate()
+
+    def delete_many(self, slot_keys):
+        """批量删除预约（一个事务）"""
+        conn = self._connect()
+        with self._write_lock:
+            with conn:
+                conn.executemany("DELETE FROM bookings WHERE slot_key = ?", [(k,) for k in slot_keys])
+            self._invalidate()
+
+    def compact(self):
+        """SQLite 删除即生效，无需合并"""
+
+    def clear(self):
+        """清空所有预约"""
+        conn = self._connect()
+        with self._write_lock:
+            with conn:
+                conn.execute("DELETE FROM bookings")
+            self._invalidate()
+
+def _headcount(booking):
+    """从"包场人数"字段中取出人数（如 "10"、"10人"），无法识别时记为 0"""
+    match = re.search(r'\d+', str(booking.get('reason', '')))
+    return int(match.group()) if match else 0
+
+def _bump(counter, key, delta):
+    value = counter.get(key, 0) + delta
+    if value:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+class BookingStats:
+    """预约统计计数器
+
+    按跳台、日期、时段、俱乐部、星期×跳台计数并汇总包场人数。新增、删除预约时
+    增量更新，读取时不再扫描预约记录。
+    """
+
+    def __init__(self, bookings=None):
+        self.total = 0
+        self.headcount = 0
+        self.classroom_counts = {}          # {跳台: 预约数}
+        self.date_counts = {}               # {日期: 预约数}
+        self.slot_counts = {}               # {时段: 预约数}
+        self.club_counts = {}               # {俱乐部: 预约数}
+        self.club_headcounts = {}           # {俱乐部: 包场人数}
+        self.weekday_classroom_counts = {}  # {(星期 0-6, 跳台): 预约数}
+        self._entries = {}                  # {slot_key: 计数用的字段}，删除时据此回退
+        for slot_key, booking in (bookings or {}).items():
+            self.add(slot_key, booking)
+
+    def _apply(self, entry, delta):
+        date_str, time_slot, classroom, club, headcount, weekday = entry
+        self.total += delta
+        self.headcount += delta * headcount
+        _bump(self.classroom_counts, classroom, delta)
+        _bump(self.date_counts, date_str, delta)
+        _bump(self.slot_counts, time_slot, delta)
+        _bump(self.club_counts, club, delta)
+        _bump(self.club_headcounts, club, delta * headcount)
+        if weekday is not None:
+            _bump(self.weekday_classroom_counts, (weekday, classroom), delta)
+
+    def add(self, slot_key, booking):
+        """计入一条预约（同一 slot_key 重复计入时先回退旧记录）"""
+        self.remove(slot_key)
+        date_str, time_slot, classroom = parse_slot_key(slot_key, booking)
+        try:
+            weekday = datetime.date.fromisoformat(date_str).weekday()
+        except ValueError:
+            weekday = None
+        entry = (date_str, time_slot, classroom, booking.get('class', ''), _headcount(booking), weekday)
+        self._entries[slot_key] = entry
+        self._apply(entry, 1)
+
+    def remove(self, slot_key):
+        """回退一条预约"""
+        entry = self._entries.pop(slot_key, None)
+        if entry is not None:
+            self._apply(entry, -1)
+
+    def clear(self):
+        self.__init__()
+
+    def snapshot(self, other=None):
+        """只读副本（可与另一份统计合并）；复制的是计数器，与历史数据量无关"""
+        result = BookingStats()
+        for stats in (self, other):
+            if stats is None:
+                continue
+            result.total += stats.total
+            result.headcount += stats.headcount
+            for name in ('classroom_counts', 'date_counts', 'slot_counts', 'club_counts',
+                         'club_headcounts', 'weekday_classroom_counts'):
+                counter = getattr(result, name)
+                for key, value in getattr(stats, name).items():
+                    _bump(counter, key, value)
+        return result
+
+    def weekday_utilization(self, slots_per_weekday):
+        """各跳台按星期的利用率 {(星期, 跳台): 已预约时段 / 可预约时段}
+
+        slots_per_weekday 为周一到周日每天开放的时段数；可预约时段按统计范围
+        （最早到最晚的预约日期）内该星期出现的天数计算。
+        """
+        dates = []
+        for date_str in self.date_counts:
+            try:
+                dates.append(datetime.date.fromisoformat(date_str))
+            except ValueError:
+                continue
+        if not dates:
+            return {}
+        first, last = min(dates), max(dates)
+        days_per_weekday = [0] * 7
+        for offset in range((last - first).days + 1):
+            days_per_weekday[(first + datetime.timedelta(days=offset)).weekday()] += 1
+        return {
+            (weekday, classroom): count / (days_per_weekday[weekday] * slots_per_weekday[weekday])
+            for (weekday, classroom), count in self.weekday_classroom_counts.items()
+            if slots_per_weekday[weekday]
+        }
+
+_archive_cache = {}  # {归档文件: (文件戳, 预约数据)}，所有分区共用
+_archive_cache_lock = threading.Lock()
+
+# 占用位图文件（每个分区一个）
+OCCUPANCY_FILE = "occupancy.bin"
+
+# 占用位图覆盖的天数：从建立位图的那天起，查询超出范围时以当天为起点重建
+OCCUPANCY_DAYS = 128
+
+class OccupancySnapshot:
+    """占用位图中一段连续日期的只读副本
+
+    cells 为 日期 × 时段 的格子，每格 width 字节，第 i 位表示第 i 个跳台已被预约；
+    blocked 为读取时的屏蔽跳台列表。
+    """
+
+    def __init__(self, start_date, days, time_slots, classrooms, cells, blocked):
+        self.start_date = start_date
+        self.days = days
+        self.time_slots = time_slots
+        self.classrooms = classrooms
+        self.width = (len(classrooms) + 7) // 8
+        self.cells = cells
+        self.blocked = blocked
+        self._slot_pos = {time_slot: i for i, time_slot in enumerate(time_slots)}
+
+    def booked_mask(self, date, time_slot):
+        """指定日期时段的已预约位掩码（不在范围内的日期或时段为 0）"""
+        day = (date - self.start_date).days
+        slot = self._slot_pos.get(time_slot)
+        if slot is None or not 0 <= day < self.days:
+            return 0
+        start = (day * len(self.time_slots) + slot) * self.width
+        return int.from_bytes(self.cells[start:start + self.width], 'little')
+
+    def booked(self, date, time_slot):
+        """指定日期时段已被预约的跳台列表"""
+        mask = self.booked_mask(date, time_slot)
+        return [classroom for i, classroom in enumerate(self.classrooms) if mask >> i & 1]
+
+class OccupancyMap:
+    """内存映射的占用位图：每个 (日期, 时段, 跳台) 一位，另有屏蔽跳台掩码
+
+    可用性查询（哪些跳台可预约、时段是否已满、日程表状态）只需要读这个文件，
+    各进程通过 mmap 共享同一份数据，不解析预约 JSON。文件布局（小端）：
+
+    - 头部（HEADER）：魔数、布局版本、起始日期（date.toordinal()）、天数、时段数、
+      跳台数、位图对应的预约修改计数、屏蔽列表修改计数、屏蔽掩码、名称表长度；
+    - 名称表：时段和跳台名称（JSON），决定每一位的含义；
+    - 位图：按 日期 × 时段 排列的格子，每格 ceil(跳台数 / 8) 字节。
+
+    写入方在跨进程写锁内增量更新位图，更新期间把头部的计数置为 -1；读取方在
+    读取前后比较头部计数与共享的修改计数器，不一致时（位图过期、正在更新或
+    上次更新中断）在写锁内从预约数据重建。重建总是写新文件再替换，其他进程
+    发现文件被替换后重新映射。
+    """
+
+    HEADER = struct.Struct("<4sHHIIHHqqQI")
+    MAGIC = b"BKOC"
+    LAYOUT_VERSION = 1
+    MAX_CLASSROOMS = 64
+
+    def __init__(self, partition, time_slots, classrooms):
+        if len(classrooms) > self.MAX_CLASSROOMS:
+            raise ValueError(f"占用位图最多支持 {self.MAX_CLASSROOMS} 个跳台")
+        self.partition = partition
+        self.path = partition._path(OCCUPANCY_FILE)
+        self.time_slots = list(time_slots)
+        self.classrooms = list(classrooms)
+        self._names = json.dumps({"time_slots": self.time_slots, "classrooms": self.classrooms},
+                                 ensure_ascii=False).encode('utf-8')
+        self._slot_pos = {time_slot: i for i, time_slot in enumerate(self.time_slots)}
+        self._classroom_pos = {classroom: i for i, classroom in enumerate(self.classrooms)}
+        self._width = (len(self.classrooms) + 7) // 8
+        self._row = len(self.time_slots) * self._width
+        self._offset = self.HEADER.size + len(self._names)
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._stamp = None
+
+    def _header(self, mm):
+        (magic, layout_version, _, base, days, slot_count, classroom_count,
+         data_counter, blocked_counter, blocked_mask, names_len) = self.HEADER.unpack_from(mm, 0)
+        return base, days, data_counter, blocked_counter, blocked_mask
+
+    def _update_header(self, mm, data_counter=None, blocked=None):
+        """改写头部的预约计数，或屏蔽列表计数和屏蔽掩码 (计数, 掩码)"""
+        fields = list(self.HEADER.unpack_from(mm, 0))
+        if data_counter is not None:
+            fields[7] = data_counter
+        if blocked is not None:
+            fields[8], fields[9] = blocked
+        self.HEADER.pack_into(mm, 0, *fields)
+
+    @classmethod
+    def open_existing(cls, partition):
+        """按文件中的名称表打开已有的位图，文件不存在或无法识别时返回 None"""
+        path = partition._path(OCCUPANCY_FILE)
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(cls.HEADER.size)
+                magic, layout_version = cls.HEADER.unpack(header)[:2]
+                names_len = cls.HEADER.unpack(header)[-1]
+                if magic != cls.MAGIC or layout_version != cls.LAYOUT_VERSION:
+                    return None
+                names = json.loads(f.read(names_len).decode('utf-8'))
+        except (OSError, ValueError, struct.error):
+            return None
+        return cls(partition, names["time_slots"], names["classrooms"])
+
+    def _current(self):
+        """当前文件的映射；文件被替换后重新映射，文件不存在或布局不同时返回 None（需持有 _lock）"""
+        stamp = _file_stamp(self.path)
+        if stamp != self._stamp or self._mmap is None:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._stamp = stamp
+            if stamp is None:
+                return None
+            with open(self.path, 'r+b') as f:
+                try:
+                    mm = mmap.mmap(f.fileno(), 0)
+                except ValueError:  # 空文件
+                    return None
+            if not self._compatible(mm):
+                mm.close()
+                return None
+            self._mmap = mm
+        return self._mmap
+
+    def _compatible(self, mm):
+        """文件是否与本对象的布局（时段、跳台名称）一致"""
+        if len(mm) < self._offset:
+            return False
+        magic, layout_version, _, base, days, slot_count, classroom_count, _, _, _, names_len = self.HEADER.unpack_from(mm, 0)
+        return (
+            magic == self.MAGIC and layout_version == self.LAYOUT_VERSION
+            and names_len == len(self._names) and mm[self.HEADER.size:self._offset] == self._names
+            and len(mm) >= self._offset + days * self._row
+        )
+
+    def _mask(self, classrooms):
+        return sum(1 << self._classroom_pos[c] for c in classrooms if c in self._classroom_pos)
+
+    def _set_bit(self, mm, base, days, slot_key, booking, value):
+        """设置一条预约对应的位（范围外的日期、未知的时段和跳台忽略）"""
+        date_str, time_slot, classroom = parse_slot_key(slot_key, booking or {})
+        slot = self._slot_pos.get(time_slot)
+        pos = self._classroom_pos.get(classroom)
+        if slot is None or pos is None:
+            return
+        try:
+            day = datetime.date.fromisoformat(date_str).toordinal() - base
+        except ValueError:
+            return
+        if not 0 <= day < days:
+            return
+        index = self._offset + day * self._row + slot * self._width + pos // 8
+        if value:
+            mm[index] |= 1 << (pos % 8)
+        else:
+            mm[index] &= ~(1 << (pos % 8)) & 0xFF
+
+    def _rebuild(self, base_date):
+        """从预约数据和屏蔽列表重建位图文件（写新文件再替换；调用方需持有两个写锁）"""
+        partition = self.partition
+        storage = partition.storage
+        base = base_date.toordinal()
+        days = OCCUPANCY_DAYS
+        buffer = bytearray(self._offset + days * self._row)
+        self.HEADER.pack_into(
+            buffer, 0, self.MAGIC, self.LAYOUT_VERSION, 0, base, days,
+            len(self.time_slots), len(self.classrooms), storage.change_count(),
+            partition._blocked_counter.read(), self._mask(partition.load_blocked_classrooms()), len(self._names)
+        )
+        buffer[self.HEADER.size:self._offset] = self._names
+        end_date = datetime.date.fromordinal(base + days - 1).strftime('%Y-%m-%d')
+        for slot_key, booking in storage.load(base_date.strftime('%Y-%m-%d'), end_date).items():
+            self._set_bit(buffer, base, days, slot_key, booking, True)
+        
+        tmp_file = self.path + '.tmp'
+        metrics.count_io("write")
+        with open(tmp_file, 'wb') as f:
+            f.write(buffer)
+        os.replace(tmp_file, self.path)
+
+    def _try_read(self, start_date, days):
+        """位图与数据一致且覆盖所需日期时返回 OccupancySnapshot，否则返回 None"""
+        with self._lock:
+            mm = self._current()
+            if mm is None:
+                return None
+            header = self._header(mm)
+            base, map_days, data_counter, blocked_counter, blocked_mask = header
+            day = start_date.toordinal() - base
+            if day < 0 or day + days > map_days:
+                return None
+            start = self._offset + day * self._row
+            cells = mm[start:start + days * self._row]
+            # 读取前后头部不变且与共享计数器一致，才说明读到的是完整、最新的位图
+            if (self._header(mm) != header or data_counter != self.partition.storage.change_count()
+                    or blocked_counter != self.partition._blocked_counter.read()):
+                return None
+        blocked = [c for i, c in enumerate(self.classrooms) if blocked_mask >> i & 1]
+        return OccupancySnapshot(start_date, days, self.time_slots, self.classrooms, cells, blocked)
+
+    def read(self, start_date, days=1):
+        """读取从 start_date 起 days 天的占用情况，返回 OccupancySnapshot
+
+        位图与数据一致时只读映射；不一致或日期超出位图范围时在写锁内重建后再读。
+        """
+        if days > OCCUPANCY_DAYS:
+            raise ValueError(f"一次最多读取 {OCCUPANCY_DAYS} 天")
+        snapshot = self._try_read(start_date, days)
+        if snapshot is not None:
+            return snapshot
+        partition = self.partition
+        with partition.storage.locked(), partition._blocked_write_lock:
+            # 等锁期间其他进程可能已经重建
+            snapshot = self._try_read(start_date, days)
+            if snapshot is None:
+                # 以今天（或更早的查询起点）为起点，覆盖之后的可预约范围
+                base_date = min(start_date, datetime.date.today())
+                if (start_date - base_date).days + days > OCCUPANCY_DAYS:
+                    base_date = start_date
+                self._rebuild(base_date)
+                snapshot = self._try_read(start_date, days)
+        return snapshot
+
+    def apply(self, counter_before, counter_after, added=(), removed=(), clear=False):
+        """本进程写入预约后增量更新位图（调用方需持有预约数据的写锁）
+
+        added 为 {slot_key: 预约信息}，removed 为 slot_key 列表。位图在写入前已过期
+        （头部计数不等于 counter_before）时不做修改，留给读取方重建。
+        """
+        with self._lock:
+            mm = self._current()
+            if mm is None:
+                return
+            base, days, data_counter, _, _ = self._header(mm)
+            if data_counter != counter_before:
+                return
+            self._update_header(mm, data_counter=-1)
+            if clear:
+                mm[self._offset:self._offset + days * self._row] = bytes(days * self._row)
+            for slot_key in removed:
+                self._set_bit(mm, base, days, slot_key, None, False)
+            for slot_key, booking in dict(added).items():
+                self._set_bit(mm, base, days, slot_key, booking, True)
+            self._update_header(mm, data_counter=counter_after)
+
+    def apply_blocked(self, counter_before, counter_after, blocked):
+        """本进程修改屏蔽列表后更新屏蔽掩码（调用方需持有屏蔽列表的写锁）"""
+        with self._lock:
+            mm = self._current()
+            if mm is None:
+                return
+            _, _, _, blocked_counter, _ = self._header(mm)
+            if blocked_counter != counter_before:
+                return
+            self._update_header(mm, blocked=(-1, self._mask(blocked)))
+            self._update_header(mm, blocked=(counter_after, self._mask(blocked)))
+
+# 组提交：写入线程取到请求时队列中还有其他请求（即正在集中提交），再等待这么久（秒）
+# 收集同时到达的请求，合并为一次写入；单个请求不等待
+GROUP_COMMIT_WINDOW = 0.003
+
+# 每批最多合并的请求数
+GROUP_COMMIT_MAX = 128
+
+class _WriteRequest:
+    """一个写入请求：op 为 "reserve"（payload 为 {slot_key: 预约信息}）、"delete"（slot_key 列表）或 "clear"，
+    结果通过 future 返回；io 为写入线程处理这批请求时的读写次数（见 metrics.collect_io）"""
+
+    __slots__ = ("op", "payload", "future", "io")
+
+    def __init__(self, op, payload=None):
+        self.op = op
+        self.payload = payload
+        self.future = Future()
+        self.io = None
+
+class CommitQueue:
+    """单写入线程的提交队列（每个分区一个）
+
+    进程内所有会话的预约、取消都提交到这里，由一个写入线程按到达顺序处理：
+    取出队列中已有的请求，有多个时再收集 GROUP_COMMIT_WINDOW 秒内到达的请求，整批
+    交给 commit（在写锁内检查冲突并只做一次持久写入），再把每个请求的结果返回给
+    提交它的会话。开放新一天时大量俱乐部同时提交，也只需少量几次写入。
+    """
+
+    def __init__(self, commit, name):
+        self._commit = commit
+        self._name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._requests = None
+        self._thread = None
+
+    def _ensure_thread(self):
+        """返回请求队列，写入线程未运行时启动（fork 出的子进程中没有父进程的线程，重新创建）"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._requests = queue.SimpleQueue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(self._requests,), name=self._name, daemon=True)
+                self._thread.start()
+            return self._requests
+
+    def submit(self, op, payload=None):
+        """提交一个写入请求并等待结果"""
+        request = _WriteRequest(op, payload)
+        self._ensure_thread().put(request)
+        result = request.future.result()
+        # 读写发生在写入线程上，计入提交请求的这次运行（同一批的请求共享这次写入，各自计入）
+        metrics.add_run_io(request.io)
+        return result
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX:
+                # 只有一个请求时立即写入，已有多个时等到 deadline
+                timeout = max(deadline - time.monotonic(), 0) if len(batch) > 1 else 0
+                try:
+                    batch.append(requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            with metrics.collect_io() as io:
+                # 在设置结果前关联计数：commit 设置结果时这批的读写已全部完成
+                for request in batch:
+                    request.io = io
+                try:
+                    self._commit(batch)
+                except BaseException as error:
+                    for request in batch:
+                        if not request.future.done():
+                            request.future.set_exception(error)
+
+class Partition:
+    """一个数据分区（一个场地）：预约数据、统计、历史归档和屏蔽列表
+
+    分区内的所有文件都位于 directory 下；directory 为空时使用当前目录，
+    即单场地部署原有的 bookings.json、blocked_classrooms.json 和 archive/。
+    各分区的写锁、修改计数器和缓存互相独立，页面只加载当前场地的分区。
+    """
+
+    def __init__(self, directory=""):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        json_storage = JsonStorage(self._path(DATA_FILE), self._path(JOURNAL_FILE))
+        if STORAGE_BACKEND == "sqlite":
+            self.storage = SqliteStorage(self._path(SQLITE_FILE), import_from=json_storage)
+        elif STORAGE_BACKEND == "json":
+            self.storage = json_storage
+        else:
+            raise ValueError(f"未知的存储后端：{STORAGE_BACKEND}")
+        self.archive_dir = self._path(ARCHIVE_DIR)
+        self.blocked_file = self._path(BLOCKED_CLASSROOMS_FILE)
+        
+        self._stats = None
+        self._stats_version = None
+        self._stats_lock = threading.RLock()
+        self._archive_stats = None
+        self._archive_stats_version = None
+        self._archive_lock = threading.Lock()
+        self._last_archive_day = None
+        self._phone_index = None
+        self._phone_index_version = None
+        self._phone_lock = threading.Lock()
+        self._occupancy = None
+        self._occupancy_lock = threading.Lock()
+        self._writer = CommitQueue(self._commit_batch, f"booking-writer:{directory or '.'}")
+        self._blocked_cache = _StampedCache()
+        self._blocked_lock = threading.Lock()
+        self._blocked_write_lock = _FileLock(self.blocked_file + '.lock')
+        self._blocked_counter = _ChangeCounter(self.blocked_file + '.version')
+
+    def _path(self, name):
+        return os.path.join(self.directory, name) if self.directory else name
+
+    def get_data_version(self):
+        """当前预约数据的版本，可作为派生数据的缓存键"""
+        return self.storage.version()
+
+    def load_bookings(self, start_date=None, end_date=None, include_archive=False):
+        """加载预约数据，可按日期范围（含两端，'%Y-%m-%d'）过滤
+
+        默认只读取热数据（今天及以后）；include_archive=True 时同时读取范围内的历史归档。
+        """
+        bookings = self.storage.load(start_date, end_date)
+        if include_archive:
+            archived = self.load_archived_bookings(start_date, end_date)
+            # 归档与热数据重叠时（归档过程中断）以热数据为准
+            archived.update(bookings)
+            bookings = archived
+        return bookings
+
+    def iter_bookings(self, start_date=None, end_date=None, include_archive=False):
+        """按 slot_key 顺序逐条生成 (slot_key, 预约信息)，范围同 load_bookings
+
+        历史归档逐月读取、读完即释放（不放入归档缓存），遍历多年的归档时内存占用
+        也只有一个月的数据，适合导出。
+        """
+        bookings = self.storage.load(start_date, end_date)
+        if include_archive:
+            for month in self.list_archive_months():
+                if (start_date is not None and month < start_date[:7]) or (end_date is not None and month > end_date[:7]):
+                    continue
+                archived = self._read_archive(month, cache=False)
+                for slot_key in sorted(archived):
+                    # 归档与热数据重叠时（归档过程中断）以热数据为准
+                    if _in_range(slot_key, start_date, end_date) and slot_key not in bookings:
+                        yield slot_key, archived[slot_key]
+        for slot_key in sorted(bookings):
+            yield slot_key, bookings[slot_key]
+
+    def save_bookings(self, bookings):
+        """整体保存预约数据"""
+        self.storage.save(bookings)
+
+    # 预约、删除、清空都提交给本分区的写入线程（见 CommitQueue），同时到达的请求合并为一次写入
+
+    def _submit(self, op, payload=None):
+        """提交写入请求并等待结果；当前线程已持有写锁时（如归档过程中）直接写入，不等待写入线程"""
+        if self.storage.locked().held_by_current_thread():
+            request = _WriteRequest(op, payload)
+            self._commit_batch([request])
+            return request.future.result()
+        return self._writer.submit(op, payload)
+
+    def reserve_booking(self, slot_key, booking):
+        """预约跳台，成功返回 True，已被他人预约返回 False"""
+        return not self._submit("reserve", self.storage.records({slot_key: booking}))
+
+    def reserve_bookings(self, bookings):
+        """一次预约多个跳台 {slot_key: 预约信息}，全部成功或全部不写入
+
+        全部成功时返回空列表；任何一个已被预约时返回已被预约的 slot_key 列表。
+        """
+        if not bookings:
+            return []
+        # 在提交前转换：格式错误的预约在调用方线程中出错，不会进入写入批次
+        return self._submit("reserve", self.storage.records(bookings))
+
+    def delete_booking(self, slot_key):
+        """删除一条预约"""
+        self._submit("delete", [slot_key])
+
+    def delete_bookings(self, slot_keys):
+        """批量删除预约，一次写入"""
+        if not slot_keys:
+            return
+        self._submit("delete", list(slot_keys))
+
+    def clear_bookings(self):
+        """清空所有预约"""
+        self._submit("clear")
+
+    def _commit_batch(self, requests):
+        """在写锁内按到达顺序处理一批写入请求，合并为一次持久写入，再逐个设置结果
+
+        预约请求与已有数据或同一批中更早的请求冲突时，该请求整体不写入，结果为
+        冲突的 slot_key 列表。写锁内读取写入前的版本：期间其他进程无法写入，写入前
+        版本与统计、占用位图一致时即可安全地增量更新它们。
+        """
+        storage = self.storage
+        with storage.locked(), self._stats_lock:
+            version_before = storage.version()
+            # 一次查出这批请求涉及的 slot_key 中已有的预约
+            existing = storage.existing({
+                slot_key for request in requests if request.op in ("reserve", "delete") for slot_key in request.payload
+            })
+            changes = {}    # {slot_key: 这批写入后是否存在}
+            added = {}      # 这批写入后存在的新预约 {slot_key: 预约信息}
+            cleared = False
+            entries = []
+            results = []
+            for request in requests:
+                result = None
+                if request.op == "reserve":
+                    result = [k for k in request.payload if changes.get(k, not cleared and k in existing)]
+                    if not result:
+                        entries.append({'op': 'create_many', 'bookings': request.payload})
+                        changes.update(dict.fromkeys(request.payload, True))
+                        added.update(request.payload)
+                elif request.op == "delete":
+                    entries.append({'op': 'delete_many', 'keys': request.payload})
+                    changes.update(dict.fromkeys(request.payload, False))
+                    for k in request.payload:
+                        added.pop(k, None)
+                elif request.op == "clear":
+                    entries.append({'op': 'clear'})
+                    changes.clear()
+                    added.clear()
+                    cleared = True
+                results.append(result)
+            
+            if entries:
+                removed = [] if cleared else [k for k, present in changes.items() if not present and k in existing]
+                try:
+                    storage.commit(entries)
+                except sqlite3.IntegrityError:
+                    # 与旧格式 slot_key 的预约冲突（slot_key 不同而日期、时段、跳台相同）：
+                    # 逐个请求单独写入，统计和占用位图留待下次读取时重建
+                    results = [self._commit_single(request) for request in requests]
+                    self._stats_version = None
+                else:
+                    def change(stats):
+                        if cleared:
+                            stats.clear()
+                        for k in removed:
+                            stats.remove(k)
+                        for k, v in added.items():
+                            stats.add(k, v)
+                    self._apply_stats_change(version_before, change)
+                    self._apply_occupancy_change(version_before, added=added, removed=removed, clear=cleared)
+        
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
+
+    def _commit_single(self, request):
+        """不合并地写入一个请求（调用方需持有写锁）"""
+        if request.op == "reserve":
+            return self.storage.reserve_many(request.payload)
+        if request.op == "delete":
+            self.storage.delete_many(request.payload)
+        elif request.op == "clear":
+            self.storage.clear()
+        return None
+
+    def _apply_stats_change(self, version_before, change):
+        """本进程写入后增量更新统计；写入前统计已过期时留待下次读取时重建"""
+        if self._stats is not None and self._stats_version == version_before:
+            change(self._stats)
+            self._stats_version = self.get_data_version()
+        else:
+            self._stats_version = None
+
+    def occupancy(self, time_slots, classrooms):
+        """本分区按指定时段、跳台布局的占用位图（布局与文件不同时，首次读取时重建）"""
+        with self._occupancy_lock:
+            occupancy = self._occupancy
+            if occupancy is None or occupancy.time_slots != list(time_slots) or occupancy.classrooms != list(classrooms):
+                occupancy = self._occupancy = OccupancyMap(self, time_slots, classrooms)
+            return occupancy
+
+    def _existing_occupancy(self):
+        """写入时需要同步的位图：本进程已打开的，或其他进程建立的文件"""
+        with self._occupancy_lock:
+            if self._occupancy is None:
+                self._occupancy = OccupancyMap.open_existing(self)
+            return self._occupancy
+
+    def _apply_occupancy_change(self, version_before, added=(), removed=(), clear=False):
+        """本进程写入后增量更新占用位图（调用方需持有写锁）"""
+        occupancy = self._existing_occupancy()
+        if occupancy is not None:
+            occupancy.apply(version_before[0], self.storage.change_count(), added, removed, clear)
+
+    def get_booking_stats(self, include_archive=False):
+        """预约统计（热数据，可选合并历史归档），返回只读副本
+
+        统计在数据加载时构建一次，之后随本进程的写入增量更新；其他进程改动数据时重建。
+        """
+        storage = self.storage
+        with self._stats_lock:
+            fresh = self._stats is not None and self._stats_version == storage.version()
+        if not fresh:
+            # 与写入方法相同的加锁顺序（先写锁再统计锁），重建期间数据不会被改动
+            with storage.locked(), self._stats_lock:
+                version = storage.version()
+                if self._stats is None or self._stats_version != version:
+                    self._stats = BookingStats(storage.load())
+                    self._stats_version = version
+        with self._stats_lock:
+            if not include_archive:
+                return self._stats.snapshot()
+            archive_version = self.get_archive_version()
+            if self._archive_stats is None or self._archive_stats_version != archive_version:
+                self._archive_stats = BookingStats(self.load_archived_bookings())
+                self._archive_stats_version = archive_version
+            return self._stats.snapshot(self._archive_stats)
+
+    def _archive_file(self, month):
+        return os.path.join(self.archive_dir, f"bookings-{month}.json.gz")
+
+    def list_archive_months(self):
+        """已有归档的月份列表（'YYYY-MM'，升序）"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        months = []
+        for name in os.listdir(self.archive_dir):
+            if name.startswith("bookings-") and name.endswith(".json.gz"):
+                months.append(name[len("bookings-"):-len(".json.gz")])
+        return sorted(months)
+
+    def get_archive_version(self):
+        """归档版本：归档文件总是整体替换，目录的修改时间随之变化"""
+        return _file_stamp(self.archive_dir)
+
+    def _read_archive(self, month, cache=True):
+        """读取一个月的归档（文件未变化时直接使用缓存；cache=False 时读取结果不放入缓存）"""
+        path = self._archive_file(month)
+        stamp = _file_stamp(path)
+        with _archive_cache_lock:
+            cached = _archive_cache.get(path)
+            if cached is not None and stamp is not None and cached[0] == stamp:
+                return cached[1]
+        if stamp is None:
+            return {}
+        metrics.count_io("read")
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            bookings = decode_bookings(json.load(f), CustomerTable())
+        if cache:
+            with _archive_cache_lock:
+                _archive_cache[path] = (stamp, bookings)
+        return bookings
+
+    def _write_archive(self, month, bookings):
+        """整体写入一个月的归档（先写临时文件再替换）"""
+        path = self._archive_file(month)
+        tmp_file = path + '.tmp'
+        metrics.count_io("write")
+        with gzip.open(tmp_file, 'wt', encoding='utf-8') as f:
+            json.dump(encode_bookings(bookings), f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+
+    def load_archived_bookings(self, start_date=None, end_date=None):
+        """按日期范围读取历史归档，只打开范围涉及的月份"""
+        result = {}
+        for month in self.list_archive_months():
+            if (start_date is not None and month < start_date[:7]) or (end_date is not None and month > end_date[:7]):
+                continue
+            for slot_key, booking in self._read_archive(month).items():
+                if _in_range(slot_key, start_date, end_date):
+                    result[slot_key] = booking
+        return result
+
+    def archive_bookings_before(self, cutoff_date):
+        """将 cutoff_date（'%Y-%m-%d'，不含）之前的预约移入按月归档，返回归档条数
+
+        先写归档再从热数据中删除：中途崩溃时预约可能同时存在于两处，但不会丢失。
+        整个过程持有写锁，多个进程同一天启动时只有第一个真正执行归档。
+        """
+        storage = self.storage
+        previous_day = (datetime.date.fromisoformat(cutoff_date) - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        with storage.locked():
+            expired = storage.load(None, previous_day)
+            if not expired:
+                return 0
+            
+            by_month = {}
+            for slot_key, booking in expired.items():
+                by_month.setdefault(slot_key[:7], {})[slot_key] = booking
+            
+            os.makedirs(self.archive_dir, exist_ok=True)
+            for month, bookings in by_month.items():
+                merged = dict(self._read_archive(month))
+                merged.update(bookings)
+                self._write_archive(month, merged)
+            
+            self.delete_bookings(list(expired))
+            storage.compact()
+        return len(expired)
+
+    def migrate(self):
+        """将本分区的数据文件重写为 DATA_FORMAT 格式，返回 {文件: (原大小, 新大小)}
+
+        JSON 快照与日志合并为新格式的快照，历史归档逐月重写。旧格式在读取时
+        本来就会转换，迁移只是立即重写文件；重复执行结果不变。
+        """
+        sizes = {}
+        storage = self.storage
+        with storage.locked():
+            if isinstance(storage, JsonStorage):
+                before = sum(os.path.getsize(path) for path in (storage.data_file, storage.journal_file) if os.path.exists(path))
+                storage.compact()
+                sizes[storage.data_file] = (before, os.path.getsize(storage.data_file))
+            for month in self.list_archive_months():
+                path = self._archive_file(month)
+                before = os.path.getsize(path)
+                self._write_archive(month, self._read_archive(month))
+                sizes[path] = (before, os.path.getsize(path))
+        return sizes
+
+    def find_bookings_by_phone(self, phone):
+        """按电话查找今天及以后的预约 {slot_key: 预约信息}
+
+        电话索引在数据版本变化后的第一次查询时构建一次，之后每次查询只是一次字典查找。
+        """
+        with self._phone_lock:
+            version = self.get_data_version()
+            if self._phone_index_version != version:
+                bookings = self.storage.load()
+                index = {}
+                for slot_key, booking in bookings.items():
+                    index.setdefault(booking.get('phone'), []).append(slot_key)
+                self._phone_index = (bookings, index)
+                self._phone_index_version = version
+            bookings, index = self._phone_index
+        return {slot_key: bookings[slot_key] for slot_key in index.get(phone, [])}
+
+    def archive_past_bookings(self, today=None):
+        """每天第一次调用时归档今天之前的预约（同一进程内当天后续调用直接返回）"""
+        today = today or datetime.date.today()
+        with self._archive_lock:
+            if self._last_archive_day == today:
+                return 0
+            self._last_archive_day = today
+        return self.archive_bookings_before(today.strftime('%Y-%m-%d'))
+
+    def get_blocked_version(self):
+        """屏蔽列表的版本：任一进程修改屏蔽列表后一定不同"""
+        return (self._blocked_counter.read(), _file_stamp(self.blocked_file))
+
+    def load_blocked_classrooms(self):
+        """加载被屏蔽的跳台列表（未被修改过时直接使用缓存）"""
+        with self._blocked_lock:
+            stamp = self.get_blocked_version()
+            cached = self._blocked_cache.get(stamp, None)
+            if cached is not None:
+                return list(cached)
+            blocked = []
+            if stamp[1] is not None:
+                metrics.count_io("read")
+                try:
+                    with open(self.blocked_file, 'r', encoding='utf-8') as f:
+                        blocked = json.load(f)
+                except (OSError, ValueError) as error:
+                    raise DataFileError(f"无法读取屏蔽跳台文件 {self.blocked_file}：{error}") from error
+            self._blocked_cache.put(stamp, None, blocked)
+            return list(blocked)
+
+    def save_blocked_classrooms(self, blocked_classrooms):
+        """保存被屏蔽的跳台列表（先写临时文件再替换，其他进程不会读到写了一半的文件）"""
+        with self._blocked_write_lock:
+            counter_before = self._blocked_counter.read()
+            tmp_file = self.blocked_file + '.tmp'
+            metrics.count_io("write")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(blocked_classrooms, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.blocked_file)
+            counter_after = self._blocked_counter.bump()
+            with self._blocked_lock:
+                self._blocked_cache.invalidate()
+            occupancy = self._existing_occupancy()
+            if occupancy is not None:
+                occupancy.apply_blocked(counter_before, counter_after, blocked_classrooms)
+
+    def set_classroom_blocked(self, classroom, blocked=True):
+        """屏蔽（blocked=True）或启用一个跳台，读取、修改、保存在同一个写锁内完成，返回新的屏蔽列表"""
+        with self._blocked_write_lock:
+            blocked_classrooms = self.load_blocked_classrooms()
+            if blocked and classroom not in blocked_classrooms:
+                blocked_classrooms.append(classroom)
+            elif not blocked and classroom in blocked_classrooms:
+                blocked_classrooms.remove(classroom)
+            else:
+                return blocked_classrooms
+            self.save_blocked_classrooms(blocked_classrooms)
+            return blocked_classrooms
+
+_partitions = {}
+_partitions_lock = threading.Lock()
+
+def get_partition(directory=""):
+    """获取数据分区（每个目录在进程内只创建一次）"""
+    with _partitions_lock:
+        partition = _partitions.get(directory)
+        if partition is None:
+            partition = _partitions[directory] = Partition(directory)
+        return partition
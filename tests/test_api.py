@@ -0,0 +1,175 @@
+"""HTTP 接口测试（进程内客户端，需要安装 pytest 和 httpx）
+
+    python -m pytest tests
+
+每个测试使用临时目录中的一个新场地，互不影响。
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from starlette.testclient import TestClient
+
+import api
+import core
+import storage
+
+BOOKER = {"name": "张三", "student_id": "1234", "class": "丹翔", "phone": "13800000000", "reason": "5"}
+
+ADMIN = {"X-Admin-Password": core.ADMIN_PASSWORD}
+
+@pytest.fixture
+def venue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    venue = core.Venue("test", "测试场地", core.CLASSROOMS, {"全天": core.TIME_SLOTS}, data_dir=str(tmp_path / "data"))
+    monkeypatch.setattr(core, "VENUES", {venue.id: venue})
+    monkeypatch.setattr(api, "VENUES", core.VENUES)
+    return venue
+
+@pytest.fixture
+def client(venue):
+    return TestClient(api.app)
+
+def target(venue, day=0, slot=0, classroom=0):
+    date = venue.bookable_dates()[day]
+    return {"date": date.strftime('%Y-%m-%d'), "time_slot": venue.time_slots_for(date)[slot], "classroom": venue.classrooms[classroom]}
+
+def slot_key(item):
+    return core.make_slot_key(item["date"], item["time_slot"], item["classroom"])
+
+def post(client, *targets, **extra):
+    return client.post("/bookings", json={**BOOKER, "targets": list(targets), **extra})
+
+def available(client, item):
+    day = client.get("/availability").json()["availability"]
+    return item["classroom"] in day[item["date"]][item["time_slot"]]
+
+def test_create_booking(client, venue):
+    item = target(venue)
+    response = post(client, item)
+    assert response.status_code == 201
+    assert response.json() == {"venue": "test", "booked": [slot_key(item)]}
+    assert venue.store.load_bookings()[slot_key(item)]["name"] == "张三"
+    assert not available(client, item)
+
+def test_conflict_books_nothing(client, venue):
+    taken, free = target(venue, classroom=0), target(venue, classroom=1)
+    assert post(client, taken).status_code == 201
+    response = post(client, free, taken, name="李四")
+    assert response.status_code == 409
+    assert response.json()["conflicts"] == [taken]
+    assert slot_key(free) not in venue.store.load_bookings()
+    assert available(client, free)
+
+def test_recurrence_all_or_nothing(client, venue):
+    slot, classroom = venue.time_slots_for(venue.bookable_dates()[0])[0], venue.classrooms[0]
+    recurrence = {"weekdays": list(range(7)), "time_slots": [slot], "classrooms": [classroom]}
+    expanded = core.expand_recurrence(venue, venue.bookable_dates(), range(7), [slot], [classroom])
+
+    taken = target(venue, day=3)
+    assert post(client, taken, name="李四").status_code == 201
+    response = post(client, recurrence=recurrence)
+    assert response.status_code == 409
+    assert response.json()["conflicts"] == [taken]
+    assert list(venue.store.load_bookings()) == [slot_key(taken)]
+
+    assert client.delete(f"/bookings/{slot_key(taken)}", headers=ADMIN).status_code == 200
+    response = post(client, recurrence=recurrence)
+    assert response.status_code == 201
+    assert response.json()["booked"] == [core.make_slot_key(*item) for item in expanded]
+
+def test_invalid_requests(client, venue):
+    item = target(venue)
+    assert post(client, item, name="").status_code == 400
+    assert post(client).status_code == 400
+    outside = dict(item, date="2000-01-01")
+    assert post(client, outside).status_code == 400
+    assert client.post("/bookings", content=b"not json").status_code == 400
+
+    assert client.put(f"/blocked/{item['classroom']}", headers=ADMIN).status_code == 200
+    response = post(client, item)
+    assert response.status_code == 400
+    assert "屏蔽" in response.json()["error"]
+    assert venue.store.load_bookings() == {}
+
+@pytest.mark.parametrize("payload", [
+    {"name": ["x"]},
+    {"phone": 13800000000},
+    {"reason": {"人数": 5}},
+    {"targets": [{"date": ["2000-01-01"], "time_slot": "上午第一节", "classroom": "6m"}]},
+    {"targets": "all"},
+    {"recurrence": {"weekdays": ["周六"], "time_slots": ["上午第一节"], "classrooms": ["6m"]}},
+    {"recurrence": {"weekdays": [5], "time_slots": [["上午第一节"]], "classrooms": ["6m"]}},
+])
+def test_malformed_types_rejected(client, venue, payload):
+    body = {**BOOKER, "targets": [target(venue)], **payload}
+    assert client.post("/bookings", json=body).status_code == 400
+    # 没有写入任何数据，之后的读取和预约都正常
+    assert not os.path.exists(os.path.join(venue.data_dir, storage.JOURNAL_FILE))
+    assert client.get("/availability").status_code == 200
+    assert post(client, target(venue)).status_code == 201
+
+def test_admin_required(client, venue):
+    item = target(venue)
+    post(client, item)
+    wrong = {"X-Admin-Password": "wrong"}
+    assert client.delete(f"/bookings/{slot_key(item)}").status_code == 401
+    assert client.delete(f"/bookings/{slot_key(item)}", headers=wrong).status_code == 401
+    assert client.put(f"/blocked/{item['classroom']}", headers=wrong).status_code == 401
+    assert client.get("/export", headers=wrong).status_code == 401
+    assert slot_key(item) in venue.store.load_bookings()
+
+def test_not_found(client, venue):
+    assert client.get("/availability", params={"venue": "missing"}).status_code == 404
+    assert client.post("/bookings", json={**BOOKER, "venue": "missing", "targets": [target(venue)]}).status_code == 404
+    assert client.delete("/bookings/2000-01-01_上午第一节_6m", headers=ADMIN).status_code == 404
+    assert client.put("/blocked/99m", headers=ADMIN).status_code == 404
+
+def test_cancel_frees_slot(client, venue):
+    item = target(venue)
+    post(client, item)
+    response = client.delete(f"/bookings/{slot_key(item)}", headers=ADMIN)
+    assert response.status_code == 200
+    assert available(client, item)
+    assert post(client, item, name="李四").status_code == 201
+
+def test_journal_replayed_by_new_partition(client, venue):
+    first, second = target(venue, classroom=0), target(venue, classroom=1)
+    post(client, first, second)
+    client.delete(f"/bookings/{slot_key(first)}", headers=ADMIN)
+    # 新的分区对象（相当于另一个进程）从快照和日志重新加载
+    with open(os.path.join(venue.data_dir, storage.JOURNAL_FILE), encoding='utf-8') as f:
+        assert [json.loads(line)["op"] for line in f] == ["create_many", "delete_many"]
+    bookings = storage.Partition(venue.data_dir).load_bookings()
+    assert list(bookings) == [slot_key(second)]
+    assert bookings[slot_key(second)]["phone"] == BOOKER["phone"]
+
+def test_concurrent_posts_single_winner(client, venue):
+    items = [target(venue, classroom=index % 2) for index in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        codes = list(pool.map(lambda pair: post(client, pair[1], name=f"用户{pair[0]}").status_code, enumerate(items)))
+    assert sorted(codes) == [201, 201] + [409] * 6
+    bookings = storage.Partition(venue.data_dir).load_bookings()
+    assert sorted(bookings) == sorted({slot_key(item) for item in items})
+    assert not any(available(client, item) for item in items)
+
+def test_export_order_and_dates(client, venue):
+    slots = venue.time_slots_for(venue.bookable_dates()[0])
+    # slot_key 的字符串顺序与场地配置的时段、跳台顺序不同
+    items = [target(venue, day=1, slot=0, classroom=0)] + [
+        target(venue, slot=slot, classroom=classroom) for slot in reversed(range(len(slots))) for classroom in (2, 0, 1)
+    ]
+    assert post(client, *items).status_code == 201
+    response = client.get("/export", headers=ADMIN)
+    assert response.status_code == 200
+    rows = [line.split(",")[:3] for line in response.content.decode("utf-8-sig").splitlines()[1:]]
+    expected = sorted(items, key=lambda item: (item["date"], slots.index(item["time_slot"]), venue.classrooms.index(item["classroom"])))
+    assert rows == [[item["date"], item["time_slot"], item["classroom"]] for item in expected]
+
+    first_day = items[1]["date"]
+    response = client.get("/export", headers=ADMIN, params={"start": first_day, "end": first_day})
+    assert len(response.content.decode("utf-8-sig").splitlines()) == 1 + len(items) - 1
+    for bad in ("2025-13-01", "tomorrow", "2025/01/01"):
+        assert client.get("/export", headers=ADMIN, params={"start": bad}).status_code == 400
+        assert client.get("/export", headers=ADMIN, params={"end": bad}).status_code == 400
@@ -0,0 +1,281 @@
+"""存储层测试（JSON 快照 + 日志、合并、格式迁移、占用位图、提交队列、归档、统计）
+
+    python -m pytest tests
+
+每个测试使用临时目录中的一个新分区。
+"""
+import datetime
+import gzip
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import storage
+
+BOOKING = {"name": "张三", "student_id": "1234", "class": "丹翔", "phone": "13800000000", "reason": "5"}
+
+def booking(**changes):
+    return {**BOOKING, **changes}
+
+@pytest.fixture
+def partition(tmp_path):
+    return storage.Partition(str(tmp_path / "data"))
+
+def test_corrupt_snapshot_is_not_overwritten(partition):
+    partition.reserve_booking("2030-01-01_上午第一节_6m", booking())
+    partition.storage.compact()
+    with open(partition.storage.data_file, 'rb') as f:
+        content = f.read()
+    with open(partition.storage.data_file, 'wb') as f:
+        f.write(content[:len(content) // 2])
+    # 换一个分区对象（相当于重启的进程）：读取出错，合并不会用只有日志的数据覆盖快照
+    reopened = storage.Partition(partition.directory)
+    with pytest.raises(storage.DataFileError):
+        reopened.load_bookings()
+    with pytest.raises(storage.DataFileError):
+        reopened.storage.compact()
+    with open(partition.storage.data_file, 'rb') as f:
+        assert f.read() == content[:len(content) // 2]
+
+def test_corrupt_blocked_file_raises(partition):
+    partition.set_classroom_blocked("6m")
+    with open(partition.blocked_file, 'w', encoding='utf-8') as f:
+        f.write('["6m"')
+    with pytest.raises(storage.DataFileError):
+        storage.Partition(partition.directory).load_blocked_classrooms()
+    assert os.path.getsize(partition.blocked_file) == len('["6m"')
+
+def test_compaction_keeps_data_version(partition):
+    today = datetime.date.today()
+    day = today.strftime('%Y-%m-%d')
+    partition.reserve_booking(f"{day}_上午第一节_6m", booking())
+    occupancy = partition.occupancy(["上午第一节"], ["6m", "8m"])
+    assert occupancy.read(today).booked(today, "上午第一节") == ["6m"]
+    partition.get_booking_stats()
+    stats = partition._stats
+    version = partition.get_data_version()
+    bitmap = os.stat(occupancy.path).st_mtime_ns, os.stat(occupancy.path).st_ino
+
+    partition.storage.compact()
+    assert os.path.getsize(partition.storage.journal_file) == 0
+    # 数据没有变化：版本不变，位图不重建，统计不重算
+    assert partition.get_data_version() == version
+    assert occupancy.read(today).booked(today, "上午第一节") == ["6m"]
+    assert (os.stat(occupancy.path).st_mtime_ns, os.stat(occupancy.path).st_ino) == bitmap
+    partition.get_booking_stats()
+    assert partition._stats is stats
+    assert list(storage.Partition(partition.directory).load_bookings()) == [f"{day}_上午第一节_6m"]
+
+def test_journal_replay_after_crash(partition):
+    store = partition.storage
+    partition.reserve_bookings({"2030-01-01_上午第一节_6m": booking(), "2030-01-01_上午第一节_8m": booking()})
+    partition.delete_booking("2030-01-01_上午第一节_6m")
+    expected = {key: dict(value) for key, value in partition.load_bookings().items()}
+    with open(store.journal_file, 'rb') as f:
+        journal = f.read()
+
+    # 合并写完快照、还没清空日志时崩溃：日志在新快照上再重放一次，结果不变
+    store.compact()
+    with open(store.journal_file, 'wb') as f:
+        f.write(journal)
+        # 追加写到一半时崩溃留下的半行
+        f.write('{"op": "create", "key": "2030-01-02'.encode('utf-8'))
+    reopened = storage.Partition(partition.directory)
+    assert {key: dict(value) for key, value in reopened.load_bookings().items()} == expected
+
+    # 半行之后继续追加的记录仍然有效
+    assert reopened.reserve_booking("2030-01-03_上午第一节_6m", booking(name="李四"))
+    bookings = storage.Partition(partition.directory).load_bookings()
+    assert sorted(bookings) == sorted([*expected, "2030-01-03_上午第一节_6m"])
+    assert bookings["2030-01-03_上午第一节_6m"]["name"] == "李四"
+
+def test_background_compaction_keeps_every_booking(partition, monkeypatch):
+    monkeypatch.setattr(storage, "JOURNAL_COMPACT_BYTES", 4096)
+    store = partition.storage
+    keys = [f"2030-01-{day:02d}_{slot}_{classroom}" for day in range(1, 29)
+            for slot in ("上午第一节", "下午第一节") for classroom in ("6m", "8m", "10m")]
+    for index, key in enumerate(keys):
+        assert partition.reserve_booking(key, booking(name=f"用户{index}", phone=str(index)))
+        if index % 7 == 0:
+            partition.delete_booking(keys[index // 2])
+            partition.reserve_booking(keys[index // 2], booking(name=f"用户{index // 2}", phone=str(index // 2)))
+    thread = store._compaction_thread
+    assert thread is not None
+    thread.join()
+    assert os.path.getsize(store.journal_file) < storage.JOURNAL_COMPACT_BYTES
+
+    bookings = storage.Partition(partition.directory).load_bookings()
+    assert sorted(bookings) == sorted(keys)
+    assert all(bookings[key]["phone"] == str(index) for index, key in enumerate(keys))
+
+def test_migrate_format_1_to_2(partition):
+    old = {
+        "2030-01-01_上午第一节_6m": {**booking(), "classroom": "6m", "booking_time": "2029-12-20 10:00:00"},
+        "2030-01-01_上午第一节_8m": {**booking(), "classroom": "8m", "booking_time": "2029-12-20 10:00:05"},
+        "2030-01-02_下午第一节_6m": {**booking(name="李四", phone="139"), "classroom": "6m", "note": "其他字段"},
+        # 更早的旧格式 slot_key（没有跳台），跳台在预约信息中
+        "2030-01-03_上午第二节": {**booking(), "classroom": "10m"},
+    }
+    archived = {"2020-05-01_上午第一节_6m": {**booking(name="王五"), "classroom": "6m"}}
+    with open(partition.storage.data_file, 'w', encoding='utf-8') as f:
+        json.dump(old, f, ensure_ascii=False)
+    os.makedirs(partition.archive_dir)
+    with gzip.open(partition._archive_file("2020-05"), 'wt', encoding='utf-8') as f:
+        json.dump(archived, f, ensure_ascii=False)
+
+    sizes = partition.migrate()
+    assert set(sizes) == {partition.storage.data_file, partition._archive_file("2020-05")}
+    with open(partition.storage.data_file, encoding='utf-8') as f:
+        data = json.load(f)
+    assert data["format"] == storage.DATA_FORMAT
+    assert len(data["customers"]) == 2
+    with gzip.open(partition._archive_file("2020-05"), 'rt', encoding='utf-8') as f:
+        assert json.load(f)["format"] == storage.DATA_FORMAT
+
+    reopened = storage.Partition(partition.directory)
+    assert {key: dict(value) for key, value in reopened.load_bookings().items()} == old
+    assert {key: dict(value) for key, value in reopened.load_archived_bookings().items()} == archived
+    # 重复迁移结果不变
+    with open(partition.storage.data_file, 'rb') as f:
+        content = f.read()
+    reopened.migrate()
+    with open(partition.storage.data_file, 'rb') as f:
+        assert f.read() == content
+
+def bitmap_stamp(occupancy):
+    st = os.stat(occupancy.path)
+    return st.st_ino, st.st_mtime_ns
+
+def test_occupancy_rebuilt_after_external_change(partition):
+    today = datetime.date.today()
+    day = today.strftime('%Y-%m-%d')
+    occupancy = partition.occupancy(["上午第一节", "下午第一节"], ["6m", "8m", "10m"])
+    assert occupancy.read(today).booked(today, "上午第一节") == []
+
+    # 本进程写入：增量更新，不重建
+    partition.reserve_booking(f"{day}_上午第一节_6m", booking())
+    stamp = bitmap_stamp(occupancy)
+    assert occupancy.read(today).booked(today, "上午第一节") == ["6m"]
+    assert bitmap_stamp(occupancy)[0] == stamp[0]
+
+    # 另一个进程写入数据但没有更新位图（例如更新中途退出）：计数器不一致，读取时重建
+    other = storage.Partition(partition.directory)
+    assert not other.storage.reserve_many({f"{day}_下午第一节_10m": booking()})
+    snapshot = occupancy.read(today)
+    assert snapshot.booked(today, "下午第一节") == ["10m"]
+    assert bitmap_stamp(occupancy)[0] != stamp[0]
+
+    # 另一个进程直接改写屏蔽列表：屏蔽计数不一致，读取时重建
+    with open(other.blocked_file, 'w', encoding='utf-8') as f:
+        json.dump(["8m"], f)
+    other._blocked_counter.bump()
+    assert occupancy.read(today).blocked == ["8m"]
+
+    # 本进程修改屏蔽列表：只更新掩码
+    stamp = bitmap_stamp(occupancy)
+    partition.set_classroom_blocked("8m", False)
+    partition.set_classroom_blocked("6m")
+    assert occupancy.read(today).blocked == ["6m"]
+    assert bitmap_stamp(occupancy)[0] == stamp[0]
+
+    # 更新到一半中断（头部计数为 -1）：读取时重建
+    with open(occupancy.path, 'r+b') as f:
+        header = list(storage.OccupancyMap.HEADER.unpack(f.read(storage.OccupancyMap.HEADER.size)))
+        header[7] = -1
+        f.seek(0)
+        f.write(storage.OccupancyMap.HEADER.pack(*header))
+    snapshot = occupancy.read(today)
+    assert snapshot.booked(today, "上午第一节") == ["6m"]
+    assert snapshot.booked(today, "下午第一节") == ["10m"]
+    assert bitmap_stamp(occupancy)[0] != stamp[0]
+
+def test_commit_batch_reserve_after_delete(partition):
+    today = datetime.date.today()
+    key = f"{today:%Y-%m-%d}_上午第一节_6m"
+    occupancy = partition.occupancy(["上午第一节"], ["6m", "8m"])
+    partition.reserve_booking(key, booking())
+    occupancy.read(today)
+    partition.get_booking_stats()
+
+    # 同一批中：取消后重新预约同一跳台成功，之后再预约同一跳台冲突
+    requests = [
+        storage._WriteRequest("delete", [key]),
+        storage._WriteRequest("reserve", partition.storage.records({key: booking(name="李四")})),
+        storage._WriteRequest("reserve", partition.storage.records({key: booking(name="王五")})),
+    ]
+    partition._commit_batch(requests)
+    assert [request.future.result() for request in requests] == [None, [], [key]]
+
+    bookings = storage.Partition(partition.directory).load_bookings()
+    assert list(bookings) == [key] and bookings[key]["name"] == "李四"
+    assert occupancy.read(today).booked(today, "上午第一节") == ["6m"]
+    stats = partition.get_booking_stats()
+    assert stats.total == 1 and stats.club_counts == {"丹翔": 1}
+
+def test_commit_queue_batches_concurrent_requests(partition):
+    keys = [f"2030-01-01_上午第一节_{classroom}" for classroom in ("6m", "8m", "10m")]
+    barrier = threading.Barrier(12)
+    def reserve(index):
+        barrier.wait()
+        return partition.reserve_booking(keys[index % 3], booking(name=f"用户{index}"))
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        results = list(pool.map(reserve, range(12)))
+    assert results.count(True) == 3
+    assert sorted(storage.Partition(partition.directory).load_bookings()) == sorted(keys)
+
+def test_iter_bookings_archive_order(partition):
+    keys = ["2020-01-31_下午第一节_6m", "2020-02-01_上午第一节_8m", "2020-01-31_上午第一节_10m",
+            "2020-02-29_上午第一节_6m", "2020-01-05_上午第一节_6m", "2030-01-01_上午第一节_6m"]
+    for key in keys:
+        partition.reserve_booking(key, booking())
+    assert partition.archive_bookings_before("2020-03-01") == 5
+    assert partition.list_archive_months() == ["2020-01", "2020-02"]
+    assert list(partition.load_bookings()) == ["2030-01-01_上午第一节_6m"]
+
+    assert [key for key, _ in partition.iter_bookings(include_archive=True)] == sorted(keys)
+    assert [key for key, _ in partition.iter_bookings("2020-01-31", "2020-02-01", include_archive=True)] == [
+        "2020-01-31_上午第一节_10m", "2020-01-31_下午第一节_6m", "2020-02-01_上午第一节_8m"]
+    assert [key for key, _ in partition.iter_bookings()] == ["2030-01-01_上午第一节_6m"]
+
+STATS_COUNTERS = ("total", "headcount", "classroom_counts", "date_counts", "slot_counts",
+                  "club_counts", "club_headcounts", "weekday_classroom_counts")
+
+def counters(stats):
+    return {name: getattr(stats, name) for name in STATS_COUNTERS}
+
+def test_incremental_stats_match_recompute(partition):
+    def check():
+        assert counters(partition.get_booking_stats()) == counters(storage.BookingStats(partition.load_bookings()))
+        assert counters(partition.get_booking_stats(include_archive=True)) == counters(
+            storage.BookingStats(partition.load_bookings(include_archive=True)))
+
+    partition.get_booking_stats()
+    partition.reserve_bookings({
+        "2020-01-31_上午第一节_6m": booking(reason="10人"),
+        "2020-02-01_上午第一节_8m": booking(**{"class": "飞跃"}),
+        "2030-01-01_上午第一节_6m": booking(reason="3"),
+        "2030-01-02_下午第一节_10m": booking(**{"class": "飞跃"}, reason="无"),
+    })
+    check()
+    stats = partition._stats
+    partition.delete_booking("2030-01-01_上午第一节_6m")
+    partition.reserve_booking("2030-01-01_上午第一节_6m", booking(**{"class": "飞跃"}, reason="7"))
+    check()
+    # 本进程的写入增量更新同一份统计，没有重建
+    assert partition._stats is stats
+    partition.archive_bookings_before("2025-01-01")
+    check()
+    assert partition.get_booking_stats().total == 2
+    assert partition.get_booking_stats(include_archive=True).total == 4
+
+    partition.clear_bookings()
+    check()
+    partition.reserve_booking("2030-01-03_上午第一节_8m", booking(reason="2"))
+    check()
+    # 另一个进程写入后重建
+    storage.Partition(partition.directory).reserve_booking("2030-01-04_上午第一节_8m", booking())
+    check()
+    assert partition.get_booking_stats().headcount == 7